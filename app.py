@@ -101,6 +101,8 @@ st.markdown("""
     <a href="app" style="text-decoration: none; color: #000000; font-weight: 500;">Home</a>
     <a href="about" style="text-decoration: none; color: #000000; font-weight: 500;">About</a>
     <a href="contact" style="text-decoration: none; color: #000000; font-weight: 500;">Contact</a>
+    <a href="history" style="text-decoration: none; color: #000000; font-weight: 500;">History</a>
+    <a href="herd_dashboard" style="text-decoration: none; color: #000000; font-weight: 500;">Herd</a>
 </div>
 """, unsafe_allow_html=True)
 
@@ -0,0 +1,198 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from preprocessing import decode_image, preprocess_image
+from tflite_backend import BACKENDS
+
+# TensorFlow is only imported in main(), after the decode pool has been
+# started, so the spawned workers stay small and never load a model.
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+FIELDS = ["path", "mastitis_probability", "result", "error"]
+
+
+# ---------------- DIRECTORY WALK ----------------
+def iter_image_paths(root):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def iter_chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ---------------- DECODE WORKER ----------------
+def decode_chunk(paths, model_input_shape):
+    # Runs in a pool process: decode + resize + normalize a chunk of files.
+    _, height, width, channels = model_input_shape
+    batch = np.empty((len(paths), height, width, channels), dtype=np.float32)
+    ok = []
+    errors = {}
+    for path in paths:
+        try:
+            img, _ = decode_image(path, max(height, width))
+            preprocess_image(img, model_input_shape, out=batch[len(ok):len(ok) + 1])
+            ok.append(path)
+        except Exception as e:
+            errors[path] = str(e)
+    return paths, ok, batch[: len(ok)], errors
+
+
+def iter_decoded(pool, chunks, model_input_shape, max_pending):
+    # Keep at most max_pending chunks in flight so memory stays flat no
+    # matter how many files the walk produces.
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.submit(decode_chunk, chunk, model_input_shape))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# ---------------- OUTPUT ----------------
+def output_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "jsonl" if path.lower().endswith((".jsonl", ".json")) else "csv"
+
+
+def read_done(path, fmt):
+    # Paths already scored in a previous run. A partially written last line
+    # (interrupted run) is cut off so appended rows start on a fresh line.
+    done = set()
+    if not os.path.exists(path):
+        return done
+
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "jsonl":
+            for line in f:
+                try:
+                    done.add(json.loads(line)["path"])
+                except (ValueError, KeyError):
+                    continue
+        else:
+            for row in csv.DictReader(f):
+                done.add(row["path"])
+    return done
+
+
+class ResultWriter:
+    def __init__(self, path, fmt, append):
+        self.fmt = fmt
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, "a" if append else "w", newline="", encoding="utf-8")
+        if fmt == "csv":
+            self.writer = csv.DictWriter(self.file, fieldnames=FIELDS)
+            if write_header:
+                self.writer.writeheader()
+
+    def write(self, rows):
+        for row in rows:
+            if self.fmt == "jsonl":
+                self.file.write(json.dumps(row) + "\n")
+            else:
+                self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Score every udder image under a directory with the CNN model."
+    )
+    parser.add_argument("image_dir", help="Directory tree of .jpg/.jpeg/.png images")
+    parser.add_argument("-o", "--output", default="mastitis_scores.csv",
+                        help="Output file (.csv or .jsonl)")
+    parser.add_argument("--format", choices=["csv", "jsonl"],
+                        help="Output format (default: from the output extension)")
+    parser.add_argument("--model", default=None, help="CNN model file (default: final_cnn_model1.h5)")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="Inference backend (default: $MASTITIS_BACKEND or keras)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Images per CNN forward pass")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Decode/resize processes")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip images already present in the output file and append")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    fmt = output_format(args.output, args.format)
+    done = read_done(args.output, fmt) if args.resume else set()
+    paths = (p for p in iter_image_paths(args.image_dir) if p not in done)
+
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=ctx) as pool:
+        import model_registry
+        from inference import predict_batch
+
+        model = model_registry.load_model(args.model or model_registry.CNN_MODEL_PATH, args.backend)
+        input_shape = tuple(model.input_shape)
+
+        writer = ResultWriter(args.output, fmt, append=args.resume)
+        scored = failed = 0
+        start = time.perf_counter()
+        try:
+            chunks = iter_chunks(paths, args.batch_size)
+            for chunk, ok, batch, errors in iter_decoded(pool, chunks, input_shape, 2 * args.workers):
+                probs = dict(zip(ok, predict_batch(model, batch, args.batch_size).tolist()))
+                rows = []
+                for path in chunk:
+                    if path in probs:
+                        prob = probs[path]
+                        result = "Mastitis Detected" if prob > args.threshold else "Healthy Udder"
+                        rows.append({"path": path, "mastitis_probability": round(prob, 6),
+                                     "result": result, "error": ""})
+                    else:
+                        rows.append({"path": path, "mastitis_probability": "",
+                                     "result": "", "error": errors[path]})
+                writer.write(rows)
+
+                scored += len(ok)
+                failed += len(errors)
+                elapsed = time.perf_counter() - start
+                print(f"\r{scored} scored, {failed} failed, {scored / elapsed:.1f} images/sec",
+                      end="", file=sys.stderr, flush=True)
+        finally:
+            writer.close()
+
+    elapsed = time.perf_counter() - start
+    rate = scored / elapsed if elapsed > 0 else 0.0
+    print(f"\nDone: {scored} images scored, {failed} failed, {len(done)} skipped (resume) "
+          f"in {elapsed:.1f}s ({rate:.1f} images/sec) -> {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
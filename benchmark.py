@@ -0,0 +1,250 @@
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from dataset_shards import ShardedDataset, build_shards, normalize
+from inference import predict_batch, fuse_predictions
+from preprocessing import preprocess_image, preprocess_batch, decode_image
+from quality_gate import check_batch
+from reports import (generate_image_report, generate_hybrid_report, generate_symptom_report,
+                     generate_herd_report, herd_report_pages)
+from symptom_lookup import SymptomLookup, all_symptom_vectors
+
+DEFAULT_OUTPUT = "bench_results.json"
+DEFAULT_BASELINE = "bench_baseline.json"
+RESOLUTIONS = [(640, 480), (1920, 1080), (4032, 3024)]
+HERD_SIZE = 500
+SEED = 0
+
+
+# ---------------- TIMING ----------------
+def measure(fn, repeats, warmup=3):
+    for _ in range(warmup):
+        fn()
+    times = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times[i] = time.perf_counter() - start
+    times *= 1000.0
+    return {
+        "median_ms": float(np.median(times)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "min_ms": float(times.min()),
+        "repeats": repeats,
+    }
+
+
+# ---------------- SUITE ----------------
+def build_cases():
+    # Models are randomly initialised with the notebook architectures and a
+    # fixed seed, so the suite runs offline and is repeatable.
+    import tensorflow as tf
+    from model_defs import build_cnn_model, build_symptom_model
+    from serving import CompiledModel
+
+    tf.keras.utils.set_random_seed(SEED)
+    rng = np.random.default_rng(SEED)
+    cnn = build_cnn_model()
+    symptom = build_symptom_model()
+    compiled_cnn = CompiledModel(cnn, warmup_batch_sizes=(1, 32))
+    lookup = SymptomLookup.from_model(symptom)
+    shape = tuple(cnn.input_shape)
+
+    cases = {}
+    for w, h in RESOLUTIONS:
+        img = Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), "RGB")
+        cases[f"preprocess_image[{w}x{h}]"] = lambda img=img: preprocess_image(img, shape)
+
+    # A 12 MP phone JPEG to model tensor: full decode versus scaled decode.
+    buf = BytesIO()
+    Image.fromarray(rng.integers(0, 256, (300, 400, 3), dtype=np.uint8), "RGB").resize((4032, 3024)).save(
+        buf, "JPEG", quality=90)
+    phone_jpeg = buf.getvalue()
+
+    def decode_full():
+        img = Image.open(BytesIO(phone_jpeg))
+        img.load()
+        return preprocess_image(img, shape)
+
+    cases["decode_full[4032x3024]"] = decode_full
+    cases["decode_image[4032x3024]"] = lambda: preprocess_image(
+        decode_image(BytesIO(phone_jpeg), max(shape[1:3]))[0], shape)
+
+    x1 = rng.random((1,) + shape[1:], dtype=np.float32)
+    x32 = rng.random((32,) + shape[1:], dtype=np.float32)
+    x100 = rng.random((100,) + shape[1:], dtype=np.float32)
+    cases["cnn_predict[1]"] = lambda: cnn.predict(x1, verbose=0)
+    cases["cnn_predict[32]"] = lambda: cnn.predict(x32, verbose=0)
+    cases["cnn_compiled[1]"] = lambda: compiled_cnn.predict(x1)
+    cases["cnn_compiled[32]"] = lambda: compiled_cnn.predict(x32)
+    cases["cnn_predict_batch[100]"] = lambda: predict_batch(compiled_cnn, x100)
+
+    s1 = all_symptom_vectors()[45:46]
+    s64 = all_symptom_vectors()
+    cases["symptom_predict[1]"] = lambda: symptom.predict(s1, verbose=0)
+    cases["symptom_predict[64]"] = lambda: symptom.predict(s64, verbose=0)
+    cases["symptom_lookup[1]"] = lambda: lookup.predict([1, 0, 1, 1, 0, 1])
+
+    img_probs = rng.random(10000, dtype=np.float32)
+    sym_probs = rng.random(10000, dtype=np.float32)
+    cases["hybrid_fusion[1]"] = lambda: fuse_predictions(0.7, 0.4) > 0.5
+    cases["hybrid_fusion[10000]"] = lambda: fuse_predictions(img_probs, sym_probs) > 0.5
+    cases["quality_gate[1]"] = lambda: check_batch(x1)
+    cases["quality_gate[32]"] = lambda: check_batch(x32)
+
+    observed = ["Redness in Udder", "Swelling", "Fever"]
+    cases["pdf_image_platypus"] = lambda: generate_image_report("Mastitis Detected", 87.5)
+    cases["pdf_hybrid_platypus"] = lambda: generate_hybrid_report(
+        "⚠ Mastitis Detected", 0.8, 0.7, 0.75, observed)
+    cases["pdf_symptom"] = lambda: generate_symptom_report(
+        "Mastitis Detected", "Immediate veterinary consultation is advised.", observed,
+        "01-01-2025 10:00")
+
+    herd = [{
+        "cow_id": f"COW-{i:04d}",
+        "image_probability": float(p_img),
+        "symptom_probability": float(p_sym),
+        "hybrid_probability": float(fuse_predictions(p_img, p_sym)),
+        "result": "Mastitis" if fuse_predictions(p_img, p_sym) > 0.5 else "Healthy",
+        "symptoms": observed[:i % 4],
+    } for i, (p_img, p_sym) in enumerate(zip(img_probs[:HERD_SIZE], sym_probs[:HERD_SIZE]))]
+    cases[f"pdf_herd_report[{HERD_SIZE}]"] = lambda: generate_herd_report(iter(herd))
+
+    # 32 camera-sized JPEGs read the old way (decode + resize) versus the
+    # same images as a batch slice of the mmapped shards.
+    data_dir = tempfile.mkdtemp(prefix="bench_images_")
+    atexit.register(shutil.rmtree, data_dir, ignore_errors=True)
+    jpegs = []
+    for label in ("Healthy", "Mastitis"):
+        os.makedirs(os.path.join(data_dir, label))
+        for i in range(16):
+            path = os.path.join(data_dir, label, f"{i:03d}.jpg")
+            Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8), "RGB").save(path, quality=90)
+            jpegs.append(path)
+    build_shards(data_dir, os.path.join(data_dir, "shards"))
+    shards = ShardedDataset(os.path.join(data_dir, "shards"))
+    shard_buffer = np.empty((32,) + shape[1:], dtype=np.float32)
+
+    def jpeg_batch():
+        images = [Image.open(p) for p in jpegs]
+        return preprocess_batch(images, shape)
+
+    cases["dataset_jpeg_batch[32]"] = jpeg_batch
+    cases["dataset_shard_batch[32]"] = lambda: normalize(next(shards.iter_batches(32))[0], shard_buffer)
+    return cases
+
+
+def run_suite(repeats, name_filter=None):
+    results = {}
+    for name, fn in build_cases().items():
+        if name_filter and name_filter not in name:
+            continue
+        # Slow cases get fewer repeats so the whole suite stays quick.
+        probe = measure(fn, 1, warmup=1)["median_ms"]
+        n = max(5, min(repeats, int(2000 / max(probe, 1e-3))))
+        results[name] = measure(fn, n)
+        print(f"{name:<32} {results[name]['median_ms']:10.3f} ms  (p95 {results[name]['p95_ms']:.3f}, n={n})",
+              file=sys.stderr)
+        if name.startswith("pdf_herd_report"):
+            pages = herd_report_pages(HERD_SIZE)
+            results[name]["pages_per_sec"] = pages / (results[name]["median_ms"] / 1000.0)
+            print(f"{'':<32} {results[name]['pages_per_sec']:10.1f} pages/s", file=sys.stderr)
+    return results
+
+
+def environment():
+    import tensorflow as tf
+    import PIL
+    import reportlab
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "tensorflow": tf.__version__,
+        "pillow": PIL.__version__,
+        "reportlab": reportlab.Version,
+        "seed": SEED,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+# ---------------- REGRESSIONS ----------------
+def compare(results, baseline, tolerance):
+    # A case regresses when its median is more than `tolerance` slower
+    # than the baseline median.
+    rows = []
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            rows.append((name, stats["median_ms"], None, None, False))
+            continue
+        ratio = stats["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        rows.append((name, stats["median_ms"], base["median_ms"], ratio, ratio > 1.0 + tolerance))
+    return rows
+
+
+def print_comparison(rows, tolerance):
+    print(f"{'benchmark':<32} {'median ms':>10} {'baseline':>10} {'ratio':>7}")
+    for name, median, base, ratio, regressed in rows:
+        if base is None:
+            print(f"{name:<32} {median:10.3f} {'-':>10} {'new':>7}")
+        else:
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{name:<32} {median:10.3f} {base:10.3f} {ratio:6.2f}x{flag}")
+    regressions = sum(1 for row in rows if row[4])
+    print(f"\n{regressions} regression(s) beyond +{tolerance * 100:.0f}%")
+    return regressions
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the inference and reporting hot paths.")
+    parser.add_argument("-o", "--output", default=DEFAULT_OUTPUT, help="Where to write this run's results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline results to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="Also store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown before a case is flagged (0.25 = 25%%)")
+    parser.add_argument("--repeats", type=int, default=50, help="Upper bound on timed repeats per case")
+    parser.add_argument("--filter", default=None, help="Only run cases whose name contains this text")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {"environment": environment(), "results": run_suite(args.repeats, args.filter)}
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one.", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = print_comparison(compare(report["results"], baseline, args.tolerance), args.tolerance)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
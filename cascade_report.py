@@ -0,0 +1,110 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from fusion_sweep import score_pairs, read_pairs
+from inference import (fuse_predictions, cascade_skips_image, HYBRID_IMAGE_WEIGHT, HYBRID_THRESHOLD,
+                       CASCADE_LOW, CASCADE_HIGH)
+
+# Symmetric bounds (m, 1 - m) tried besides the configured pair.
+MARGINS = [0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4]
+LATENCY_SAMPLES = 20
+
+
+# ---------------- LATENCY ----------------
+def _median_ms(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return 1000.0 * float(np.median(times))
+
+
+def measure_latency(paths, backend=None, samples=LATENCY_SAMPLES):
+    # Per-request cost of each branch on this machine: the image branch is
+    # decode + preprocess + a single-image CNN call, the symptom branch is
+    # the lookup table.
+    from model_registry import get_cnn_model, get_symptom_lookup, cnn_input_shape
+    from preprocessing import decode_image, preprocess_image
+
+    model, shape = get_cnn_model(backend), cnn_input_shape(backend)
+    lookup = get_symptom_lookup(backend)
+    sample = paths[:samples]
+
+    def decode(path):
+        return preprocess_image(decode_image(path, max(shape[1:3]))[0], shape)
+
+    x = decode(sample[0])
+    model.predict(x)
+    decode_ms = float(np.median([_median_ms(lambda p=p: decode(p), 1) for p in sample]))
+    return {
+        "decode_preprocess_ms": decode_ms,
+        "cnn_ms": _median_ms(lambda: model.predict(x), max(samples, 10)),
+        "symptom_ms": _median_ms(lambda: lookup.predict([1, 0, 1, 0, 0, 1]), 200),
+    }
+
+
+# ---------------- REPORT ----------------
+def evaluate_bounds(img, sym, labels, low, high, weight=HYBRID_IMAGE_WEIGHT, threshold=HYBRID_THRESHOLD):
+    full = fuse_predictions(img, sym, weight) > threshold
+    skipped = cascade_skips_image(sym, low, high)
+    cascade = np.where(skipped, sym > threshold, full)
+    truth = labels.astype(bool)
+    return {
+        "low": low,
+        "high": high,
+        "skip_rate": float(skipped.mean()),
+        "disagreement": float((cascade != full).mean()),
+        "flips_to_mastitis": int(np.sum(cascade & ~full)),
+        "flips_to_healthy": int(np.sum(~cascade & full)),
+        "hybrid_accuracy": float((full == truth).mean()),
+        "cascade_accuracy": float((cascade == truth).mean()),
+    }
+
+
+def print_report(rows, latency):
+    image_ms = latency["decode_preprocess_ms"] + latency["cnn_ms"]
+    full_ms = image_ms + latency["symptom_ms"]
+    print(f"Per request: decode+preprocess {latency['decode_preprocess_ms']:.2f} ms, "
+          f"CNN {latency['cnn_ms']:.2f} ms, symptoms {latency['symptom_ms'] * 1000:.1f} us; "
+          f"full hybrid {full_ms:.2f} ms\n")
+    print(f"{'bounds':<14} {'skip %':>7} {'mean ms':>8} {'saved %':>8} {'differs %':>9} "
+          f"{'->M':>4} {'->H':>4} {'acc full':>8} {'acc casc':>8}")
+    for r in rows:
+        mean_ms = latency["symptom_ms"] + (1 - r["skip_rate"]) * image_ms
+        tag = " *" if r.get("configured") else ""
+        print(f"{r['low']:.2f}-{r['high']:.2f}{tag:<4} {100 * r['skip_rate']:7.1f} {mean_ms:8.2f} "
+              f"{100 * (1 - mean_ms / full_ms):8.1f} {100 * r['disagreement']:9.2f} {r['flips_to_mastitis']:4d} "
+              f"{r['flips_to_healthy']:4d} {r['hybrid_accuracy']:8.3f} {r['cascade_accuracy']:8.3f}")
+    print("\n* configured bounds (cascade_low / cascade_high in the fusion config)")
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Offline savings and agreement report for the confidence-gated hybrid cascade.")
+    parser.add_argument("pairs", help="Paired CSV, as for fusion_sweep.py")
+    parser.add_argument("--cache", default="fusion_probs.npz", help="Raw probability cache shared with fusion_sweep.py")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--latency-samples", type=int, default=LATENCY_SAMPLES)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    img, sym, labels = score_pairs(args.pairs, args.cache, args.backend)
+    paths, _, _ = read_pairs(args.pairs)
+    latency = measure_latency(paths, args.backend, args.latency_samples)
+
+    rows = [dict(evaluate_bounds(img, sym, labels, CASCADE_LOW, CASCADE_HIGH), configured=True)]
+    rows += [evaluate_bounds(img, sym, labels, m, 1 - m) for m in MARGINS]
+    print(f"{len(labels)} pairs, fusion weight {HYBRID_IMAGE_WEIGHT:.2f}, threshold {HYBRID_THRESHOLD:.3f}")
+    print_report(rows, latency)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
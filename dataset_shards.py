@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from preprocessing import preprocess_uint8
+
+# ---------------- CONFIG ----------------
+IMG_SIZE = 128
+SHARD_SIZE = 2048
+MANIFEST = "manifest.json"
+# Training resizes with nearest neighbour, like Keras load_img in the
+# notebook's flow_from_directory and the JPEG path in train_cnn.py, so a
+# model sees the same pixels whichever input it trains from.
+RESAMPLE = "nearest"
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+_INV_255 = np.float32(1.0 / 255.0)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_dataset(data_dir):
+    # Class names and (relative path, label) for every image, classes being
+    # the sorted sub-directories as in flow_from_directory.
+    classes = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    files = []
+    for label, name in enumerate(classes):
+        for root, _, names in sorted(os.walk(os.path.join(data_dir, name)), key=lambda w: w[0]):
+            for f in sorted(names):
+                if f.lower().endswith(IMAGE_EXTENSIONS):
+                    files.append((os.path.relpath(os.path.join(root, f), data_dir), label))
+    return classes, files
+
+
+# ---------------- BUILD / UPDATE ----------------
+def load_manifest(shard_dir):
+    path = os.path.join(shard_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_manifest(shard_dir, manifest):
+    # Written to a temp file and renamed so readers never see half a manifest.
+    path = os.path.join(shard_dir, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def _write_shard(shard_dir, number, data_dir, items, img_size):
+    # items: (relative path, label, sha256). Pixels go straight into an
+    # open_memmap file, so memory stays at one decoded image.
+    from PIL import Image
+
+    resample = Image.Resampling[RESAMPLE.upper()]
+
+    name = f"images_{number:05d}.npy"
+    images = np.lib.format.open_memmap(os.path.join(shard_dir, name), mode="w+", dtype=np.uint8,
+                                       shape=(len(items), img_size, img_size, 3))
+    shape = (1, img_size, img_size, 3)
+    for i, (rel, _, _) in enumerate(items):
+        with Image.open(os.path.join(data_dir, rel)) as img:
+            images[i] = preprocess_uint8(img, shape, resample)
+    images.flush()
+    del images
+    labels_name = f"labels_{number:05d}.npy"
+    np.save(os.path.join(shard_dir, labels_name), np.array([label for _, label, _ in items], dtype=np.uint8))
+    return {"images": name, "labels": labels_name, "count": len(items)}
+
+
+def build_shards(data_dir, shard_dir, img_size=IMG_SIZE, shard_size=SHARD_SIZE, rebuild=False):
+    # Converts the dataset once; later runs only decode images that are new
+    # or whose content changed, appending them as new shards. Entries for
+    # removed or replaced files are dropped from the manifest; their rows
+    # stay in the old shard until a --rebuild.
+    os.makedirs(shard_dir, exist_ok=True)
+    manifest = None if rebuild else load_manifest(shard_dir)
+    if manifest is not None and manifest["img_size"] != img_size:
+        raise ValueError(f"{shard_dir} holds {manifest['img_size']}px shards; use --rebuild to change size")
+    # Shards from before the resample was recorded were resized bicubic.
+    if manifest is not None and manifest.get("resample", "bicubic") != RESAMPLE:
+        raise ValueError(f"{shard_dir} was resized with {manifest.get('resample', 'bicubic')}, "
+                         f"training uses {RESAMPLE}; use --rebuild")
+    if manifest is None:
+        for f in os.listdir(shard_dir):
+            if f.endswith(".npy") and f.startswith(("images_", "labels_")):
+                os.remove(os.path.join(shard_dir, f))
+        manifest = {"img_size": img_size, "resample": RESAMPLE, "classes": [], "shards": [], "entries": {}}
+
+    classes, files = scan_dataset(data_dir)
+    if manifest["classes"] and manifest["classes"] != classes:
+        raise ValueError(f"Classes changed from {manifest['classes']} to {classes}; use --rebuild")
+    manifest["classes"] = classes
+
+    old = manifest["entries"]
+    entries, pending = {}, []
+    for rel, label in files:
+        stat = os.stat(os.path.join(data_dir, rel))
+        entry = old.get(rel)
+        # Size and mtime unchanged: trust the stored hash, skip re-reading.
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime \
+                and entry["label"] == label:
+            entries[rel] = entry
+            continue
+        sha = _file_sha256(os.path.join(data_dir, rel))
+        if entry is not None and entry["sha256"] == sha and entry["label"] == label:
+            entries[rel] = dict(entry, size=stat.st_size, mtime=stat.st_mtime)
+            continue
+        pending.append((rel, label, sha, stat))
+
+    added = len(pending)
+    for start in range(0, len(pending), shard_size):
+        chunk = pending[start:start + shard_size]
+        number = len(manifest["shards"])
+        manifest["shards"].append(
+            _write_shard(shard_dir, number, data_dir, [(r, l, s) for r, l, s, _ in chunk], img_size))
+        for index, (rel, label, sha, stat) in enumerate(chunk):
+            entries[rel] = {"label": label, "sha256": sha, "size": stat.st_size, "mtime": stat.st_mtime,
+                            "shard": number, "index": index}
+
+    removed = len(set(old) - set(entries))
+    manifest["entries"] = entries
+    manifest["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    _write_manifest(shard_dir, manifest)
+    return {"images": len(entries), "added": added, "removed": removed, "shards": len(manifest["shards"])}
+
+
+# ---------------- READ ----------------
+class ShardedDataset:
+    # Read-only view over the shards. Images are np.load(mmap_mode="r")
+    # arrays, so a contiguous batch is a zero-copy slice of the page cache.
+    # Only rows listed in the manifest are visible, in sorted path order.
+    def __init__(self, shard_dir):
+        manifest = load_manifest(shard_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"No {MANIFEST} in {shard_dir}; run dataset_shards.py build first")
+        self.classes = manifest["classes"]
+        self.img_size = manifest["img_size"]
+        self.shards = [np.load(os.path.join(shard_dir, s["images"]), mmap_mode="r") for s in manifest["shards"]]
+        self.paths = sorted(manifest["entries"])
+        entries = manifest["entries"]
+        self.labels = np.array([entries[p]["label"] for p in self.paths], dtype=np.uint8)
+        self.hashes = [entries[p]["sha256"] for p in self.paths]
+        self._shard = np.array([entries[p]["shard"] for p in self.paths], dtype=np.int32)
+        self._index = np.array([entries[p]["index"] for p in self.paths], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def image(self, i):
+        return self.shards[self._shard[i]][self._index[i]]
+
+    def take(self, indices, out=None):
+        # Gathers rows into `out` (uint8); one copy from the mmap.
+        indices = np.asarray(indices)
+        if out is None:
+            out = np.empty((len(indices), self.img_size, self.img_size, 3), dtype=np.uint8)
+        shards = self._shard[indices]
+        for shard in np.unique(shards):
+            rows = np.nonzero(shards == shard)[0]
+            out[rows] = self.shards[shard][self._index[indices[rows]]]
+        return out
+
+    def iter_batches(self, batch_size, indices=None):
+        # Yields (uint8 images, labels). When a batch is a run of consecutive
+        # rows in one shard it is a slice of the mmap, otherwise a gather.
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        for start in range(0, len(indices), batch_size):
+            idx = indices[start:start + batch_size]
+            shard, rows = self._shard[idx], self._index[idx]
+            if np.all(shard == shard[0]) and np.all(np.diff(rows) == 1):
+                yield self.shards[shard[0]][rows[0]:rows[-1] + 1], self.labels[idx]
+            else:
+                yield self.take(idx), self.labels[idx]
+
+
+def normalize(images, out=None):
+    # uint8 -> float32 in [0, 1], bit-identical to preprocess_image.
+    if out is None:
+        out = np.empty(images.shape, dtype=np.float32)
+    np.multiply(images, _INV_255, out=out[:len(images)], dtype=np.float32)
+    return out[:len(images)]
+
+
+# ---------------- EVALUATE ----------------
+def evaluate(shard_dir, model_path, batch_size=64):
+    import tensorflow as tf
+    from serving import CompiledModel
+    from train_cnn import classification_report
+
+    data = ShardedDataset(shard_dir)
+    model = CompiledModel(tf.keras.models.load_model(model_path))
+    buffer = np.empty((batch_size, data.img_size, data.img_size, 3), dtype=np.float32)
+    probs = np.empty(len(data), dtype=np.float32)
+    start = time.perf_counter()
+    done = 0
+    for images, _ in data.iter_batches(batch_size):
+        probs[done:done + len(images)] = model.predict(normalize(images, buffer)).reshape(-1)
+        done += len(images)
+    elapsed = time.perf_counter() - start
+    print(classification_report(data.labels, (probs > 0.5).astype(int), data.classes))
+    print(f"\n{len(data)} images in {elapsed:.2f} s ({len(data) / elapsed:.1f} img/s)", file=sys.stderr)
+    return probs
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Preprocessed uint8 .npy shards of the image dataset.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Create or incrementally update the shards")
+    build.add_argument("data_dir", help="Dataset root with one sub-directory per class")
+    build.add_argument("shard_dir")
+    build.add_argument("--img-size", type=int, default=IMG_SIZE)
+    build.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Images per shard file")
+    build.add_argument("--rebuild", action="store_true", help="Discard existing shards and start over")
+
+    ev = sub.add_parser("evaluate", help="Score a model on the shards")
+    ev.add_argument("shard_dir")
+    ev.add_argument("--model", default="final_cnn_model1.h5")
+    ev.add_argument("--batch-size", type=int, default=64)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "build":
+        start = time.perf_counter()
+        stats = build_shards(args.data_dir, args.shard_dir, args.img_size, args.shard_size, args.rebuild)
+        print(f"{stats['images']} images in {stats['shards']} shard(s): {stats['added']} added, "
+              f"{stats['removed']} removed ({time.perf_counter() - start:.1f} s)")
+    else:
+        evaluate(args.shard_dir, args.model, args.batch_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from batch_score import iter_image_paths
+from inference import predict_batch, HYBRID_THRESHOLD
+from preprocessing import decode_image, preprocess_image, preprocess_batch
+from symptom_lookup import all_symptom_vectors
+from tflite_backend import BACKENDS, lite_model_path
+
+LITE_BACKENDS = [b for b in BACKENDS if b != "keras"]
+
+
+# ---------------- EXPORT ----------------
+def convert(keras_model, variant, representative_data=None):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif representative_data is not None:
+        # Full integer quantization with float input/output, so callers
+        # still pass the same float32 tensors as for Keras.
+        def representative_dataset():
+            for x in representative_data:
+                yield [x[None].astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    # int8 without calibration data falls back to dynamic-range quantization
+    # (int8 weights, float activations).
+    return converter.convert()
+
+
+def calibration_images(image_dir, model_input_shape, limit):
+    paths = []
+    for path in iter_image_paths(image_dir):
+        paths.append(path)
+        if len(paths) == limit:
+            break
+    # Decoded like the pages and the server decode uploads, so the int8
+    # ranges are calibrated on the pixels the model sees in production.
+    min_side = max(model_input_shape[1:3])
+    return [preprocess_image(decode_image(path, min_side)[0], model_input_shape)[0] for path in paths]
+
+
+def export(args):
+    import tensorflow as tf
+    import model_registry
+
+    targets = [
+        (model_registry.CNN_MODEL_PATH, None),
+        (model_registry.SYMPTOM_MODEL_PATH, all_symptom_vectors()),
+    ]
+    for h5_path, calibration in targets:
+        keras_model = tf.keras.models.load_model(h5_path)
+        if calibration is None and args.calibration_dir:
+            calibration = calibration_images(args.calibration_dir, keras_model.input_shape,
+                                             args.max_calibration)
+        for backend in LITE_BACKENDS:
+            variant = backend.split("-", 1)[1]
+            data = calibration if variant == "int8" else None
+            out_path = lite_model_path(h5_path, backend)
+            with open(out_path, "wb") as f:
+                f.write(convert(keras_model, variant, data))
+            mode = variant
+            if variant == "int8":
+                mode = "int8 (full integer)" if data is not None else "int8 (dynamic range)"
+            print(f"{h5_path} -> {out_path} [{mode}, {os.path.getsize(out_path) / 1e6:.2f} MB]")
+    return 0
+
+
+# ---------------- COMPARE ----------------
+def label_from_path(path, image_dir):
+    # Class folders as used for training (flow_from_directory order):
+    # "Healthy" -> 0, "Mastitis" -> 1. Anything else is unlabeled.
+    top = os.path.relpath(path, image_dir).split(os.sep)[0].lower()
+    if "mastitis" in top:
+        return 1
+    if "healthy" in top:
+        return 0
+    return None
+
+
+def _latency_ms(model, batch, repeats):
+    times = []
+    for i in range(min(repeats, len(batch))):
+        start = time.perf_counter()
+        model.predict(batch[i:i + 1], verbose=0)
+        times.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(times))
+
+
+def compare(args):
+    import model_registry
+
+    paths = list(iter_image_paths(args.image_dir))
+    if args.limit:
+        paths = paths[: args.limit]
+    if not paths:
+        print(f"No images found under {args.image_dir}", file=sys.stderr)
+        return 1
+
+    reference = model_registry.get_cnn_model("keras")
+    input_shape = tuple(reference.input_shape)
+    images = [decode_image(path, max(input_shape[1:3]))[0] for path in paths]
+    batch = preprocess_batch(images, input_shape)
+    labels = [label_from_path(p, args.image_dir) for p in paths]
+    labeled = np.array([label is not None for label in labels])
+    y_true = np.array([label for label in labels if label is not None], dtype=int)
+
+    rows = []
+    ref_probs = None
+    for backend in ["keras"] + args.backends:
+        model = model_registry.get_cnn_model(backend)
+        predict_batch(model, batch[: args.batch_size], args.batch_size)  # warm-up
+
+        start = time.perf_counter()
+        probs = predict_batch(model, batch, args.batch_size)
+        throughput = len(batch) / (time.perf_counter() - start)
+        if ref_probs is None:
+            ref_probs = probs
+
+        sym_ref = model_registry.get_symptom_lookup("keras").table
+        sym = model_registry.get_symptom_lookup(backend).table
+        info = model_registry.model_info(model_registry.CNN_MODEL_PATH, backend)
+        decisions = probs > args.threshold
+        rows.append({
+            "backend": backend,
+            "size_mb": info["weight_bytes"] / 1e6,
+            "max_abs_diff": float(np.max(np.abs(probs - ref_probs))),
+            "mean_abs_diff": float(np.mean(np.abs(probs - ref_probs))),
+            "agreement": float(np.mean(decisions == (ref_probs > args.threshold))),
+            "accuracy": float(np.mean(decisions[labeled] == y_true)) if labeled.any() else None,
+            "latency_ms": _latency_ms(model, batch, args.latency_repeats),
+            "images_per_sec": throughput,
+            "symptom_max_abs_diff": float(np.max(np.abs(sym - sym_ref))),
+        })
+
+    print(f"{len(batch)} images ({int(labeled.sum())} labeled), threshold {args.threshold}")
+    header = (f"{'backend':<12} {'size MB':>8} {'max|dp|':>9} {'mean|dp|':>9} {'agree':>7} "
+              f"{'acc':>7} {'1-img ms':>9} {'img/s':>8} {'sym max|dp|':>12}")
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        acc = f"{r['accuracy'] * 100:6.2f}%" if r["accuracy"] is not None else f"{'n/a':>7}"
+        print(f"{r['backend']:<12} {r['size_mb']:8.2f} {r['max_abs_diff']:9.5f} {r['mean_abs_diff']:9.5f} "
+              f"{r['agreement'] * 100:6.2f}% {acc} {r['latency_ms']:9.2f} {r['images_per_sec']:8.1f} "
+              f"{r['symptom_max_abs_diff']:12.5f}")
+    return 0
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export the Keras models to quantized TFLite and compare them against Keras."
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="Write float16 and int8 .tflite files next to the .h5 models")
+    p.add_argument("--calibration-dir",
+                   help="Images used to calibrate full-integer int8 quantization of the CNN")
+    p.add_argument("--max-calibration", type=int, default=200)
+
+    p = sub.add_parser("compare", help="Accuracy and latency of each backend on a held-out image folder")
+    p.add_argument("image_dir", help="Held-out images, optionally in Healthy/ and Mastitis/ subfolders")
+    p.add_argument("--backends", nargs="+", choices=LITE_BACKENDS, default=LITE_BACKENDS)
+    p.add_argument("--batch-size", type=int, default=32)
+    p.add_argument("--limit", type=int, default=0, help="Use at most this many images")
+    p.add_argument("--latency-repeats", type=int, default=50)
+    p.add_argument("--threshold", type=float, default=HYBRID_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    return export(args) if args.command == "export" else compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from inference import FUSION_CONFIG_PATH, HYBRID_IMAGE_WEIGHT, HYBRID_THRESHOLD, load_fusion_config, predict_batch
+from symptom_lookup import N_SYMPTOMS
+
+# ---------------- CONFIG ----------------
+N_WEIGHTS = 101
+N_THRESHOLDS = 1001
+OBJECTIVES = ("f1", "youden", "accuracy")
+
+
+# ---------------- PAIRED DATA ----------------
+def read_pairs(csv_path):
+    # One row per animal: an image path (relative to the CSV), the six
+    # symptom flags in model order, and the true label (1 = mastitis).
+    # Columns: "image", "label" (any case) and six symptom columns.
+    with open(csv_path, newline="") as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames
+        lower = {name.lower(): name for name in fields}
+        if "image" not in lower or "label" not in lower:
+            raise ValueError(f"{csv_path} needs 'image' and 'label' columns, found {fields}")
+        symptom_cols = [c for c in fields if c.lower() not in ("image", "label")]
+        if len(symptom_cols) != N_SYMPTOMS:
+            raise ValueError(f"Expected {N_SYMPTOMS} symptom columns, found {symptom_cols}")
+        base = os.path.dirname(os.path.abspath(csv_path))
+        paths, symptoms, labels = [], [], []
+        for row in reader:
+            paths.append(os.path.join(base, row[lower["image"]]))
+            symptoms.append([int(float(row[c])) for c in symptom_cols])
+            labels.append(int(float(row[lower["label"]])))
+    return paths, np.array(symptoms, dtype=np.uint8), np.array(labels, dtype=np.uint8)
+
+
+# ---------------- RAW PROBABILITIES ----------------
+def score_pairs(csv_path, cache_path, backend=None):
+    # Runs each network once and stores the raw probabilities; later runs
+    # reuse the cache while the CSV and both model files are unchanged.
+    from model_registry import CNN_MODEL_PATH, SYMPTOM_MODEL_PATH, model_version
+
+    with open(csv_path, "rb") as f:
+        csv_digest = hashlib.sha256(f.read()).hexdigest()
+    if cache_path and os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if str(cached["key"]) == f"{csv_digest}:{_model_key(backend)}":
+            print(f"Using cached probabilities from {cache_path}", file=sys.stderr)
+            return cached["img"], cached["sym"], cached["labels"]
+
+    from model_registry import get_cnn_model, get_symptom_lookup, cnn_input_shape
+    from preprocessing import BatchBuffer, decode_image, preprocess_image
+
+    paths, symptoms, labels = read_pairs(csv_path)
+    start = time.perf_counter()
+    model, shape = get_cnn_model(backend), cnn_input_shape(backend)
+    min_side = max(shape[1:3])
+    buffer = BatchBuffer(shape, 64)
+    img = np.empty(len(paths), dtype=np.float32)
+    for chunk in range(0, len(paths), 64):
+        batch = buffer.reserve(min(64, len(paths) - chunk))
+        for i, path in enumerate(paths[chunk:chunk + len(batch)]):
+            # Same decode as the pages and the server, so the weights are
+            # tuned on the pixels the CNN sees in production.
+            preprocess_image(decode_image(path, min_side)[0], shape, out=batch[i:i + 1])
+        img[chunk:chunk + len(batch)] = predict_batch(model, batch)
+    masks = (symptoms.astype(np.intp) << np.arange(N_SYMPTOMS)).sum(axis=1)
+    sym = get_symptom_lookup(backend).predict_batch(masks).astype(np.float32)
+    print(f"Scored {len(paths)} pairs in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+
+    if cache_path:
+        np.savez(cache_path, img=img, sym=sym, labels=labels, key=f"{csv_digest}:{_model_key(backend)}",
+                 cnn=model_version(CNN_MODEL_PATH, backend), symptom=model_version(SYMPTOM_MODEL_PATH, backend))
+    return img, sym, labels
+
+
+def _model_key(backend):
+    from model_registry import CNN_MODEL_PATH, SYMPTOM_MODEL_PATH, model_version
+    from preprocessing import PREPROCESS_VERSION
+    return (f"{model_version(CNN_MODEL_PATH, backend)}:{model_version(SYMPTOM_MODEL_PATH, backend)}"
+            f":p{PREPROCESS_VERSION}")
+
+
+# ---------------- SWEEP ----------------
+def sweep(img, sym, labels, weights, thresholds):
+    # Confusion counts for every (weight, threshold) pair, shape (W, T).
+    # Fused scores are sorted per weight once; the number of positives and
+    # negatives above each threshold then comes from one searchsorted over
+    # all rows (row r is shifted by 2r so rows never overlap).
+    labels = labels.astype(bool)
+    fused = weights[:, None] * img[None, :] + (1 - weights)[:, None] * sym[None, :]
+    offsets = 2.0 * np.arange(len(weights))[:, None]
+
+    def above(scores):
+        n = scores.shape[1]
+        flat = np.sort(scores, axis=1) + offsets
+        # "> threshold" as in hybrid_label: count scores strictly above.
+        at_or_below = np.searchsorted(flat.ravel(), (thresholds[None, :] + offsets).ravel(), side="right")
+        return n - (at_or_below.reshape(len(weights), -1) - np.arange(len(weights))[:, None] * n)
+
+    tp = above(fused[:, labels])
+    fp = above(fused[:, ~labels])
+    positives, negatives = int(labels.sum()), int((~labels).sum())
+    return fused, {"tp": tp, "fp": fp, "fn": positives - tp, "tn": negatives - fp}
+
+
+def metrics(counts):
+    tp, fp, fn, tn = (counts[k].astype(np.float64) for k in ("tp", "fp", "fn", "tn"))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        fpr = np.where(fp + tn > 0, fp / (fp + tn), 0.0)
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 1.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return {
+        "accuracy": (tp + tn) / (tp + fp + fn + tn),
+        "precision": precision,
+        "recall": recall,
+        "fpr": fpr,
+        "f1": f1,
+        "youden": recall - fpr,
+    }
+
+
+def roc_auc(fused, labels):
+    # Rank-based (Mann-Whitney) AUC for every weight at once, with ties
+    # counted as half.
+    labels = labels.astype(bool)
+    pos, neg = fused[:, labels], fused[:, ~labels]
+    if pos.shape[1] == 0 or neg.shape[1] == 0:
+        return np.full(len(fused), np.nan)
+    neg_sorted = np.sort(neg, axis=1)
+    auc = np.empty(len(fused))
+    for i in range(len(fused)):
+        below = np.searchsorted(neg_sorted[i], pos[i], side="left")
+        ties = np.searchsorted(neg_sorted[i], pos[i], side="right") - below
+        auc[i] = (below.sum() + 0.5 * ties.sum()) / (pos.shape[1] * neg.shape[1])
+    return auc
+
+
+def average_precision(m):
+    # Step-wise area under the PR curve per weight, thresholds high to low.
+    recall = m["recall"][:, ::-1]
+    precision = m["precision"][:, ::-1]
+    return np.sum(np.diff(recall, axis=1, prepend=0.0) * precision, axis=1)
+
+
+def best_point(m, objective, min_recall=None):
+    score = m[objective].copy()
+    if min_recall is not None:
+        score[m["recall"] < min_recall] = -np.inf
+    return np.unravel_index(np.argmax(score), score.shape)
+
+
+def nearest(grid, value):
+    return int(np.argmin(np.abs(grid - value)))
+
+
+# ---------------- OUTPUT ----------------
+def describe(name, wi, ti, weights, thresholds, counts, m, auc):
+    return {
+        "name": name,
+        "image_weight": float(weights[wi]),
+        "threshold": float(thresholds[ti]),
+        "confusion": {k: int(counts[k][wi, ti]) for k in ("tp", "fp", "fn", "tn")},
+        **{k: float(m[k][wi, ti]) for k in ("accuracy", "precision", "recall", "fpr", "f1")},
+        "roc_auc": float(auc[wi]),
+    }
+
+
+def print_points(points):
+    print(f"{'operating point':<22} {'w_img':>6} {'thr':>6} {'acc':>6} {'prec':>6} {'recall':>6} "
+          f"{'fpr':>6} {'f1':>6} {'auc':>6}")
+    for p in points:
+        print(f"{p['name']:<22} {p['image_weight']:6.2f} {p['threshold']:6.3f} {p['accuracy']:6.3f} "
+              f"{p['precision']:6.3f} {p['recall']:6.3f} {p['fpr']:6.3f} {p['f1']:6.3f} {p['roc_auc']:6.3f}")
+    for p in points:
+        c = p["confusion"]
+        print(f"\n{p['name']}\n{'':>14} {'pred healthy':>13} {'pred mastitis':>14}\n"
+              f"{'true healthy':>14} {c['tn']:13d} {c['fp']:14d}\n{'true mastitis':>14} {c['fn']:13d} {c['tp']:14d}")
+
+
+def write_curves(path, weights, thresholds, m, picked):
+    # ROC and PR points along the threshold axis for the picked weights.
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["image_weight", "threshold", "fpr", "recall", "precision"])
+        for wi in sorted(set(picked)):
+            for ti in range(len(thresholds)):
+                writer.writerow([f"{weights[wi]:.4f}", f"{thresholds[ti]:.4f}", f"{m['fpr'][wi, ti]:.6f}",
+                                 f"{m['recall'][wi, ti]:.6f}", f"{m['precision'][wi, ti]:.6f}"])
+
+
+def plot_curves(path, weights, m, picked):
+    # matplotlib is optional; curves are always available as CSV.
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib not installed; skipping plot", file=sys.stderr)
+        return
+    fig, (roc_ax, pr_ax) = plt.subplots(1, 2, figsize=(11, 5))
+    for wi in sorted(set(picked)):
+        roc_ax.plot(m["fpr"][wi], m["recall"][wi], label=f"w_img={weights[wi]:.2f}")
+        pr_ax.plot(m["recall"][wi], m["precision"][wi], label=f"w_img={weights[wi]:.2f}")
+    roc_ax.plot([0, 1], [0, 1], "k--", lw=0.5)
+    roc_ax.set(xlabel="False positive rate", ylabel="True positive rate", title="ROC")
+    pr_ax.set(xlabel="Recall", ylabel="Precision", title="Precision-Recall")
+    roc_ax.legend()
+    pr_ax.legend()
+    fig.savefig(path, dpi=120, bbox_inches="tight")
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep hybrid fusion weights and thresholds on paired data.")
+    parser.add_argument("pairs", help="CSV with image, label and the six symptom columns")
+    parser.add_argument("--cache", default="fusion_probs.npz", help="Raw probability cache ('' to disable)")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--weights", type=int, default=N_WEIGHTS, help="Image weights from 0 to 1")
+    parser.add_argument("--thresholds", type=int, default=N_THRESHOLDS, help="Thresholds from 0 to 1")
+    parser.add_argument("--objective", choices=OBJECTIVES, default="f1")
+    parser.add_argument("--min-recall", type=float, default=None,
+                        help="Only consider operating points with at least this recall")
+    parser.add_argument("--curves", default="fusion_curves.csv", help="Where to write ROC/PR points")
+    parser.add_argument("--plot", default=None, help="Also save ROC/PR curves as an image (needs matplotlib)")
+    parser.add_argument("--export", nargs="?", const=FUSION_CONFIG_PATH, default=None,
+                        help=f"Write the chosen weight and threshold for the apps (default {FUSION_CONFIG_PATH})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    img, sym, labels = score_pairs(args.pairs, args.cache, args.backend)
+
+    start = time.perf_counter()
+    weights = np.linspace(0.0, 1.0, args.weights)
+    thresholds = np.linspace(0.0, 1.0, args.thresholds)
+    fused, counts = sweep(img, sym, labels, weights, thresholds)
+    m = metrics(counts)
+    auc = roc_auc(fused, labels)
+    ap = average_precision(m)
+    elapsed = time.perf_counter() - start
+    print(f"{len(labels)} pairs, {len(weights) * len(thresholds):,} operating points in {elapsed:.2f} s\n")
+
+    current = (nearest(weights, HYBRID_IMAGE_WEIGHT), nearest(thresholds, HYBRID_THRESHOLD))
+    best = best_point(m, args.objective, args.min_recall)
+    points = [
+        describe("current config", *current, weights, thresholds, counts, m, auc),
+        describe("image only", nearest(weights, 1.0), current[1], weights, thresholds, counts, m, auc),
+        describe("symptoms only", nearest(weights, 0.0), current[1], weights, thresholds, counts, m, auc),
+        describe(f"best {args.objective}", *best, weights, thresholds, counts, m, auc),
+    ]
+    for objective in OBJECTIVES:
+        if objective != args.objective:
+            points.append(describe(f"best {objective}", *best_point(m, objective, args.min_recall),
+                                   weights, thresholds, counts, m, auc))
+    print_points(points)
+    print(f"\nAverage precision at best weight: {ap[best[0]]:.3f}")
+
+    picked = [current[0], nearest(weights, 1.0), nearest(weights, 0.0), best[0]]
+    if args.curves:
+        write_curves(args.curves, weights, thresholds, m, picked)
+        print(f"ROC/PR points written to {args.curves}", file=sys.stderr)
+    if args.plot:
+        plot_curves(args.plot, weights, m, picked)
+
+    if args.export:
+        # Only the swept keys change; the cascade bounds already in the file
+        # are kept.
+        chosen = points[3]
+        config = load_fusion_config(args.export)
+        config.update({
+            "image_weight": chosen["image_weight"],
+            "threshold": chosen["threshold"],
+            "objective": args.objective,
+            "min_recall": args.min_recall,
+            "validation_pairs": int(len(labels)),
+            "metrics": {k: chosen[k] for k in ("accuracy", "precision", "recall", "fpr", "f1", "roc_auc")},
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        with open(args.export, "w") as f:
+            json.dump(config, f, indent=2)
+        print(f"Fusion config written to {args.export}; restart the apps to pick it up", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
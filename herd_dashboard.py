@@ -0,0 +1,219 @@
+import streamlit as st
+import os
+import time
+from contextlib import closing
+from datetime import date, datetime
+
+import herd_stats
+from history_store import get_history_store, open_reader, HISTORY_DB
+from inference import HYBRID_THRESHOLD
+from reports import generate_herd_report
+
+# ---------------- PAGE CONFIG ----------------
+st.set_page_config(
+    page_title="Herd Risk Dashboard",
+    layout="wide",
+    page_icon="📊"
+)
+
+# ---------------- CUSTOM CSS ----------------
+st.markdown("""
+<style>
+.stApp {
+    background-image: url("https://images.unsplash.com/photo-1478760329108-5c3ed9d495a0?q=80&w=1074&auto=format&fit=crop");
+    background-size: cover;
+    background-position: center;
+    background-attachment: fixed;
+}
+
+.title-text {
+    text-align: center;
+    font-size: 40px;
+    font-weight: 700;
+    color: white;
+}
+
+.subtitle {
+    text-align: center;
+    font-size: 18px;
+    color: #e5e7eb;
+    margin-bottom: 30px;
+}
+</style>
+""", unsafe_allow_html=True)
+
+# ---------------- HEADER ----------------
+st.markdown("""
+<div style="text-align: left; margin-bottom: 20px;">
+    <a href="../app" style="
+        background-color: #2563eb;
+        color: white;
+        padding: 8px 20px;
+        border-radius: 8px;
+        text-decoration: none;
+        font-size: 16px;
+        font-weight: 600;
+        transition: all 0.25s ease-in-out;
+    "
+    onmouseover="this.style.backgroundColor='#1d4ed8'"
+    onmouseout="this.style.backgroundColor='#2563eb'">
+        ⬅ Home
+    </a>
+</div>
+""", unsafe_allow_html=True)
+
+st.markdown('<div class="title-text">📊 Herd Risk Dashboard</div>', unsafe_allow_html=True)
+st.markdown('<div class="subtitle">Latest hybrid risk per cow and pen, with 7- and 30-day trends</div>',
+            unsafe_allow_html=True)
+
+# ---------------- ROSTER ----------------
+with st.expander("🐄 Assign cows to pens"):
+    roster = st.file_uploader("Herd roster CSV with cow_id and pen columns", type=["csv"], key="roster_upload")
+    if roster is not None and st.button("Load roster"):
+        from io import StringIO
+
+        try:
+            pens = herd_stats.read_pens_csv(StringIO(roster.getvalue().decode("utf-8-sig")))
+            store = get_history_store()
+            store.submit(lambda conn: herd_stats.assign_pens(conn, pens))
+            store.flush()
+            st.success(f"Assigned {len(pens)} cow(s) to pens.")
+        except ValueError as e:
+            st.error(str(e))
+
+# ---------------- AGGREGATES ----------------
+# Everything below reads the materialized tables kept by the history
+# writer (herd_stats.py); nothing scans the raw predictions. Only the
+# day roll-over is done here, once per day, so the windows age even on
+# days without predictions.
+render_start = time.perf_counter()
+conn = None
+if os.path.exists(HISTORY_DB):
+    # This page can be the first one opened in the process: opening the
+    # store creates the aggregate tables and queues their rebuild for a
+    # history DB that predates them.
+    store = get_history_store()
+    conn = open_reader(HISTORY_DB)
+    if herd_stats.as_of(conn) < date.today().toordinal():
+        conn.close()
+        store.submit(herd_stats.advance_to)
+        store.flush()
+        conn = open_reader(HISTORY_DB)
+
+
+symptoms_labels = ["Redness in Udder", "Swelling", "Hardness", "Fever", "Low Milk Yield", "Clots in Milk"]
+
+
+def percent(p):
+    return None if p is None else round(p * 100, 1)
+
+
+def report_records(conn):
+    for r in herd_stats.latest_predictions(conn):
+        mask = r["symptom_mask"] or 0
+        r["symptoms"] = [label for i, label in enumerate(symptoms_labels) if mask >> i & 1]
+        yield r
+
+
+def show_dashboard(conn):
+    summary = herd_stats.herd_summary(conn)
+    if not summary["scored"]:
+        st.info("No hybrid predictions with a cow ID yet.")
+        return
+
+    cols = st.columns(5)
+    cols[0].metric("Cows scored", f"{summary['scored']} / {summary['cows']}")
+    cols[1].metric("At risk now", summary["at_risk"])
+    cols[2].metric("Mean latest risk", f"{percent(summary['mean_latest'])}%")
+    cols[3].metric("7-day average", "-" if summary["ma7"] is None else f"{percent(summary['ma7'])}%")
+    cols[4].metric("30-day average", "-" if summary["ma30"] is None else f"{percent(summary['ma30'])}%")
+
+    # ---------------- TREND ----------------
+    st.markdown("### 📈 Herd trend")
+    trend = herd_stats.trend(conn)
+    if trend:
+        st.line_chart(
+            {"Date": [d for d, *_ in trend],
+             "Mean risk (%)": [percent(m) for _, _, m, _ in trend],
+             "Positives": [p for *_, p in trend]},
+            x="Date"
+        )
+
+    # ---------------- PENS ----------------
+    st.markdown("### 🏠 Pens")
+    pens = herd_stats.pen_table(conn)
+    st.dataframe(
+        [{
+            "Pen": p["pen"] or "Unassigned",
+            "Cows": p["cows"],
+            "At Risk": p["at_risk"],
+            "Mean Latest (%)": percent(p["mean_latest"]),
+            "7-day Avg (%)": percent(p["ma7"]),
+            "30-day Avg (%)": percent(p["ma30"]),
+            "Positives (7d)": p["positives7"],
+            "Positives (30d)": p["positives30"],
+        } for p in pens],
+        width="stretch",
+        hide_index=True
+    )
+
+    # ---------------- COWS ABOVE THRESHOLD ----------------
+    st.markdown("### ⚠ Cows above threshold")
+    cols = st.columns([1, 1, 1])
+    threshold = cols[0].slider("Latest hybrid risk above", 0.0, 1.0, float(HYBRID_THRESHOLD), 0.01)
+    pen_names = [p["pen"] for p in pens]
+    pen_choice = cols[1].selectbox("Pen", ["All"] + pen_names,
+                                   format_func=lambda p: "Unassigned" if p == "" else p)
+    limit = cols[2].selectbox("Show", [50, 200, 1000], index=1)
+    at_risk = herd_stats.cows_at_risk(conn, threshold, limit, None if pen_choice == "All" else pen_choice)
+    if at_risk:
+        st.dataframe(
+            [{
+                "Cow ID": c["cow_id"],
+                "Pen": c["pen"] or "Unassigned",
+                "Latest (%)": percent(c["latest"]),
+                "Last Checked": datetime.fromtimestamp(c["latest_ts"]).strftime("%d-%m-%Y %H:%M"),
+                "7-day Avg (%)": percent(c["ma7"]),
+                "30-day Avg (%)": percent(c["ma30"]),
+                "Positives (30d)": c["positives30"],
+                "Predictions": c["predictions"],
+            } for c in at_risk],
+            width="stretch",
+            hide_index=True
+        )
+    else:
+        st.success("No cows above the threshold.")
+
+    # ---------------- COW TREND ----------------
+    cow = st.selectbox("Cow trend", [""] + [c["cow_id"] for c in at_risk],
+                       format_func=lambda c: "Select a cow" if c == "" else c)
+    if cow:
+        cow_trend = herd_stats.trend(conn, cow)
+        if cow_trend:
+            st.line_chart(
+                {"Date": [d for d, *_ in cow_trend], "Mean risk (%)": [percent(m) for _, _, m, _ in cow_trend]},
+                x="Date"
+            )
+        else:
+            st.caption(f"No predictions for {cow} in the last {herd_stats.TREND_DAYS} days.")
+
+    # ---------------- HERD REPORT ----------------
+    # Latest hybrid prediction of every scored cow, streamed into the PDF.
+    if st.button("📄 Prepare Herd Report"):
+        pdf = generate_herd_report(report_records(conn), threshold=HYBRID_THRESHOLD)
+        st.download_button(
+            label="📄 Download Herd Report",
+            data=pdf,
+            file_name=f"herd_report_{date.today():%Y%m%d}.pdf",
+            mime="application/pdf"
+        )
+
+    st.caption(f"Aggregates as of {date.fromordinal(herd_stats.as_of(conn)):%d-%m-%Y}; "
+               f"rendered in {(time.perf_counter() - render_start) * 1000:.0f} ms.")
+
+
+if conn is None:
+    st.info("No predictions recorded yet. Hybrid predictions with a cow ID appear here.")
+else:
+    with closing(conn):
+        show_dashboard(conn)
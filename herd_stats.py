@@ -0,0 +1,400 @@
+import argparse
+import csv
+import sys
+import time
+from datetime import date
+
+from inference import HYBRID_THRESHOLD
+
+# ---------------- CONFIG ----------------
+# Moving-average windows in days. Each has n/sum/pos columns in cow_stats and
+# pen_stats.
+WINDOWS = (7, 30)
+SCHEMA_VERSION = "1"
+TREND_DAYS = 30
+
+# Materialized from the hybrid rows of the predictions table, in the same
+# transaction as the insert:
+#   cow_daily   per cow and day: predictions, score sum, positives
+#   herd_daily  the same for the whole herd
+#   cow_stats   per cow: latest score, totals and the 7/30-day window sums
+#   pen_stats   per pen: sums of its cows' cow_stats, kept by triggers
+# Window sums are relative to herd_meta.as_of (a date ordinal). Moving the
+# day forward subtracts only the daily buckets that leave each window.
+_WINDOW_COLUMNS = [f"{c}{w}" for w in WINDOWS for c in ("n", "sum", "pos")]
+_STAT_COLUMNS = ",\n    ".join(f"{c} {'REAL' if c.startswith('sum') else 'INTEGER'} NOT NULL DEFAULT 0"
+                               for c in _WINDOW_COLUMNS)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS herd_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS cow_pens (cow_id TEXT PRIMARY KEY, pen TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS cow_daily (
+    cow_id TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    n INTEGER NOT NULL,
+    total REAL NOT NULL,
+    positives INTEGER NOT NULL,
+    PRIMARY KEY (cow_id, day)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cow_daily_day ON cow_daily (day);
+CREATE TABLE IF NOT EXISTS herd_daily (
+    day INTEGER PRIMARY KEY,
+    n INTEGER NOT NULL,
+    total REAL NOT NULL,
+    positives INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cow_stats (
+    cow_id TEXT PRIMARY KEY,
+    pen TEXT NOT NULL DEFAULT '',
+    n_total INTEGER NOT NULL DEFAULT 0,
+    pos_total INTEGER NOT NULL DEFAULT 0,
+    latest_score REAL,
+    latest_ts REAL,
+    at_risk INTEGER NOT NULL DEFAULT 0,
+    {_STAT_COLUMNS}
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_cow_stats_latest ON cow_stats (latest_score);
+CREATE INDEX IF NOT EXISTS idx_cow_stats_pen ON cow_stats (pen, latest_score);
+CREATE TABLE IF NOT EXISTS pen_stats (
+    pen TEXT PRIMARY KEY,
+    cows INTEGER NOT NULL DEFAULT 0,
+    scored INTEGER NOT NULL DEFAULT 0,
+    latest_sum REAL NOT NULL DEFAULT 0,
+    at_risk INTEGER NOT NULL DEFAULT 0,
+    n_total INTEGER NOT NULL DEFAULT 0,
+    pos_total INTEGER NOT NULL DEFAULT 0,
+    {_STAT_COLUMNS}
+) WITHOUT ROWID;
+"""
+
+# pen_stats column -> cow_stats expression it sums.
+_PEN_TERMS = dict(
+    {"cows": "1", "scored": "{r}.latest_ts IS NOT NULL", "latest_sum": "COALESCE({r}.latest_score, 0)",
+     "at_risk": "{r}.at_risk", "n_total": "{r}.n_total", "pos_total": "{r}.pos_total"},
+    **{c: "{r}." + c for c in _WINDOW_COLUMNS},
+)
+
+
+def _pen_delta(sign, row):
+    sets = ", ".join(f"{col} = {col} {sign} ({expr.format(r=row)})" for col, expr in _PEN_TERMS.items())
+    return f"UPDATE pen_stats SET {sets} WHERE pen = {row}.pen;"
+
+
+# Not INSERT OR IGNORE: inside a trigger the outer statement's conflict
+# policy (here the upsert's) overrides it.
+_NEW_PEN = "INSERT INTO pen_stats (pen) SELECT NEW.pen WHERE NOT EXISTS (SELECT 1 FROM pen_stats WHERE pen = NEW.pen);"
+
+TRIGGERS = f"""
+CREATE TRIGGER IF NOT EXISTS cow_stats_insert AFTER INSERT ON cow_stats BEGIN
+    {_NEW_PEN}
+    {_pen_delta("+", "NEW")}
+END;
+CREATE TRIGGER IF NOT EXISTS cow_stats_update AFTER UPDATE ON cow_stats BEGIN
+    {_pen_delta("-", "OLD")}
+    {_NEW_PEN}
+    {_pen_delta("+", "NEW")}
+END;
+"""
+
+
+def day_ordinal(ts):
+    return date.fromtimestamp(ts).toordinal()
+
+
+def _meta(conn, key, default=None):
+    row = conn.execute("SELECT value FROM herd_meta WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT INTO herd_meta (key, value) VALUES (?, ?) "
+                 "ON CONFLICT(key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+
+# ---------------- INCREMENTAL UPDATES ----------------
+# Everything below runs on the history writer thread, inside its transaction.
+def create(conn, threshold=HYBRID_THRESHOLD):
+    # Returns True when the aggregates must be rebuilt from the predictions
+    # table: a history DB that predates them, or a changed threshold.
+    conn.executescript(SCHEMA + TRIGGERS)
+    return _meta(conn, "version") != SCHEMA_VERSION or float(_meta(conn, "threshold", "nan")) != threshold
+
+
+def _advance(conn, old, new):
+    # Moves the windows from day `old` to day `new`: buckets that are now
+    # older than each window are subtracted from the cows they belong to.
+    for w in WINDOWS:
+        n, s, p = f"n{w}", f"sum{w}", f"pos{w}"
+        if new - old >= w:
+            conn.execute(f"UPDATE cow_stats SET {n} = 0, {s} = 0, {p} = 0 WHERE {n} != 0")
+            continue
+        conn.execute(
+            f"UPDATE cow_stats SET {n} = {n} - d.n, {p} = {p} - d.positives, "
+            f"{s} = CASE WHEN {n} = d.n THEN 0 ELSE {s} - d.total END "
+            f"FROM (SELECT cow_id, SUM(n) AS n, SUM(total) AS total, SUM(positives) AS positives "
+            f"      FROM cow_daily WHERE day > ? AND day <= ? GROUP BY cow_id) AS d "
+            f"WHERE cow_stats.cow_id = d.cow_id",
+            (old - w, new - w),
+        )
+    _set_meta(conn, "as_of", new)
+
+
+def advance_to(conn, day=None):
+    day = date.today().toordinal() if day is None else day
+    as_of = int(_meta(conn, "as_of", 0))
+    if day > as_of:
+        _advance(conn, as_of, day)
+
+
+_UPSERT_COW = f"""
+INSERT INTO cow_stats (cow_id, pen, n_total, pos_total, latest_score, latest_ts, at_risk, {", ".join(_WINDOW_COLUMNS)})
+VALUES (?, COALESCE((SELECT pen FROM cow_pens WHERE cow_id = ?), ''), 1, ?, ?, ?, ?, {", ".join("?" * len(_WINDOW_COLUMNS))})
+ON CONFLICT(cow_id) DO UPDATE SET
+    n_total = n_total + 1,
+    pos_total = pos_total + excluded.pos_total,
+    latest_score = CASE WHEN latest_ts IS NULL OR excluded.latest_ts >= latest_ts
+                        THEN excluded.latest_score ELSE latest_score END,
+    at_risk = CASE WHEN latest_ts IS NULL OR excluded.latest_ts >= latest_ts
+                   THEN excluded.at_risk ELSE at_risk END,
+    latest_ts = MAX(COALESCE(latest_ts, excluded.latest_ts), excluded.latest_ts),
+    {", ".join(f"{c} = {c} + excluded.{c}" for c in _WINDOW_COLUMNS)}
+"""
+
+
+def update(conn, rows, threshold=HYBRID_THRESHOLD):
+    # rows: (cow_id, ts, source, image_p, symptom_p, hybrid_p, ...) as
+    # inserted into predictions. Only hybrid rows with a cow ID count; the
+    # cost is a few keyed upserts per row, whatever the history size.
+    as_of = None
+    for cow_id, ts, source, _, _, score, *_ in rows:
+        if source != "hybrid" or not cow_id or score is None:
+            continue
+        if as_of is None:
+            as_of = int(_meta(conn, "as_of", 0))
+        day = day_ordinal(ts)
+        if day > as_of:
+            _advance(conn, as_of, day)
+            as_of = day
+        positive = int(score > threshold)
+        conn.execute("INSERT INTO cow_daily VALUES (?, ?, 1, ?, ?) ON CONFLICT(cow_id, day) DO UPDATE SET "
+                     "n = n + 1, total = total + excluded.total, positives = positives + excluded.positives",
+                     (cow_id, day, score, positive))
+        conn.execute("INSERT INTO herd_daily VALUES (?, 1, ?, ?) ON CONFLICT(day) DO UPDATE SET "
+                     "n = n + 1, total = total + excluded.total, positives = positives + excluded.positives",
+                     (day, score, positive))
+        window = []
+        for w in WINDOWS:
+            inside = day > as_of - w
+            window += [int(inside), score if inside else 0.0, positive if inside else 0]
+        conn.execute(_UPSERT_COW, (cow_id, cow_id, positive, score, ts, positive, *window))
+
+
+def assign_pens(conn, pens):
+    # pens: {cow_id: pen}. Cows not seen yet get an empty stats row so the
+    # pen's head count is right; the triggers move each cow's sums between
+    # pens.
+    conn.executemany("INSERT INTO cow_pens VALUES (?, ?) ON CONFLICT(cow_id) DO UPDATE SET pen = excluded.pen",
+                     pens.items())
+    conn.executemany("INSERT INTO cow_stats (cow_id, pen) VALUES (?, ?) "
+                     "ON CONFLICT(cow_id) DO UPDATE SET pen = excluded.pen WHERE pen != excluded.pen",
+                     pens.items())
+
+
+def rebuild(conn, threshold=HYBRID_THRESHOLD, batch=10000):
+    # Replays every hybrid prediction in time order; only needed once for a
+    # history DB that predates the aggregates or after a threshold change.
+    for table in ("cow_daily", "herd_daily", "cow_stats", "pen_stats"):
+        conn.execute(f"DELETE FROM {table}")
+    _set_meta(conn, "as_of", 0)
+    conn.execute("INSERT INTO cow_stats (cow_id, pen) SELECT cow_id, pen FROM cow_pens")
+    cursor = conn.execute("SELECT cow_id, ts, source, image_probability, symptom_probability, hybrid_probability "
+                          "FROM predictions WHERE source = 'hybrid' AND cow_id != '' ORDER BY ts")
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            break
+        update(conn, rows, threshold)
+    advance_to(conn)
+    _set_meta(conn, "threshold", threshold)
+    _set_meta(conn, "version", SCHEMA_VERSION)
+
+
+# ---------------- DASHBOARD QUERIES ----------------
+# Read-only; each touches the pen table, one index range or at most
+# TREND_DAYS daily rows, so cost does not grow with the history.
+def as_of(conn):
+    return int(_meta(conn, "as_of", 0))
+
+
+def _mean(total, n):
+    return total / n if n else None
+
+
+def pen_table(conn):
+    cols = ["pen", "cows", "scored", "latest_sum", "at_risk"] + _WINDOW_COLUMNS
+    rows = conn.execute(f"SELECT {', '.join(cols)} FROM pen_stats WHERE cows > 0 ORDER BY pen").fetchall()
+    out = []
+    for row in rows:
+        r = dict(zip(cols, row))
+        out.append({
+            "pen": r["pen"], "cows": r["cows"], "at_risk": r["at_risk"],
+            "mean_latest": _mean(r["latest_sum"], r["scored"]),
+            **{f"ma{w}": _mean(r[f"sum{w}"], r[f"n{w}"]) for w in WINDOWS},
+            **{f"positives{w}": r[f"pos{w}"] for w in WINDOWS},
+        })
+    return out
+
+
+def herd_summary(conn):
+    # Herd totals are the sum of the (few) pen rows.
+    totals = conn.execute(f"SELECT COALESCE(SUM(cows), 0), COALESCE(SUM(scored), 0), COALESCE(SUM(latest_sum), 0), "
+                          f"COALESCE(SUM(at_risk), 0), {', '.join(f'COALESCE(SUM({c}), 0)' for c in _WINDOW_COLUMNS)} "
+                          f"FROM pen_stats").fetchone()
+    r = dict(zip(["cows", "scored", "latest_sum", "at_risk"] + _WINDOW_COLUMNS, totals))
+    return {
+        "cows": r["cows"], "scored": r["scored"], "at_risk": r["at_risk"],
+        "mean_latest": _mean(r["latest_sum"], r["scored"]),
+        **{f"ma{w}": _mean(r[f"sum{w}"], r[f"n{w}"]) for w in WINDOWS},
+        **{f"positives{w}": r[f"pos{w}"] for w in WINDOWS},
+    }
+
+
+def cows_at_risk(conn, threshold=HYBRID_THRESHOLD, limit=200, pen=None):
+    # Highest latest score first, read off idx_cow_stats_latest (or the pen
+    # index) and stopping after `limit` rows.
+    cols = ["cow_id", "pen", "latest_score", "latest_ts", "n_total", "pos_total"] + _WINDOW_COLUMNS
+    where, params = "latest_score > ?", [threshold]
+    if pen is not None:
+        where, params = "pen = ? AND " + where, [pen] + params
+    rows = conn.execute(f"SELECT {', '.join(cols)} FROM cow_stats WHERE {where} ORDER BY latest_score DESC LIMIT ?",
+                        params + [limit]).fetchall()
+    out = []
+    for row in rows:
+        r = dict(zip(cols, row))
+        out.append({
+            "cow_id": r["cow_id"], "pen": r["pen"], "latest": r["latest_score"], "latest_ts": r["latest_ts"],
+            **{f"ma{w}": _mean(r[f"sum{w}"], r[f"n{w}"]) for w in WINDOWS},
+            **{f"positives{w}": r[f"pos{w}"] for w in WINDOWS},
+            "predictions": r["n_total"], "positives": r["pos_total"],
+        })
+    return out
+
+
+def trend(conn, cow_id=None, days=TREND_DAYS):
+    # Daily (date, predictions, mean score, positives) for the herd or one
+    # cow over the last `days` days up to as_of.
+    end = as_of(conn)
+    if cow_id is None:
+        rows = conn.execute("SELECT day, n, total, positives FROM herd_daily WHERE day > ? AND day <= ? ORDER BY day",
+                            (end - days, end)).fetchall()
+    else:
+        rows = conn.execute("SELECT day, n, total, positives FROM cow_daily WHERE cow_id = ? AND day > ? AND day <= ? "
+                            "ORDER BY day", (cow_id, end - days, end)).fetchall()
+    return [(date.fromordinal(d), n, total / n, p) for d, n, total, p in rows]
+
+
+def latest_predictions(conn):
+    # The latest hybrid prediction of every scored cow, in cow ID order, for
+    # the herd PDF report. Rows are yielded as they are read so the report
+    # streams them; each is one keyed lookup in idx_predictions_cow_ts.
+    cols = ["cow_id", "pen", "image_probability", "symptom_probability", "hybrid_probability", "result",
+            "symptom_mask"]
+    cursor = conn.execute(
+        "SELECT s.cow_id, s.pen, p.image_probability, p.symptom_probability, p.hybrid_probability, p.result, "
+        "p.symptom_mask FROM cow_stats AS s JOIN predictions AS p INDEXED BY idx_predictions_cow_ts "
+        "ON p.cow_id = s.cow_id AND p.ts = s.latest_ts AND p.source = 'hybrid' "
+        "WHERE s.latest_ts IS NOT NULL GROUP BY s.cow_id ORDER BY s.cow_id")
+    for row in cursor:
+        yield dict(zip(cols, row))
+
+
+def read_pens_csv(path_or_file):
+    # Herd roster: a CSV with cow_id and pen columns.
+    f = open(path_or_file, newline="") if isinstance(path_or_file, str) else path_or_file
+    try:
+        reader = csv.DictReader(f)
+        missing = {"cow_id", "pen"} - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(f"Roster CSV is missing column(s): {', '.join(sorted(missing))}")
+        return {row["cow_id"].strip(): row["pen"].strip() for row in reader if row["cow_id"].strip()}
+    finally:
+        if isinstance(path_or_file, str):
+            f.close()
+
+
+# ---------------- BENCHMARK ----------------
+def run_benchmark(rows, cows=2000, pens=20, steps=4, repeats=20):
+    # Inserts synthetic hybrid history in `steps` equal chunks and times the
+    # dashboard queries after each, to show they stay flat as history grows.
+    import os
+    import tempfile
+    from contextlib import closing
+
+    from history_store import HistoryStore, open_reader, _synthetic_rows
+
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        store = HistoryStore(path)
+        store.submit(lambda conn: assign_pens(conn, {f"COW-{c:05d}": f"Pen {c % pens + 1:02d}"
+                                                      for c in range(cows)}))
+        source = _synthetic_rows(rows, cows)
+        per_step = rows // steps
+        print(f"{'history rows':>12} {'insert rows/s':>14} {'dashboard ms':>13}")
+        for step in range(1, steps + 1):
+            start = time.perf_counter()
+            store.record_many(next(source) for _ in range(per_step))
+            store.flush()
+            insert_rate = per_step / (time.perf_counter() - start)
+            with closing(open_reader(path)) as conn:
+                start = time.perf_counter()
+                for _ in range(repeats):
+                    herd_summary(conn)
+                    pen_table(conn)
+                    cows_at_risk(conn)
+                    trend(conn)
+                ms = (time.perf_counter() - start) * 1000.0 / repeats
+            print(f"{step * per_step:12d} {insert_rate:14,.0f} {ms:13.2f}")
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Materialized herd risk aggregates over the prediction history.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    pens = sub.add_parser("pens", help="Load a cow_id,pen roster CSV")
+    pens.add_argument("roster")
+    sub.add_parser("rebuild", help="Recompute every aggregate from the predictions table")
+
+    bench = sub.add_parser("bench", help="Dashboard query time as a synthetic history grows (temp DB)")
+    bench.add_argument("--rows", type=int, default=400_000)
+    bench.add_argument("--cows", type=int, default=2000)
+    bench.add_argument("--steps", type=int, default=4)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "bench":
+        run_benchmark(args.rows, args.cows, steps=args.steps)
+        return 0
+
+    from history_store import get_history_store
+
+    store = get_history_store()
+    if args.command == "pens":
+        roster = read_pens_csv(args.roster)
+        store.submit(lambda conn: assign_pens(conn, roster))
+        print(f"Assigned {len(roster)} cow(s) to pens")
+    else:
+        store.submit(rebuild)
+    store.flush()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
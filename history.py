@@ -0,0 +1,125 @@
+import streamlit as st
+from datetime import datetime, time as dtime, timedelta
+
+from history_store import read_page, HISTORY_DB, PAGE_SIZE, SOURCES
+
+# ---------------- PAGE CONFIG ----------------
+st.set_page_config(
+    page_title="Prediction History",
+    layout="wide",
+    page_icon="📜"
+)
+
+# ---------------- CUSTOM CSS ----------------
+st.markdown("""
+<style>
+.stApp {
+    background-image: url("https://images.unsplash.com/photo-1478760329108-5c3ed9d495a0?q=80&w=1074&auto=format&fit=crop");
+    background-size: cover;
+    background-position: center;
+    background-attachment: fixed;
+}
+
+.title-text {
+    text-align: center;
+    font-size: 40px;
+    font-weight: 700;
+    color: white;
+}
+
+.subtitle {
+    text-align: center;
+    font-size: 18px;
+    color: #e5e7eb;
+    margin-bottom: 30px;
+}
+</style>
+""", unsafe_allow_html=True)
+
+# ---------------- HEADER ----------------
+st.markdown("""
+<div style="text-align: left; margin-bottom: 20px;">
+    <a href="../app" style="
+        background-color: #2563eb;
+        color: white;
+        padding: 8px 20px;
+        border-radius: 8px;
+        text-decoration: none;
+        font-size: 16px;
+        font-weight: 600;
+        transition: all 0.25s ease-in-out;
+    "
+    onmouseover="this.style.backgroundColor='#1d4ed8'"
+    onmouseout="this.style.backgroundColor='#2563eb'">
+        ⬅ Home
+    </a>
+</div>
+""", unsafe_allow_html=True)
+
+st.markdown('<div class="title-text">📜 Prediction History</div>', unsafe_allow_html=True)
+st.markdown('<div class="subtitle">Every image, symptom, hybrid, batch and video prediction, newest first</div>',
+            unsafe_allow_html=True)
+
+symptoms_labels = ["Redness in Udder", "Swelling", "Hardness", "Fever", "Low Milk Yield", "Clots in Milk"]
+
+# ---------------- FILTERS ----------------
+cols = st.columns([2, 1, 1, 1, 1])
+cow_filter = cols[0].text_input("🐄 Cow ID", placeholder="All cows").strip()
+source_filter = cols[1].selectbox("Source", ["All"] + list(SOURCES))
+source_filter = None if source_filter == "All" else source_filter
+date_from = cols[2].date_input("From", value=None)
+date_to = cols[3].date_input("To", value=None)
+page_size = cols[4].selectbox("Rows per page", [25, PAGE_SIZE, 100, 200], index=1)
+
+start = datetime.combine(date_from, dtime.min).timestamp() if date_from else None
+end = datetime.combine(date_to + timedelta(days=1), dtime.min).timestamp() if date_to else None
+
+# ---------------- KEYSET PAGING ----------------
+# Pages are addressed by the (timestamp, id) of the last row shown, never by
+# OFFSET, so page 10,000 costs the same as page 1. The cursors of the pages
+# already visited are kept so "Previous" can step back.
+filters = (cow_filter, source_filter, start, end, page_size)
+if st.session_state.get("history_filters") != filters:
+    st.session_state.history_filters = filters
+    st.session_state.history_cursors = [None]
+cursors = st.session_state.history_cursors
+
+rows, next_cursor = read_page(HISTORY_DB, cow_id=cow_filter or None, start=start, end=end,
+                              before=cursors[-1], limit=page_size, source=source_filter)
+
+if not rows:
+    st.info("No predictions recorded yet." if len(cursors) == 1 and not any(filters[:4])
+            else "No predictions match these filters.")
+else:
+    def percent(p):
+        return None if p is None else round(p * 100, 2)
+
+    def symptom_names(mask):
+        if mask is None:
+            return ""
+        return ", ".join(label for i, label in enumerate(symptoms_labels) if mask >> i & 1)
+
+    st.dataframe(
+        [{
+            "Time": datetime.fromtimestamp(r["ts"]).strftime("%d-%m-%Y %H:%M:%S"),
+            "Cow ID": r["cow_id"] or "-",
+            "Source": r["source"],
+            "Result": r["result"],
+            "Image (%)": percent(r["image_probability"]),
+            "Symptoms (%)": percent(r["symptom_probability"]),
+            "Hybrid (%)": percent(r["hybrid_probability"]),
+            "Symptoms": symptom_names(r["symptom_mask"]),
+            "Image Hash": (r["image_hash"] or "")[:12],
+        } for r in rows],
+        width="stretch",
+        hide_index=True
+    )
+
+nav = st.columns([1, 1, 4])
+if nav[0].button("⬅ Previous", disabled=len(cursors) == 1):
+    cursors.pop()
+    st.rerun()
+if nav[1].button("Next ➡", disabled=next_cursor is None):
+    cursors.append(next_cursor)
+    st.rerun()
+nav[2].caption(f"Page {len(cursors)}")
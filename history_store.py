@@ -0,0 +1,335 @@
+import argparse
+import os
+import queue
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+import herd_stats
+from symptom_lookup import symptom_bitmask
+from tracing import logger
+
+# ---------------- CONFIG ----------------
+HISTORY_DB = os.environ.get("MASTITIS_HISTORY_DB", "prediction_history.db")
+# The writer commits when this many rows are waiting or when the oldest has
+# waited FLUSH_SECONDS, whichever comes first.
+WRITE_BATCH = int(os.environ.get("MASTITIS_HISTORY_BATCH", "500"))
+FLUSH_SECONDS = float(os.environ.get("MASTITIS_HISTORY_FLUSH", "0.5"))
+# Rows held in memory before record() blocks the caller.
+MAX_BUFFER = 100_000
+PAGE_SIZE = 50
+
+SOURCES = ("image", "symptoms", "hybrid", "batch", "video")
+COLUMNS = ("cow_id", "ts", "source", "image_probability", "symptom_probability", "hybrid_probability",
+           "result", "symptom_mask", "image_hash", "decision_path")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    cow_id TEXT NOT NULL,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL,
+    image_probability REAL,
+    symptom_probability REAL,
+    hybrid_probability REAL,
+    result TEXT NOT NULL,
+    symptom_mask INTEGER,
+    image_hash TEXT,
+    decision_path TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_cow_ts ON predictions (cow_id, ts, id);
+CREATE INDEX IF NOT EXISTS idx_predictions_ts ON predictions (ts, id);
+"""
+
+
+def _connect(path):
+    # WAL lets the history page read while the writer commits.
+    conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# ---------------- WRITER ----------------
+class HistoryStore:
+    # record() only appends to an in-memory queue; one writer thread drains
+    # it and inserts whole batches in a single transaction, so pages never
+    # wait on disk and a burst of batch-mode rows costs one commit. The herd
+    # aggregates (herd_stats.py) are updated in the same transaction.
+    def __init__(self, path=HISTORY_DB, write_batch=WRITE_BATCH, flush_seconds=FLUSH_SECONDS,
+                 max_buffer=MAX_BUFFER):
+        self.path = path
+        self.write_batch = write_batch
+        self.flush_seconds = flush_seconds
+        with closing(_connect(path)) as conn:
+            conn.executescript(SCHEMA)
+            stale = herd_stats.create(conn)
+        self._queue = queue.Queue(maxsize=max_buffer)
+        self.counts = {"written": 0, "commits": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+        self._thread.start()
+        if stale:
+            self.submit(herd_stats.rebuild)
+
+    def record(self, source, result, cow_id=None, image_probability=None, symptom_probability=None,
+               hybrid_probability=None, symptoms=None, image_hash=None, decision_path=None, ts=None):
+        if source not in SOURCES:
+            raise ValueError(f"Unknown source {source!r}; expected one of {', '.join(SOURCES)}")
+        self._queue.put((
+            (cow_id or "").strip(),
+            time.time() if ts is None else float(ts),
+            source,
+            None if image_probability is None else float(image_probability),
+            None if symptom_probability is None else float(symptom_probability),
+            None if hybrid_probability is None else float(hybrid_probability),
+            result,
+            None if symptoms is None else symptom_bitmask(symptoms),
+            image_hash,
+            decision_path,
+        ))
+
+    def record_many(self, rows):
+        # rows: tuples in COLUMNS order, for bulk imports and benchmarks.
+        for row in rows:
+            self._queue.put(tuple(row))
+
+    def submit(self, fn):
+        # Runs fn(conn) on the writer thread, in order with the rows recorded
+        # around it and inside the same transaction.
+        self._queue.put(fn)
+
+    def flush(self):
+        # Blocks until every row recorded so far is committed.
+        self._queue.join()
+
+    def _drain(self, first):
+        rows = [first]
+        deadline = time.monotonic() + self.flush_seconds
+        while len(rows) < self.write_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                rows.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _insert(self, conn, rows):
+        if rows:
+            conn.executemany(self._insert_sql, rows)
+            herd_stats.update(conn, rows)
+
+    def _writer(self):
+        conn = _connect(self.path)
+        self._insert_sql = f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        while True:
+            items = self._drain(self._queue.get())
+            rows = [item for item in items if not callable(item)]
+            try:
+                with conn:
+                    pending = []
+                    for item in items:
+                        if callable(item):
+                            self._insert(conn, pending)
+                            pending = []
+                            item(conn)
+                        else:
+                            pending.append(item)
+                    self._insert(conn, pending)
+                self.counts["written"] += len(rows)
+                self.counts["commits"] += 1
+            except Exception as e:
+                # History must never break a prediction, and the writer must
+                # outlive any failure (a bad row, a submitted callable, the
+                # herd aggregates) or flush() would block forever. The batch
+                # is rolled back and lost, and the failure logged.
+                self.counts["failed"] += len(rows)
+                logger.error(f"History write of {len(rows)} row(s) failed: {type(e).__name__}: {e}")
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+
+# ---------------- READ ----------------
+def open_reader(path=HISTORY_DB):
+    # Read-only connection, or None before the first prediction is stored.
+    if not os.path.exists(path):
+        return None
+    return sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30.0)
+
+
+def _where(cow_id, start, end, before, source=None):
+    clauses, params = [], []
+    if cow_id:
+        clauses.append("cow_id = ?")
+        params.append(cow_id)
+    if source:
+        clauses.append("source = ?")
+        params.append(source)
+    if start is not None:
+        clauses.append("ts >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("ts < ?")
+        params.append(end)
+    if before is not None:
+        # Keyset cursor: rows strictly older than the last one shown. The
+        # row value comparison seeks straight into the (.., ts, id) index.
+        clauses.append("(ts, id) < (?, ?)")
+        params.extend(before)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def _page_sql(cow_id, start, end, before, limit, source=None):
+    where, params = _where(cow_id, start, end, before, source)
+    index = "idx_predictions_cow_ts" if cow_id else "idx_predictions_ts"
+    sql = (f"SELECT id, {', '.join(COLUMNS)} FROM predictions INDEXED BY {index}{where} "
+           f"ORDER BY ts DESC, id DESC LIMIT ?")
+    return sql, params + [limit]
+
+
+def read_page(path=HISTORY_DB, cow_id=None, start=None, end=None, before=None, limit=PAGE_SIZE, source=None):
+    # Newest first. Returns (rows as dicts, cursor for the next page or None).
+    # Cost depends on the page size, not on how deep the page is.
+    conn = open_reader(path)
+    if conn is None:
+        return [], None
+    sql, params = _page_sql(cow_id, start, end, before, limit + 1, source)
+    with closing(conn):
+        conn.row_factory = sqlite3.Row
+        rows = [dict(r) for r in conn.execute(sql, params)]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, (rows[-1]["ts"], rows[-1]["id"]) if more else None
+
+
+def query_plan(path=HISTORY_DB, cow_id=None, start=None, end=None, before=None, limit=PAGE_SIZE, source=None):
+    sql, params = _page_sql(cow_id, start, end, before, limit, source)
+    with closing(sqlite3.connect(path)) as conn:
+        return [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+# ---------------- PROCESS-WIDE STORE ----------------
+# One writer per server process, shared by every page and session.
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_history_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = HistoryStore()
+    return _store
+
+
+def record_prediction(source, result, **fields):
+    try:
+        get_history_store().record(source, result, **fields)
+    except (sqlite3.Error, OSError) as e:
+        logger.error(f"Prediction history unavailable: {e}")
+
+
+# ---------------- BENCHMARK ----------------
+def _synthetic_rows(n, cows, seed=0):
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    now = time.time()
+    ts = np.sort(now - rng.random(n) * 365 * 86400)
+    cow = rng.integers(0, cows, n)
+    p = rng.random((n, 3))
+    masks = rng.integers(0, 64, n)
+    for i in range(n):
+        yield (f"COW-{cow[i]:05d}", float(ts[i]), "hybrid", float(p[i, 0]), float(p[i, 1]), float(p[i, 2]),
+               "Mastitis Detected" if p[i, 2] > 0.5 else "Healthy", int(masks[i]), None, "hybrid")
+
+
+def _timed_pages(path, pages, **filters):
+    # Walks `pages` pages from the newest and returns (ms for the first page,
+    # ms for the last one) to show depth does not matter.
+    cursor, times = None, []
+    for _ in range(pages):
+        start = time.perf_counter()
+        rows, cursor = read_page(path, before=cursor, **filters)
+        times.append((time.perf_counter() - start) * 1000.0)
+        if cursor is None:
+            break
+    return times[0], times[-1], len(times)
+
+
+def run_benchmark(rows, cows=2000, pages=200, path=None):
+    own = path is None
+    if own:
+        fd, path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+    try:
+        store = HistoryStore(path)
+        start = time.perf_counter()
+        store.record_many(_synthetic_rows(rows, cows))
+        store.flush()
+        elapsed = time.perf_counter() - start
+        print(f"Inserted {rows} rows in {elapsed:.1f} s ({rows / elapsed:,.0f} rows/s, "
+              f"{store.counts['commits']} commits)")
+
+        with closing(sqlite3.connect(path)) as conn:
+            cow, ts = conn.execute("SELECT cow_id, ts FROM predictions WHERE id = ?", (rows // 2,)).fetchone()
+        cases = [
+            ("all rows", {}),
+            ("one cow", {"cow_id": cow}),
+            ("30-day window", {"start": ts - 30 * 86400, "end": ts}),
+            ("cow + 30 days", {"cow_id": cow, "start": ts - 30 * 86400, "end": ts}),
+        ]
+        print(f"\n{'filter':<16} {'first ms':>9} {'last ms':>9} {'pages':>6}  plan")
+        for name, filters in cases:
+            first, last, walked = _timed_pages(path, pages, **filters)
+            plan = "; ".join(query_plan(path, before=(ts, rows), **filters))
+            print(f"{name:<16} {first:9.2f} {last:9.2f} {walked:6d}  {plan}")
+    finally:
+        if own:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Prediction history store (SQLite).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    show = sub.add_parser("show", help="Print the newest predictions")
+    show.add_argument("--db", default=HISTORY_DB)
+    show.add_argument("--cow", default=None)
+    show.add_argument("--source", choices=SOURCES, default=None)
+    show.add_argument("--limit", type=int, default=20)
+
+    bench = sub.add_parser("bench", help="Bulk-insert synthetic rows into a temp DB and time keyset paging")
+    bench.add_argument("--rows", type=int, default=1_000_000)
+    bench.add_argument("--cows", type=int, default=2000)
+    bench.add_argument("--pages", type=int, default=200, help="Pages walked per filter")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "bench":
+        run_benchmark(args.rows, args.cows, args.pages)
+        return 0
+    rows, _ = read_page(args.db, cow_id=args.cow, limit=args.limit, source=args.source)
+    for r in rows:
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(r["ts"]))
+        prob = r["hybrid_probability"] if r["hybrid_probability"] is not None else \
+            r["image_probability"] if r["image_probability"] is not None else r["symptom_probability"]
+        print(f"{stamp}  {r['cow_id'] or '-':<12} {r['source']:<9} {prob:6.3f}  {r['result']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,14 @@
 import streamlit as st
-import tensorflow as tf
-import numpy as np
-from PIL import Image
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.pagesizes import A4
-from io import BytesIO
-from datetime import datetime
-import time
+
+from model_registry import get_cnn_model, get_symptom_lookup, cnn_input_shape, model_version, CNN_MODEL_PATH
+from prediction_cache import cnn_cache, image_key, render_cache_caption
+from upload_state import get_decoded_upload
+from inference import (fuse_predictions, hybrid_label, cascade_skips_image, HYBRID_THRESHOLD, CASCADE,
+                       PATH_HYBRID, PATH_SYMPTOMS_ONLY, PATH_LABELS)
+from reports import generate_hybrid_report
+from history_store import record_prediction
+from quality_gate import gate_stats, render_gate_caption
+from tracing import Trace, render_trace, demo_delay
 
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(
@@ -153,15 +154,22 @@ st.markdown("""
 st.markdown('<div class="title-text">🔀 Hybrid Mastitis Detection</div>', unsafe_allow_html=True)
 st.markdown('<div class="subtitle">Detect mastitis using both image and symptom inputs</div>', unsafe_allow_html=True)
 
-# ---------------- LOAD MODELS ----------------
-cnn_model = tf.keras.models.load_model("final_cnn_model1.h5")
-symptom_model = tf.keras.models.load_model("symptom1_model.h5")
-
 # ---------------- IMAGE UPLOAD ----------------
+cow_id = st.text_input("🐄 Cow ID (optional)", key="cow_id")
 uploaded = st.file_uploader("📤 Upload Udder Image", type=["jpg", "jpeg", "png"])
+trace = Trace("hybrid")
+if uploaded:
+    try:
+        upload = get_decoded_upload(st.session_state, uploaded, cnn_input_shape(), trace)
+    except ValueError as e:
+        # preprocessing.ImageTooLarge: past the pixel or decode-memory cap.
+        st.error(f"❌ {e}. Please upload a smaller photo.")
+        uploaded = None
 if uploaded:
-    img = Image.open(uploaded)
-    st.image(img, caption="Uploaded Image", use_column_width=True)
+    st.image(upload.thumbnail, caption="Uploaded Image", width="stretch")
+    if upload.quality.issues:
+        st.warning(f"📷 Photo quality: {upload.quality.message()}. Retake the photo in good light, "
+                   f"holding the camera steady and close to the udder.")
 
 # ---------------- SYMPTOMS CHECKBOXES ----------------
 st.subheader("✔ Select Observed Symptoms")
@@ -172,78 +180,63 @@ for i, label in enumerate(symptoms_labels):
     with cols[i % 3]:
         symptoms.append(st.checkbox(label, key=f"s{i}"))
 
-# ---------------- IMAGE PREPROCESS ----------------
-def preprocess_image(img, model_input_shape):
-    img = img.resize((model_input_shape[1], model_input_shape[2]))
-    channels = model_input_shape[-1]
-    if channels == 1:
-        img = img.convert("L")
-        arr = np.array(img)/255.0
-        arr = arr.reshape(1, model_input_shape[1], model_input_shape[2], 1)
-    elif channels == 3:
-        img = img.convert("RGB")
-        arr = np.array(img)/255.0
-        arr = arr.reshape(1, model_input_shape[1], model_input_shape[2], 3)
-    else:
-        raise ValueError(f"Unsupported channels: {channels}")
-    return arr
-
-# ---------------- PDF REPORT ----------------
-def generate_pdf_report(final_result, img_pred, sym_pred, final_pred, selected_symptoms):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    content = []
-    
-    content.append(Paragraph("<b>Hybrid Mastitis Detection Report</b>", styles["Title"]))
-    content.append(Spacer(1,20))
-    content.append(Paragraph(f"<b>Image-Based Prediction:</b> {img_pred*100:.2f}%", styles["Normal"]))
-    content.append(Paragraph(f"<b>Symptoms-Based Prediction:</b> {sym_pred*100:.2f}%", styles["Normal"]))
-    content.append(Paragraph(f"<b>Hybrid Prediction:</b> {final_pred*100:.2f}%", styles["Normal"]))
-    content.append(Spacer(1,10))
-    content.append(Paragraph(f"<b>Final Result:</b> {final_result}", styles["Normal"]))
-    content.append(Spacer(1,10))
-    
-    if selected_symptoms:
-        content.append(Paragraph("<b>Observed Symptoms:</b>", styles["Normal"]))
-        for sym in selected_symptoms:
-            content.append(Paragraph(f"- {sym}", styles["Normal"]))
-    else:
-        content.append(Paragraph("<b>Observed Symptoms:</b> None", styles["Normal"]))
-    
-    content.append(Spacer(1,10))
-    content.append(Paragraph(f"<b>Date & Time:</b> {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}", styles["Normal"]))
-    doc.build(content)
-    buffer.seek(0)
-    return buffer
 # ---------------- PREDICTION ----------------
 if st.button("🔍 Predict"):
     if uploaded is None or not any(symptoms):
         st.warning("⚠ Hybrid prediction requires BOTH an uploaded image and at least one selected symptom.")
+    elif upload.quality.rejected:
+        # Neither model is called for a photo that failed the quality gate.
+        gate_stats.add([upload.quality])
+        st.error(f"❌ Photo rejected: {upload.quality.message()}. Please upload a clearer photo.")
+        trace.log(quality_issues=upload.quality.issues)
+        render_gate_caption()
     else:
+        gate_stats.add([upload.quality])
         with st.spinner("Analyzing inputs..."):
-            time.sleep(1.5)
+            demo_delay(1.5)
             try:
-                # Image prediction
-                img_arr = preprocess_image(img, cnn_model.input_shape)
-                img_pred = cnn_model.predict(img_arr)[0][0]
-                
-                # Symptom prediction
-                sym_arr = np.array(symptoms, dtype=int).reshape(1,6)
-                sym_pred = symptom_model.predict(sym_arr)[0][0]
-
-                # Hybrid prediction
-                final_pred = (img_pred + sym_pred)/2
-                final_result = "⚠ Mastitis Detected" if final_pred>0.5 else "✅ Healthy Cow"
+                # Models are loaded on the first prediction rather than when
+                # the page opens.
+                symptom_lookup = get_symptom_lookup()
+
+                # Symptom prediction (first, so the cascade can skip the CNN)
+                with trace.stage("symptom_inference"):
+                    sym_pred = symptom_lookup.predict(symptoms)
+                decision_path = PATH_SYMPTOMS_ONLY if CASCADE and cascade_skips_image(sym_pred) else PATH_HYBRID
+
+                cache_hit = False
+                if decision_path == PATH_SYMPTOMS_ONLY:
+                    img_pred = None
+                    final_pred = sym_pred
+                else:
+                    # Image prediction
+                    with trace.stage("cache_lookup"):
+                        cache_key = image_key(upload.digest, model_version(CNN_MODEL_PATH))
+                        img_pred = cnn_cache.get(cache_key)
+                    cache_hit = img_pred is not None
+                    if not cache_hit:
+                        with trace.stage("cnn_inference"):
+                            img_pred = float(get_cnn_model().predict(upload.tensor)[0][0])
+                        cnn_cache.put(cache_key, img_pred)
+
+                    # Hybrid prediction
+                    with trace.stage("fusion"):
+                        final_pred = fuse_predictions(img_pred, sym_pred)
+                final_result = hybrid_label(final_pred)
 
                 # Display predictions
                 st.markdown("### 🔎 Prediction Probabilities")
-                st.write(f"Image-based: {img_pred*100:.2f}%")
+                if img_pred is None:
+                    st.write("Image-based: skipped (symptoms conclusive)")
+                else:
+                    st.write(f"Image-based: {img_pred*100:.2f}%")
                 st.write(f"Symptoms-based: {sym_pred*100:.2f}%")
                 st.write(f"Hybrid: {final_pred*100:.2f}%")
+                if CASCADE:
+                    st.caption(f"Decision path: {PATH_LABELS[decision_path]}")
                 
                 # Info box
-                if final_pred>0.5:
+                if final_pred>HYBRID_THRESHOLD:
                     st.error(f"{final_result} (Hybrid Result)")
                     info_text = "Immediate veterinary consultation is advised."
                 else:
@@ -258,7 +251,9 @@ if st.button("🔍 Predict"):
 
                 # PDF download
                 selected_symptoms = [symptoms_labels[i] for i,val in enumerate(symptoms) if val]
-                pdf = generate_pdf_report(final_result, img_pred, sym_pred, final_pred, selected_symptoms)
+                with trace.stage("pdf"):
+                    pdf = generate_hybrid_report(final_result, img_pred, sym_pred, final_pred, selected_symptoms,
+                                                 PATH_LABELS[decision_path] if CASCADE else None)
                 st.download_button(
                     label="📄 Download Report",
                     data=pdf,
@@ -266,6 +261,18 @@ if st.button("🔍 Predict"):
                     mime="application/pdf"
                 )
 
+                record_prediction("hybrid", final_result, cow_id=cow_id, image_probability=img_pred,
+                                  symptom_probability=sym_pred, hybrid_probability=final_pred, symptoms=symptoms,
+                                  image_hash=upload.digest, decision_path=decision_path)
+                trace.log(image_probability=img_pred, symptom_probability=sym_pred,
+                          hybrid_probability=final_pred, cnn_cache_hit=cache_hit, decision_path=decision_path,
+                          quality_issues=upload.quality.issues)
+                render_trace(trace)
+                if cache_hit:
+                    st.caption("⚡ Image prediction reused from the prediction cache.")
+                render_cache_caption()
+                render_gate_caption()
+
             except Exception as e:
                 st.error(f"Prediction failed: {e}")
 
@@ -1,14 +1,20 @@
 import streamlit as st
-import tensorflow as tf
 import numpy as np
-from PIL import Image
-import time
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.pagesizes import A4
-from io import BytesIO
 from datetime import datetime
 
+# TensorFlow, Pillow, pandas and reportlab are imported on first use (model
+# load, upload, batch scoring, report), so opening the page stays cheap.
+from model_registry import get_cnn_model, cnn_input_shape, model_version, CNN_MODEL_PATH
+from prediction_cache import cnn_cache, image_digest, image_key, render_cache_caption
+from upload_state import get_decoded_upload
+from inference import predict_batch, BATCH_CHUNK_SIZE
+from video_ingest import VIDEO_TYPES, SAMPLE_FPS, TOP_K, score_video, video_duration
+from job_queue import get_job_queue, render_job, session_id, QueueFull
+from reports import generate_image_report
+from history_store import record_prediction
+from quality_gate import check_batch, decode_failure, gate_stats, render_gate_caption
+from tracing import Trace, render_trace, demo_delay
+
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(
     page_title="Mastitis Detection",
@@ -114,80 +120,51 @@ st.markdown("""
 st.markdown('<div class="title-text">🖼 Image-Based Mastitis Detection</div>', unsafe_allow_html=True)
 st.markdown('<div class="subtitle">Detect mastitis from udder images using CNN model</div>', unsafe_allow_html=True)
 
-# ---------------- LOAD MODEL ----------------
-model = tf.keras.models.load_model("final_cnn_model1.h5")
-
-# ---------------- IMAGE PREPROCESS ----------------
-def preprocess_image(img, model_input_shape):
-    img = img.resize((model_input_shape[1], model_input_shape[2]))
-    channels = model_input_shape[-1]
-
-    if channels == 1:
-        img = img.convert("L")
-        arr = np.array(img) / 255.0
-        arr = arr.reshape(1, model_input_shape[1], model_input_shape[2], 1)
-    else:
-        img = img.convert("RGB")
-        arr = np.array(img) / 255.0
-        arr = arr.reshape(1, model_input_shape[1], model_input_shape[2], 3)
-
-    return arr
-
-# ---------------- PDF REPORT ----------------
-def generate_pdf_report(result, confidence):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    content = []
-
-    content.append(Paragraph("<b>Mastitis Detection Report</b>", styles["Title"]))
-    content.append(Spacer(1, 20))
-
-    content.append(Paragraph("<b>Detection Type:</b> Image-Based Detection", styles["Normal"]))
-    content.append(Spacer(1, 10))
-
-    content.append(Paragraph(f"<b>Prediction Result:</b> {result}", styles["Normal"]))
-    content.append(Spacer(1, 10))
-
-    content.append(Paragraph(f"<b>Confidence:</b> {confidence:.2f}%", styles["Normal"]))
-    content.append(Spacer(1, 10))
-
-    content.append(Paragraph(
-        "<b>Recommendation:</b> Please consult a veterinary professional for confirmation and treatment.",
-        styles["Normal"]
-    ))
-    content.append(Spacer(1, 10))
-
-    content.append(Paragraph(
-        f"<b>Date & Time:</b> {datetime.now().strftime('%d-%m-%Y %H:%M:%S')}",
-        styles["Normal"]
-    ))
-
-    doc.build(content)
-    buffer.seek(0)
-    return buffer
-
 # ---------------- IMAGE UPLOAD ----------------
+cow_id = st.text_input("🐄 Cow ID (optional)", key="cow_id")
 uploaded = st.file_uploader(
     "📤 Upload Udder Image",
     type=["jpg", "jpeg", "png"]
 )
 
+trace = Trace("image")
+if uploaded:
+    try:
+        upload = get_decoded_upload(st.session_state, uploaded, cnn_input_shape(), trace)
+    except ValueError as e:
+        # preprocessing.ImageTooLarge: past the pixel or decode-memory cap.
+        st.error(f"❌ {e}. Please upload a smaller photo.")
+        uploaded = None
 if uploaded:
-    img = Image.open(uploaded)
-    st.image(img, caption="Uploaded Image", use_column_width=True)
+    st.image(upload.thumbnail, caption="Uploaded Image", width="stretch")
+    if upload.quality.issues:
+        st.warning(f"📷 Photo quality: {upload.quality.message()}. Retake the photo in good light, "
+                   f"holding the camera steady and close to the udder.")
 
 # ---------------- PREDICTION ----------------
 if st.button("🔍 Predict"):
     if uploaded is None:
         st.warning("Please upload an image first.")
+    elif upload.quality.rejected:
+        # The CNN is never called for a photo that failed the quality gate.
+        gate_stats.add([upload.quality])
+        st.error(f"❌ Photo rejected: {upload.quality.message()}. Please upload a clearer photo.")
+        trace.log(quality_issues=upload.quality.issues)
+        render_gate_caption()
     else:
+        gate_stats.add([upload.quality])
         with st.spinner("Analyzing image using CNN model..."):
-            time.sleep(1.5)
+            demo_delay(1.5)
 
             try:
-                arr = preprocess_image(img, model.input_shape)
-                pred = model.predict(arr)[0][0]
+                with trace.stage("cache_lookup"):
+                    cache_key = image_key(upload.digest, model_version(CNN_MODEL_PATH))
+                    pred = cnn_cache.get(cache_key)
+                cache_hit = pred is not None
+                if not cache_hit:
+                    with trace.stage("cnn_inference"):
+                        pred = float(get_cnn_model().predict(upload.tensor)[0][0])
+                    cnn_cache.put(cache_key, pred)
 
                 mastitis_conf = pred * 100
                 healthy_conf = (1 - pred) * 100
@@ -209,7 +186,8 @@ if st.button("🔍 Predict"):
                     </div>
                     """, unsafe_allow_html=True)
 
-                    pdf = generate_pdf_report("Mastitis Detected", mastitis_conf)
+                    with trace.stage("pdf"):
+                        pdf = generate_image_report("Mastitis Detected", mastitis_conf)
 
                 else:
                     st.progress(int(healthy_conf))
@@ -225,7 +203,8 @@ if st.button("🔍 Predict"):
                     </div>
                     """, unsafe_allow_html=True)
 
-                    pdf = generate_pdf_report("Healthy Udder", healthy_conf)
+                    with trace.stage("pdf"):
+                        pdf = generate_image_report("Healthy Udder", healthy_conf)
 
                 st.download_button(
                     label="📄 Download Report",
@@ -234,7 +213,226 @@ if st.button("🔍 Predict"):
                     mime="application/pdf"
                 )
 
+                record_prediction("image", "Mastitis Detected" if pred > 0.5 else "Healthy Udder", cow_id=cow_id,
+                                  image_probability=pred, image_hash=upload.digest)
+                trace.log(mastitis_probability=pred, cnn_cache_hit=cache_hit, quality_issues=upload.quality.issues)
+                render_trace(trace)
+                if cache_hit:
+                    st.caption("⚡ Image prediction reused from the prediction cache.")
+                render_cache_caption()
+                render_gate_caption()
+
             except Exception as e:
                 st.error(f"Prediction failed: {e}")
 
+# ---------------- BACKGROUND JOBS ----------------
+# Batch and video scoring run on the shared job queue (job_queue.py) so the
+# page stays responsive; these functions run on a worker thread and must not
+# call Streamlit.
+def run_batch_job(job, files):
+    import pandas as pd
+    from io import BytesIO
+    from preprocessing import decode_image, preprocess_batch, ImageTooLarge
+
+    batch_trace = Trace("image_batch")
+    # Only files the cache has not seen are decoded and scored.
+    with batch_trace.stage("cache_lookup"):
+        version = model_version(CNN_MODEL_PATH)
+        digests = [image_digest(data) for _, data in files]
+        keys = [image_key(d, version) for d in digests]
+        cached = [cnn_cache.get(k) for k in keys]
+        probs = np.array([np.nan if p is None else p for p in cached], dtype=np.float32)
+        misses = [i for i, p in enumerate(cached) if p is None]
+    quality = [""] * len(files)
+    rejected = np.zeros(len(files), dtype=bool)
+    model = get_cnn_model()
+    for start in range(0, len(misses), BATCH_CHUNK_SIZE):
+        chunk = misses[start:start + BATCH_CHUNK_SIZE]
+        job.progress(start / len(misses), f"Scoring images {start + 1}-{start + len(chunk)} of {len(misses)}")
+        # Photos past the size cap and photos that fail the quality gate are
+        # dropped from the batch before the CNN sees it and keep a NaN
+        # probability.
+        with batch_trace.stage("decode"):
+            images, sizes, decoded = [], [], []
+            for i in chunk:
+                try:
+                    img, size = decode_image(BytesIO(files[i][1]), max(cnn_input_shape()[1:3]))
+                except ImageTooLarge as e:
+                    # Counted with the gate's rejections so the reject rate
+                    # covers every photo that was not scored.
+                    decode_failure("too_large")
+                    quality[i] = str(e)
+                    rejected[i] = True
+                    continue
+                images.append(img)
+                sizes.append(size)
+                decoded.append(i)
+        chunk = decoded
+        if not chunk:
+            continue
+        with batch_trace.stage("resize_normalize"):
+            batch = preprocess_batch(images, cnn_input_shape())
+        with batch_trace.stage("quality_gate"):
+            reports = check_batch(batch, sizes)
+            keep = [j for j, r in enumerate(reports) if not r.rejected]
+        for i, r in zip(chunk, reports):
+            quality[i] = r.message()
+            rejected[i] = r.rejected
+        if keep:
+            scored = [chunk[j] for j in keep]
+            with batch_trace.stage("cnn_inference"):
+                probs[scored] = predict_batch(model, batch[keep])
+            for i in scored:
+                cnn_cache.put(keys[i], probs[i])
+
+    results = pd.DataFrame({
+        "File": [name for name, _ in files],
+        "Result": np.where(rejected, "Rejected", np.where(probs > 0.5, "Mastitis Detected", "Healthy Udder")),
+        "Mastitis Probability (%)": np.round(probs * 100, 2),
+        "Confidence (%)": np.round(np.maximum(probs, 1 - probs) * 100, 2),
+        "Photo Quality": quality,
+    })
+    positives = int((probs > 0.5).sum())
+    # Batch photos carry no cow ID. Camera file names (IMG_1234, PXL_...)
+    # are not ear tags, so the rows are recorded without one; the History
+    # page finds them with its source filter.
+    for digest, label, p, skip in zip(digests, results["Result"], probs, rejected):
+        if skip:
+            continue
+        record_prediction("batch", label, image_probability=p, image_hash=digest)
+    batch_trace.log(images=len(files), positives=positives, cnn_cache_hits=len(files) - len(misses),
+                    quality_rejected=int(rejected.sum()), job_id=job.id)
+    return {"results": results, "positives": positives, "rejected": int(rejected.sum()), "trace": batch_trace}
+
+
+def run_video_job(job, path, fps, cow_id=None):
+    duration = video_duration(path)
+    video_trace = Trace("image_video")
+
+    def progress(t):
+        job.progress(t / duration if duration else None,
+                     f"Scored frames up to {int(t) // 60}:{int(t) % 60:02d}")
+
+    with video_trace.stage("video_inference"):
+        clip = score_video(path, get_cnn_model(), cnn_input_shape(), sample_fps=fps, progress=progress)
+    video_trace.log(frames_sampled=clip["frames_sampled"], duplicates_skipped=clip["duplicates_skipped"],
+                    frames_scored=clip["frames_scored"], job_id=job.id,
+                    **{f"{k}_probability": v for k, v in clip["scores"].items()})
+    clip["trace"] = video_trace
+    top_k = clip["scores"]["top_k"]
+    if top_k is not None:
+        record_prediction("video", "Mastitis Detected" if top_k > 0.5 else "Healthy Udder", cow_id=cow_id,
+                          image_probability=top_k)
+    return clip
+
+
+def show_batch_results(result):
+    results = result["results"]
+    st.markdown(f"**{result['positives']} of {len(results)}** images flagged for mastitis.")
+    if result["rejected"]:
+        st.warning(f"📷 {result['rejected']} photo(s) rejected by the quality gate and not scored; "
+                   f"see the Photo Quality column.")
+    st.dataframe(
+        results.sort_values("Mastitis Probability (%)", ascending=False),
+        width="stretch",
+        hide_index=True
+    )
+    st.download_button(
+        label="📄 Download Batch Results",
+        data=results.to_csv(index=False).encode("utf-8"),
+        file_name=f"mastitis_batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        mime="text/csv"
+    )
+    render_trace(result["trace"])
+    render_cache_caption()
+    render_gate_caption()
+
+
+def show_video_results(clip):
+    import pandas as pd
+
+    scores = clip["scores"]
+    if scores["top_k"] is None:
+        st.warning("No frames could be read from this video.")
+        return
+    cols = st.columns(3)
+    cols[0].metric("Max", f"{scores['max'] * 100:.1f}%")
+    cols[1].metric("Mean", f"{scores['mean'] * 100:.1f}%")
+    cols[2].metric(f"Top-{TOP_K} mean", f"{scores['top_k'] * 100:.1f}%")
+    if scores["top_k"] > 0.5:
+        st.error(f"⚠ Mastitis Detected in clip\n\nTop-{TOP_K} frame confidence: {scores['top_k'] * 100:.2f}%")
+    else:
+        st.success(f"✅ Healthy Udder\n\nTop-{TOP_K} frame confidence: {(1 - scores['top_k']) * 100:.2f}%")
+    st.caption(f"{clip['frames_sampled']} frames sampled, {clip['duplicates_skipped']} near-duplicates "
+               f"skipped, {clip['frames_scored']} scored.")
+
+    frames = pd.DataFrame(clip["frames"], columns=["Frame", "Seconds", "Mastitis Probability"])
+    st.line_chart(frames, x="Seconds", y="Mastitis Probability")
+    st.download_button(
+        label="📄 Download Frame Scores",
+        data=frames.to_csv(index=False).encode("utf-8"),
+        file_name=f"mastitis_video_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        mime="text/csv"
+    )
+    render_trace(clip["trace"])
+
+
+def submit_job(state_key, name, fn, cleanup=None):
+    try:
+        st.session_state[state_key] = get_job_queue().submit(session_id(), name, fn, cleanup)
+        return True
+    except QueueFull as e:
+        st.warning(f"⏳ {e}")
+        return False
+
+
+# ---------------- BATCH MODE ----------------
+st.markdown("---")
+st.markdown("### 📦 Batch Detection")
+st.caption("Upload photos of several animals at once and score them together.")
+
+batch_files = st.file_uploader(
+    "📤 Upload Udder Images",
+    type=["jpg", "jpeg", "png"],
+    accept_multiple_files=True,
+    key="batch_upload"
+)
+
+if st.button("🔍 Predict All"):
+    if not batch_files:
+        st.warning("Please upload at least one image first.")
+    else:
+        files = [(f.name, f.getvalue()) for f in batch_files]
+        submit_job("batch_job", "image_batch", lambda job: run_batch_job(job, files))
+
+render_job("batch_job", show_batch_results)
+
+# ---------------- VIDEO MODE ----------------
+st.markdown("---")
+st.markdown("### 🎥 Video Detection")
+st.caption("Upload a milking-parlour clip: frames are sampled, near-duplicate frames skipped and the rest scored.")
 
+video = st.file_uploader(
+    "📤 Upload Video",
+    type=VIDEO_TYPES,
+    key="video_upload"
+)
+sample_fps = st.slider("Frames sampled per second", 0.2, 5.0, SAMPLE_FPS, 0.2)
+
+if st.button("🔍 Analyze Video"):
+    if video is None:
+        st.warning("Please upload a video first.")
+    else:
+        import os
+        import tempfile
+
+        # OpenCV reads from a path, so the upload is spooled to a temp file.
+        # The queue removes it when the job finishes, fails or is cancelled,
+        # even before it starts.
+        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(video.name)[1], delete=False) as tmp:
+            tmp.write(video.getbuffer())
+        if not submit_job("video_job", "image_video", lambda job: run_video_job(job, tmp.name, sample_fps, cow_id),
+                          cleanup=lambda: os.unlink(tmp.name)):
+            os.unlink(tmp.name)
+
+render_job("video_job", show_video_results)
\ No newline at end of file
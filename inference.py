@@ -0,0 +1,88 @@
+import json
+import os
+
+import numpy as np
+
+# ---------------- BATCHED INFERENCE ----------------
+BATCH_CHUNK_SIZE = 32
+
+
+def predict_batch(model, batch, chunk_size=BATCH_CHUNK_SIZE):
+    # Score an (N, ...) array in fixed-size chunks. When there is more than
+    # one chunk the last one is zero-padded, so the model always sees the
+    # same input shape and never retraces for a ragged tail.
+    n = len(batch)
+    probs = np.empty(n, dtype=np.float32)
+    if n == 0:
+        return probs
+    if getattr(model, "splits_batches", False):
+        # A worker pool chunks and spreads the batch across its processes.
+        return model.predict(batch).reshape(-1)
+
+    chunk_size = min(chunk_size, n)
+    chunk = np.zeros((chunk_size,) + batch.shape[1:], dtype=np.float32)
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        chunk[: stop - start] = batch[start:stop]
+        chunk[stop - start:] = 0
+        out = model.predict(chunk, verbose=0)
+        probs[start:stop] = np.asarray(out).reshape(-1)[: stop - start]
+    return probs
+
+
+# ---------------- HYBRID FUSION ----------------
+# Weight of the CNN probability and the decision threshold. Defaults are the
+# original plain average at 0.5; fusion_sweep.py --export writes a tuned
+# pair to FUSION_CONFIG_PATH, which is read once at import.
+FUSION_CONFIG_PATH = os.environ.get("MASTITIS_FUSION_CONFIG", "fusion_config.json")
+
+
+def load_fusion_config(path=FUSION_CONFIG_PATH):
+    config = {"image_weight": 0.5, "threshold": 0.5, "cascade_low": 0.05, "cascade_high": 0.95}
+    if path and os.path.exists(path):
+        with open(path) as f:
+            stored = json.load(f)
+        config.update({k: float(stored[k]) for k in config if k in stored})
+    if not 0.0 <= config["image_weight"] <= 1.0:
+        raise ValueError(f"image_weight must be in [0, 1], got {config['image_weight']} in {path}")
+    return config
+
+
+_fusion = load_fusion_config()
+HYBRID_IMAGE_WEIGHT = _fusion["image_weight"]
+HYBRID_THRESHOLD = _fusion["threshold"]
+CASCADE_LOW = _fusion["cascade_low"]
+CASCADE_HIGH = _fusion["cascade_high"]
+
+
+def fuse_predictions(img_pred, sym_pred, image_weight=None):
+    # Weighted average of CNN and symptom probabilities; works on scalars and
+    # arrays. At weight 0.5 this is exactly (img_pred + sym_pred) / 2.
+    w = HYBRID_IMAGE_WEIGHT if image_weight is None else image_weight
+    return img_pred * w + sym_pred * (1 - w)
+
+
+def hybrid_label(final_pred, threshold=HYBRID_THRESHOLD):
+    return "⚠ Mastitis Detected" if final_pred > threshold else "✅ Healthy Cow"
+
+
+# ---------------- CASCADE ----------------
+# Optional early exit for hybrid predictions: the symptom model (a table
+# lookup) runs first, and when its probability is at or below CASCADE_LOW or
+# at or above CASCADE_HIGH the CNN is skipped and the symptom probability is
+# the final one. Off unless MASTITIS_CASCADE=1; the bounds come from the
+# fusion config (cascade_low / cascade_high). See cascade_report.py.
+CASCADE = os.environ.get("MASTITIS_CASCADE", "0") == "1"
+PATH_HYBRID = "hybrid"
+PATH_SYMPTOMS_ONLY = "symptoms_only"
+PATH_LABELS = {
+    PATH_HYBRID: "Image + symptoms (hybrid)",
+    PATH_SYMPTOMS_ONLY: "Symptoms only (image model skipped)",
+}
+
+
+def cascade_skips_image(sym_pred, low=None, high=None):
+    # Works on scalars and arrays.
+    low = CASCADE_LOW if low is None else low
+    high = CASCADE_HIGH if high is None else high
+    return (sym_pred <= low) | (sym_pred >= high)
@@ -0,0 +1,364 @@
+import argparse
+import base64
+import json
+import queue
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+
+from inference import (predict_batch, fuse_predictions, cascade_skips_image, HYBRID_THRESHOLD, CASCADE,
+                       PATH_HYBRID, PATH_SYMPTOMS_ONLY)
+from prediction_cache import image_digest, image_key
+from preprocessing import decode_image, preprocess_image
+from symptom_lookup import N_SYMPTOMS
+from tflite_backend import BACKENDS
+
+# The image and symptom pages label a single model's probability at 0.5;
+# only the hybrid endpoint uses the (possibly tuned) fusion threshold.
+SINGLE_MODEL_THRESHOLD = 0.5
+
+# ---------------- DYNAMIC MICRO-BATCHING ----------------
+class _Pending:
+    __slots__ = ("x", "enqueued", "done", "result", "error")
+
+    def __init__(self, x):
+        self.x = x
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    # Collects concurrent single-sample requests and runs them as one
+    # forward pass. A batch is closed when it reaches max_batch_size or when
+    # its oldest request has waited max_wait_ms, whichever comes first.
+    # With several dispatchers, several batches can be in flight at once
+    # (one per worker process when the model is a worker pool).
+    def __init__(self, predict_fn, max_batch_size=32, max_wait_ms=5.0, latency_window=2048, dispatchers=1):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self._queue_waits = deque(maxlen=latency_window)
+        self._batches = 0
+        self._items = 0
+        self._started = time.perf_counter()
+        self._threads = [threading.Thread(target=self._run, name=f"micro-batcher-{i}", daemon=True)
+                         for i in range(dispatchers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, x, timeout=None):
+        item = _Pending(x)
+        self._queue.put(item)
+        if not item.done.wait(timeout):
+            raise TimeoutError("Inference did not finish in time")
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def close(self):
+        self._queue.put(None)
+        for t in self._threads:
+            t.join()
+
+    def _collect(self, first):
+        items = [first]
+        deadline = first.enqueued + self.max_wait
+        while len(items) < self.max_batch_size:
+            # Requests already queued join immediately; only an unfilled
+            # batch waits, and never past its oldest request's deadline.
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            items.append(item)
+        return items
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                # Pass the sentinel on to the other dispatchers.
+                self._queue.put(None)
+                return
+            items = self._collect(first)
+            started = time.perf_counter()
+            try:
+                out = self.predict_fn(np.stack([item.x for item in items]))
+                for item, result in zip(items, out):
+                    item.result = float(result)
+            except Exception as e:
+                for item in items:
+                    item.error = e
+            finished = time.perf_counter()
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(items)
+                for item in items:
+                    self._queue_waits.append(started - item.enqueued)
+                    self._latencies.append(finished - item.enqueued)
+            for item in items:
+                item.done.set()
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            waits = np.array(self._queue_waits) * 1000.0
+            batches, items = self._batches, self._items
+        elapsed = time.perf_counter() - self._started
+
+        def pct(values, q):
+            return round(float(np.percentile(values, q)), 3) if len(values) else None
+
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batches": batches,
+            "requests": items,
+            "mean_batch_size": round(items / batches, 3) if batches else None,
+            "throughput_rps": round(items / elapsed, 3) if elapsed > 0 else None,
+            "latency_ms_p50": pct(latencies, 50),
+            "latency_ms_p95": pct(latencies, 95),
+            "latency_ms_p99": pct(latencies, 99),
+            "queue_wait_ms_p50": pct(waits, 50),
+            "queue_wait_ms_p95": pct(waits, 95),
+        }
+
+
+# ---------------- SERVICE ----------------
+class InferenceService:
+    def __init__(self, cnn_model, symptom_lookup, max_batch_size=32, max_wait_ms=5.0,
+                 threshold=HYBRID_THRESHOLD, cascade=CASCADE, image_threshold=SINGLE_MODEL_THRESHOLD,
+                 symptom_threshold=SINGLE_MODEL_THRESHOLD, cache=None, model_version=None):
+        self.input_shape = tuple(cnn_model.input_shape)
+        self.worker_pool = cnn_model if getattr(cnn_model, "splits_batches", False) else None
+        self.symptom_lookup = symptom_lookup
+        self.threshold = threshold
+        self.image_threshold = image_threshold
+        self.symptom_threshold = symptom_threshold
+        self.cascade = cascade
+        self.cascade_skips = 0
+        # Shared with the pages' cache when it is persistent, so a photo
+        # scored in either place is not scored again by the same model.
+        self.cache = cache if model_version is not None else None
+        self.model_version = model_version
+        self._lock = threading.Lock()
+        self.cnn = MicroBatcher(
+            lambda batch: predict_batch(cnn_model, batch, max_batch_size),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+            dispatchers=self.worker_pool.workers if self.worker_pool is not None else 1,
+        )
+
+    @staticmethod
+    def _label(prob, threshold):
+        return "Mastitis Detected" if prob > threshold else "Healthy"
+
+    def predict_image(self, image_bytes):
+        key = prob = None
+        if self.cache is not None:
+            key = image_key(image_digest(image_bytes), self.model_version)
+            prob = self.cache.get(key)
+        if prob is None:
+            # Scaled decode; ImageTooLarge is a ValueError and becomes a 400.
+            img, _ = decode_image(BytesIO(image_bytes), max(self.input_shape[1:3]))
+            x = preprocess_image(img, self.input_shape)[0]
+            prob = self.cnn.submit(x)
+            if key is not None:
+                self.cache.put(key, prob)
+        return {"mastitis_probability": prob, "result": self._label(prob, self.image_threshold)}
+
+    def predict_symptoms(self, symptoms):
+        prob = self.symptom_lookup.predict(_parse_symptoms(symptoms))
+        return {"mastitis_probability": prob, "result": self._label(prob, self.symptom_threshold)}
+
+    def predict_hybrid(self, image_bytes, symptoms):
+        sym = self.predict_symptoms(symptoms)
+        if self.cascade and cascade_skips_image(sym["mastitis_probability"]):
+            # Symptoms are conclusive: the image is not decoded or scored.
+            with self._lock:
+                self.cascade_skips += 1
+            img_prob, final, path = None, sym["mastitis_probability"], PATH_SYMPTOMS_ONLY
+        else:
+            img_prob = self.predict_image(image_bytes)["mastitis_probability"]
+            final, path = float(fuse_predictions(img_prob, sym["mastitis_probability"])), PATH_HYBRID
+        return {
+            "image_probability": img_prob,
+            "symptom_probability": sym["mastitis_probability"],
+            "hybrid_probability": final,
+            "result": self._label(final, self.threshold),
+            "decision_path": path,
+        }
+
+
+def _parse_symptoms(symptoms):
+    if (not isinstance(symptoms, list) or len(symptoms) != N_SYMPTOMS
+            or not all(isinstance(s, int) and s in (0, 1) for s in symptoms)):
+        raise ValueError(f"'symptoms' must be a list of {N_SYMPTOMS} 0/1 values")
+    return [bool(s) for s in symptoms]
+
+
+def _json_object(body):
+    payload = json.loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("Request body must be a JSON object")
+    return payload
+
+
+def _image_from_json(payload):
+    if "image_base64" not in payload:
+        raise ValueError("Missing 'image_base64'")
+    return base64.b64decode(payload["image_base64"])
+
+
+# ---------------- HTTP HANDLER ----------------
+class InferenceHandler(BaseHTTPRequestHandler):
+    service = None
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/metrics":
+            metrics = {"cnn": self.service.cnn.stats(), "cascade_skips": self.service.cascade_skips}
+            if self.service.worker_pool is not None:
+                metrics["worker_pool"] = self.service.worker_pool.stats()
+            if self.service.cache is not None:
+                metrics["prediction_cache"] = self.service.cache.stats()
+            self._send_json(200, metrics)
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        try:
+            body = self._read_body()
+            content_type = self.headers.get("Content-Type", "")
+            if self.path == "/predict/image":
+                if content_type.startswith("image/") or content_type == "application/octet-stream":
+                    image_bytes = body
+                else:
+                    image_bytes = _image_from_json(_json_object(body))
+                result = self.service.predict_image(image_bytes)
+            elif self.path == "/predict/symptoms":
+                result = self.service.predict_symptoms(_json_object(body).get("symptoms"))
+            elif self.path == "/predict/hybrid":
+                payload = _json_object(body)
+                result = self.service.predict_hybrid(_image_from_json(payload), payload.get("symptoms"))
+            else:
+                self._send_json(404, {"error": "Not found"})
+                return
+        except (ValueError, OSError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"Prediction failed: {e}"})
+            return
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class InferenceHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Concurrent clients are the point of micro-batching; the default listen
+    # backlog of 5 resets connections under load.
+    request_queue_size = 256
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP inference service for mastitis detection.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--max-batch-size", type=int, default=32,
+                        help="Largest CNN micro-batch")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="Longest a request waits for its micro-batch to fill")
+    parser.add_argument("--threshold", type=float, default=HYBRID_THRESHOLD,
+                        help="Hybrid decision threshold (image and symptom endpoints use 0.5, as the pages do)")
+    parser.add_argument("--backend", choices=BACKENDS, default=None,
+                        help="Inference backend (default: $MASTITIS_BACKEND or keras)")
+    parser.add_argument("--cascade", action="store_true", default=CASCADE,
+                        help="Skip the CNN on hybrid requests when symptoms are conclusive "
+                             "(default: $MASTITIS_CASCADE)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Run the models in N worker processes (default: $MASTITIS_WORKERS, 0 = in-process)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Score every image even if the same photo was scored before")
+    return parser.parse_args(argv)
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # systemd, Docker and Popen.terminate() stop the server with SIGTERM;
+    # treat it like Ctrl+C so the worker pool is closed on the way out.
+    signal.signal(signal.SIGTERM, _stop)
+
+    import model_registry
+    from model_registry import get_cnn_model, get_symptom_lookup, model_version, CNN_MODEL_PATH
+    from prediction_cache import cnn_cache
+
+    if args.workers is not None:
+        model_registry.WORKERS = args.workers
+    InferenceHandler.service = InferenceService(
+        get_cnn_model(args.backend),
+        get_symptom_lookup(args.backend),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        threshold=args.threshold,
+        cascade=args.cascade,
+        cache=None if args.no_cache else cnn_cache,
+        model_version=model_version(CNN_MODEL_PATH, args.backend),
+    )
+    server = InferenceHTTPServer((args.host, args.port), InferenceHandler)
+    print(f"Serving on http://{args.host}:{args.port} "
+          f"(max batch {args.max_batch_size}, max wait {args.max_wait_ms} ms)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        InferenceHandler.service.cnn.close()
+        if InferenceHandler.service.worker_pool is not None:
+            InferenceHandler.service.worker_pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from tracing import logger
+
+# ---------------- CONFIG ----------------
+JOB_WORKERS = int(os.environ.get("MASTITIS_JOB_WORKERS", "2"))
+# Queued (not yet running) jobs across all sessions, and per session.
+MAX_QUEUE_DEPTH = int(os.environ.get("MASTITIS_JOB_QUEUE_DEPTH", "64"))
+MAX_SESSION_DEPTH = int(os.environ.get("MASTITIS_JOB_SESSION_DEPTH", "4"))
+# Finished jobs (with their results) kept for pages to collect.
+KEEP_FINISHED = int(os.environ.get("MASTITIS_JOB_KEEP", "256"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ---------------- JOB ----------------
+class Job:
+    # A unit of work run by the queue: fn(job) returns the result. The
+    # function reports progress with job.progress(), which also raises
+    # JobCancelled once cancellation was requested, so long jobs stop at
+    # their next progress report. cleanup(), if given, runs once the job is
+    # finished in any state, including cancelled before it started.
+    def __init__(self, session_id, name, fn, cleanup=None):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.name = name
+        self.fn = fn
+        self.cleanup = cleanup
+        self.state = QUEUED
+        self.fraction = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = self.finished = None
+        self._cancel = threading.Event()
+
+    def progress(self, fraction=None, message=None):
+        if self._cancel.is_set():
+            raise JobCancelled()
+        if fraction is not None:
+            self.fraction = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    @property
+    def done(self):
+        return self.state in FINISHED
+
+    @property
+    def queue_wait(self):
+        end = self.started if self.started is not None else (self.finished or time.time())
+        return end - self.submitted
+
+    @property
+    def run_time(self):
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+
+# ---------------- QUEUE ----------------
+class JobQueue:
+    # Thread pool fed by one FIFO per session. Workers take sessions in
+    # round-robin order, so a session with a long backlog cannot starve the
+    # others. Depth is bounded globally and per session; submit() raises
+    # QueueFull rather than queueing without limit.
+    def __init__(self, workers=JOB_WORKERS, max_depth=MAX_QUEUE_DEPTH, max_session_depth=MAX_SESSION_DEPTH,
+                 keep_finished=KEEP_FINISHED):
+        self.max_depth = max_depth
+        self.max_session_depth = max_session_depth
+        self.keep_finished = keep_finished
+        self._sessions = OrderedDict()
+        self._jobs = OrderedDict()
+        self._queued = 0
+        self._running = 0
+        self._cond = threading.Condition()
+        self._waits = deque(maxlen=1000)
+        self._runs = deque(maxlen=1000)
+        self.counts = {"submitted": 0, "rejected": 0, DONE: 0, FAILED: 0, CANCELLED: 0}
+        self._threads = [threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, session_id, name, fn, cleanup=None):
+        job = Job(session_id, name, fn, cleanup)
+        with self._cond:
+            pending = self._sessions.get(session_id)
+            if self._queued >= self.max_depth or (pending is not None and len(pending) >= self.max_session_depth):
+                self.counts["rejected"] += 1
+                raise QueueFull(f"Job queue is full ({self._queued} waiting); try again shortly")
+            if pending is None:
+                pending = self._sessions[session_id] = deque()
+            pending.append(job)
+            self._jobs[job.id] = job
+            self._queued += 1
+            self.counts["submitted"] += 1
+            self._trim()
+            self._cond.notify()
+        return job.id
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        # Jobs that will start before this one under round-robin: sessions
+        # served before this one's turn get ahead + 1 jobs in, the ones
+        # after it only ahead.
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != QUEUED:
+                return 0
+            ahead = list(self._sessions[job.session_id]).index(job)
+            position, turn = ahead, ahead + 1
+            for s, q in self._sessions.items():
+                if s == job.session_id:
+                    turn = ahead
+                else:
+                    position += min(len(q), turn)
+            return position
+
+    def cancel(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job._cancel.set()
+            if job.state != QUEUED:
+                return True
+            self._sessions[job.session_id].remove(job)
+            if not self._sessions[job.session_id]:
+                del self._sessions[job.session_id]
+            self._queued -= 1
+            self._finish(job, CANCELLED)
+        self._cleanup(job)
+        return True
+
+    def _trim(self):
+        finished = [j for j in self._jobs.values() if j.done]
+        for job in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job.id]
+
+    def _finish(self, job, state, result=None, error=None):
+        job.state, job.result, job.error = state, result, error
+        job.finished = time.time()
+        self.counts[state] += 1
+        if job.started is not None:
+            self._runs.append(job.run_time)
+        logger.info(json.dumps({
+            "job": job.name, "job_id": job.id, "state": state,
+            "queue_wait_ms": round(job.queue_wait * 1000, 3),
+            "run_ms": None if job.run_time is None else round(job.run_time * 1000, 3),
+        }))
+
+    @staticmethod
+    def _cleanup(job):
+        # Called after _finish() with the lock released: cleanup hooks do
+        # file I/O (or anything a caller supplies) and must not hold up
+        # submit() and the pages polling get() and position().
+        if job.cleanup is not None:
+            try:
+                job.cleanup()
+            except Exception as e:
+                logger.error(f"Cleanup of job {job.id} failed: {e}")
+
+    def _next_job(self):
+        # Round robin: the first session in line gives up one job and moves
+        # to the back.
+        session_id, pending = next(iter(self._sessions.items()))
+        job = pending.popleft()
+        if pending:
+            self._sessions.move_to_end(session_id)
+        else:
+            del self._sessions[session_id]
+        self._queued -= 1
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._sessions:
+                    self._cond.wait()
+                job = self._next_job()
+                job.state = RUNNING
+                job.started = time.time()
+                self._waits.append(job.queue_wait)
+                self._running += 1
+            try:
+                result = job.fn(job)
+                state, error = DONE, None
+            except JobCancelled:
+                result, state, error = None, CANCELLED, None
+            except Exception as e:
+                result, state, error = None, FAILED, f"{type(e).__name__}: {e}"
+            with self._cond:
+                self._running -= 1
+                self._finish(job, state, result, error)
+            self._cleanup(job)
+
+    def stats(self):
+        with self._cond:
+            waits = np.array(self._waits) * 1000.0
+            runs = np.array(self._runs) * 1000.0
+            pct = lambda a, q: round(float(np.percentile(a, q)), 3) if len(a) else None
+            return {
+                "workers": len(self._threads),
+                "queued": self._queued,
+                "running": self._running,
+                "sessions_waiting": len(self._sessions),
+                "max_depth": self.max_depth,
+                **self.counts,
+                "queue_wait_ms_p50": pct(waits, 50),
+                "queue_wait_ms_p95": pct(waits, 95),
+                "queue_wait_ms_max": pct(waits, 100),
+                "run_ms_p50": pct(runs, 50),
+                "run_ms_p95": pct(runs, 95),
+            }
+
+
+# ---------------- PROCESS-WIDE QUEUE ----------------
+# Like the model registry, one queue per server process shared by every
+# session; created on first use.
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
+
+
+# ---------------- STREAMLIT ----------------
+def session_id():
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+
+def render_job(state_key, render_result, poll_seconds=1.0):
+    # Shows the job whose ID is in st.session_state[state_key]: progress and
+    # a cancel button while it waits or runs (polled in a fragment, so only
+    # this panel reruns), then render_result(job.result) once it is done.
+    import streamlit as st
+
+    jobs = get_job_queue()
+    job = jobs.get(st.session_state.get(state_key))
+    if job is None:
+        return
+
+    if job.done:
+        _render_finished(st, job, render_result)
+        return
+
+    @st.fragment(run_every=poll_seconds)
+    def poll():
+        current = jobs.get(job.id)
+        if current is None or current.done:
+            # Full rerun so the finished job renders outside the fragment
+            # and polling stops.
+            st.rerun()
+        if current.state == QUEUED:
+            st.info(f"⏳ Queued: {jobs.position(current.id)} job(s) ahead, waiting {current.queue_wait:.1f} s")
+        else:
+            st.progress(current.fraction, text=current.message or "Running...")
+        if st.button("✖ Cancel", key=f"cancel_{current.id}"):
+            jobs.cancel(current.id)
+            st.rerun()
+
+    poll()
+
+
+def _render_finished(st, job, render_result):
+    if job.state == DONE:
+        render_result(job.result)
+    elif job.state == FAILED:
+        st.error(f"Job failed: {job.error}")
+    else:
+        st.warning("Job cancelled.")
+    stats = get_job_queue().stats()
+    run = "-" if job.run_time is None else f"{job.run_time:.2f} s"
+    st.caption(f"Queue wait {job.queue_wait:.2f} s, run {run}. Queue now: {stats['queued']} waiting, "
+               f"{stats['running']} running; wait p50 {stats['queue_wait_ms_p50']} ms, "
+               f"p95 {stats['queue_wait_ms_p95']} ms.")
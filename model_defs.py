@@ -0,0 +1,37 @@
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, Flatten, Dense, Dropout, Input
+
+# ---------------- ARCHITECTURES ----------------
+# Same layers as MainProject.ipynb, so benchmarks and training can build the
+# models without the trained .h5 files.
+IMG_SIZE = 128
+N_SYMPTOM_FEATURES = 6
+
+
+def build_cnn_model(img_size=IMG_SIZE):
+    return Sequential([
+        Input(shape=(img_size, img_size, 3)),
+        Conv2D(32, (3, 3), activation='relu'),
+        MaxPooling2D(2, 2),
+
+        Conv2D(64, (3, 3), activation='relu'),
+        MaxPooling2D(2, 2),
+
+        Conv2D(128, (3, 3), activation='relu'),
+        MaxPooling2D(2, 2),
+
+        Flatten(),
+        Dense(128, activation='relu'),
+        Dropout(0.5),
+        Dense(1, activation='sigmoid')
+    ])
+
+
+def build_symptom_model(n_features=N_SYMPTOM_FEATURES):
+    return Sequential([
+        Input(shape=(n_features,)),
+        Dense(32, activation='relu'),
+        Dropout(0.2),
+        Dense(16, activation='relu'),
+        Dense(1, activation='sigmoid')
+    ])
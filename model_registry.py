@@ -0,0 +1,170 @@
+import hashlib
+import os
+import threading
+import time
+
+import numpy as np
+
+# TensorFlow (via serving.py) is imported on the first model load, not here,
+# so pages can import the registry without paying for it up front.
+from symptom_lookup import SymptomLookup
+from tflite_backend import BACKENDS, TFLiteModel, lite_model_path
+
+# ---------------- MODEL FILES ----------------
+CNN_MODEL_PATH = os.environ.get("MASTITIS_CNN_MODEL", "final_cnn_model1.h5")
+SYMPTOM_MODEL_PATH = os.environ.get("MASTITIS_SYMPTOM_MODEL", "symptom1_model.h5")
+
+# keras | tflite-fp16 | tflite-int8 (see export_lite.py)
+BACKEND = os.environ.get("MASTITIS_BACKEND", "keras")
+
+# Serve Keras models through the compiled fixed-signature path (serving.py).
+COMPILED = os.environ.get("MASTITIS_COMPILED", "1") == "1"
+
+# MASTITIS_WORKERS=N serves the models from N worker processes
+# (worker_pool.py) instead of this one; 0 keeps them in-process.
+WORKERS = int(os.environ.get("MASTITIS_WORKERS", "0"))
+
+# ---------------- PROCESS-WIDE REGISTRY ----------------
+# Streamlit re-executes page scripts on every widget interaction, but imported
+# modules stay in sys.modules, so these dicts are shared by every page and
+# every session of the server process. Entries are keyed by (path, backend).
+_models = {}
+_info = {}
+_symptom_lookups = {}
+_pools = {}
+_lock = threading.Lock()
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is KiB on Linux, bytes on macOS; only used as a fallback
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _open_model(path, backend):
+    import tensorflow as tf
+    from serving import CompiledModel, configure_threads, INTRA_OP_THREADS
+
+    configure_threads()
+    if backend == "keras":
+        model = tf.keras.models.load_model(path)
+        weight_bytes = sum(w.numpy().nbytes for w in model.weights)
+        params = model.count_params()
+        if COMPILED:
+            model = CompiledModel(model)
+        return model, params, weight_bytes, path
+
+    lite_path = lite_model_path(path, backend)
+    model = TFLiteModel(lite_path, num_threads=INTRA_OP_THREADS or None)
+    # Warm-up so the first request does not pay for tensor allocation.
+    model.predict(np.zeros((1,) + tuple(model.input_shape[1:]), dtype=np.float32))
+    return model, None, os.path.getsize(lite_path), lite_path
+
+
+def load_model(path, backend=None):
+    backend = backend or BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+
+    key = (path, backend)
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _lock:
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        model, params, weight_bytes, file_path = _open_model(path, backend)
+        load_seconds = time.perf_counter() - start
+
+        _info[key] = {
+            "path": file_path,
+            "backend": backend,
+            "load_seconds": load_seconds,
+            "params": None if params is None else int(params),
+            "weight_bytes": int(weight_bytes),
+            "rss_delta_bytes": max(0, _rss_bytes() - rss_before),
+            "input_shape": tuple(model.input_shape),
+            # Content hash of the model file; prediction cache keys include it.
+            "version": f"{backend}:{_file_digest(file_path)[:16]}",
+            "warmup_seconds": getattr(model, "warmup_seconds", None),
+            "loaded_at": time.time(),
+        }
+        _models[key] = model
+        return model
+
+
+def get_worker_pool(backend=None, workers=None):
+    backend = backend or BACKEND
+    pool = _pools.get(backend)
+    if pool is None:
+        with _lock:
+            pool = _pools.get(backend)
+            if pool is None:
+                from worker_pool import WorkerPool
+                pool = _pools[backend] = WorkerPool(workers or WORKERS, backend=backend)
+    return pool
+
+
+def get_cnn_model(backend=None):
+    if WORKERS:
+        return get_worker_pool(backend)
+    return load_model(CNN_MODEL_PATH, backend)
+
+
+def get_symptom_model(backend=None):
+    return load_model(SYMPTOM_MODEL_PATH, backend)
+
+
+def get_symptom_lookup(backend=None):
+    # 64-entry table of symptom model outputs, built and verified once so
+    # the pages never call TensorFlow for symptom predictions.
+    if WORKERS:
+        # Built and verified by the workers from their copy of the model.
+        return get_worker_pool(backend).symptom_lookup
+    backend = backend or BACKEND
+    lookup = _symptom_lookups.get(backend)
+    if lookup is None:
+        model = get_symptom_model(backend)
+        with _lock:
+            lookup = _symptom_lookups.get(backend)
+            if lookup is None:
+                lookup = _symptom_lookups[backend] = SymptomLookup.from_model(model)
+    return lookup
+
+
+def model_version(path, backend=None):
+    if WORKERS:
+        return get_worker_pool(backend).versions[path]
+    load_model(path, backend)
+    return _info[(path, backend or BACKEND)]["version"]
+
+
+def cnn_input_shape(backend=None):
+    return tuple(get_cnn_model(backend).input_shape)
+
+
+def model_info(path=None, backend=None):
+    # Load time and memory footprint of the models loaded so far.
+    if WORKERS:
+        info = get_worker_pool(backend).model_info
+        return dict(info[path]) if path is not None else {f"{p} [{i['backend']}]": dict(i) for p, i in info.items()}
+    if path is not None:
+        return dict(_info[(path, backend or BACKEND)])
+    return {f"{p} [{b}]": dict(i) for (p, b), i in _info.items()}
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# ---------------- CONFIG ----------------
+CACHE_SIZE = int(os.environ.get("MASTITIS_CACHE_SIZE", "1024"))
+# 0 disables expiry
+CACHE_TTL = float(os.environ.get("MASTITIS_CACHE_TTL", "0"))
+# Set to a directory to keep predictions across restarts.
+CACHE_DIR = os.environ.get("MASTITIS_CACHE_DIR", "")
+
+
+# ---------------- KEYS ----------------
+def image_digest(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def image_key(digest, model_version):
+    # Imported here so the pages do not load Pillow at start-up.
+    from preprocessing import PREPROCESS_VERSION
+    return f"{digest}:{model_version}:p{PREPROCESS_VERSION}"
+
+
+# ---------------- LRU CACHE ----------------
+class PredictionCache:
+    # Bounded LRU of key -> probability with optional TTL. With a db_path the
+    # entries are also written to SQLite and read back on an in-memory miss,
+    # so they survive restarts; the disk copy is trimmed to disk_max_entries.
+    def __init__(self, name, max_entries=CACHE_SIZE, ttl_seconds=CACHE_TTL, db_path=None,
+                 disk_max_entries=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds or None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+        self._db = None
+        self._disk_max = disk_max_entries or 10 * max_entries
+        self._disk_puts = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} "
+                "(key TEXT PRIMARY KEY, value REAL NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {name}_created ON {name}(created)")
+            self._db.commit()
+
+    def _expired(self, created, now):
+        return self.ttl is not None and now - created > self.ttl
+
+    def _insert(self, key, value, created):
+        self._entries[key] = (value, created)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _disk_get(self, key, now):
+        row = self._db.execute(f"SELECT value, created FROM {self.name} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if self._expired(row[1], now):
+            self._db.execute(f"DELETE FROM {self.name} WHERE key = ?", (key,))
+            self._db.commit()
+            return None
+        return row
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry[1], now):
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None and self._db is not None:
+                entry = self._disk_get(key, now)
+                if entry is not None:
+                    self._insert(key, entry[0], entry[1])
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        now = time.time()
+        value = float(value)
+        with self._lock:
+            self._insert(key, value, now)
+            if self._db is not None:
+                self._db.execute(
+                    f"INSERT OR REPLACE INTO {self.name} (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, now),
+                )
+                self._disk_puts += 1
+                if self._disk_puts % 256 == 0:
+                    self._db.execute(
+                        f"DELETE FROM {self.name} WHERE key IN (SELECT key FROM {self.name} "
+                        "ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                        (self._disk_max,),
+                    )
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute(f"DELETE FROM {self.name}")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "persistent": self._db is not None,
+            }
+
+
+def render_cache_caption(cache=None):
+    import streamlit as st
+
+    s = (cache or cnn_cache).stats()
+    lookups = s["hits"] + s["misses"]
+    if lookups:
+        st.caption(f"Prediction cache: {s['hits']} of {lookups} lookups hit ({s['hit_rate'] * 100:.0f}%), "
+                   f"{s['entries']} / {s['max_entries']} entries, {s['evictions']} evicted, "
+                   f"{s['expirations']} expired.")
+
+
+# ---------------- PROCESS-WIDE CACHE ----------------
+# Only CNN results live here, keyed on the image bytes alone, so changing a
+# checkbox on the hybrid page never recomputes the image prediction. Symptom
+# results already come from the 64-entry SymptomLookup table.
+def _db_path():
+    if not CACHE_DIR:
+        return None
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, "predictions.sqlite")
+
+
+cnn_cache = PredictionCache("cnn", db_path=_db_path())
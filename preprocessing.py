@@ -0,0 +1,212 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+# ---------------- CONFIG ----------------
+# Hard limits per image. The pixel count comes from the header and is
+# checked before anything is decoded; the memory cap applies to the decoded
+# buffer after scaled decoding. PNGs cannot be decoded at a reduced scale,
+# so a large PNG hits the memory cap where a JPEG of the same size does not.
+MAX_PIXELS = int(float(os.environ.get("MASTITIS_MAX_IMAGE_MP", "50")) * 1_000_000)
+MAX_DECODE_BYTES = int(float(os.environ.get("MASTITIS_MAX_DECODE_MB", "160")) * 1024 * 1024)
+
+# Bump whenever decoding or preprocessing changes the tensor produced for
+# the same file; cached predictions made with another version are ignored.
+PREPROCESS_VERSION = 2
+
+EXIF_ORIENTATION = 0x0112
+_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+_INV_255 = np.float32(1.0 / 255.0)
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+
+# ---------------- DECODE ----------------
+def _reduce_factor(size, min_side):
+    # Largest power of two that keeps the shorter side at least min_side.
+    factor = 1
+    while min(size) // (factor * 2) >= min_side:
+        factor *= 2
+    return factor
+
+
+def decode_image(source, min_side, max_pixels=None, max_bytes=None):
+    # Opens a path or file object and decodes it at the smallest power-of-two
+    # scale whose shorter side is still >= min_side: JPEGs are scaled by 1/2,
+    # 1/4 or 1/8 inside the decoder (draft mode), then any remaining power of
+    # two is removed with an area-average reduce. A 12 MP phone photo is never
+    # held at full size. EXIF orientation is applied to the reduced image.
+    # Returns the image and the original (width, height).
+    max_pixels = MAX_PIXELS if max_pixels is None else max_pixels
+    max_bytes = MAX_DECODE_BYTES if max_bytes is None else max_bytes
+    img = Image.open(source)
+    width, height = img.size
+    if width * height > max_pixels:
+        img.close()
+        raise ImageTooLarge(f"Image is {width}x{height} ({width * height / 1e6:.1f} MP); "
+                            f"the limit is {max_pixels / 1e6:g} MP")
+    orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+
+    factor = _reduce_factor(img.size, min_side)
+    if factor > 1 and img.format == "JPEG":
+        # Rounded up so the decoder never scales further than asked.
+        img.draft(img.mode, (-(-width // factor), -(-height // factor)))
+    nbytes = img.width * img.height * len(img.getbands())
+    if nbytes > max_bytes:
+        img.close()
+        raise ImageTooLarge(f"Decoding this {img.format or 'image'} needs {nbytes / 2 ** 20:.0f} MB; "
+                            f"the limit is {max_bytes / 2 ** 20:.0f} MB")
+    img.load()
+
+    factor = _reduce_factor(img.size, min_side)
+    if factor > 1:
+        img = img.reduce(factor)
+    if orientation in _TRANSPOSE:
+        img = img.transpose(_TRANSPOSE[orientation])
+    return img, (width, height)
+
+
+# ---------------- COLOR MODE ----------------
+def _to_model_mode(img, channels):
+    # Grayscale models take "L", everything else takes "RGB". Palette and
+    # alpha images are flattened onto white first: converting them straight
+    # to RGB would expose whatever colour sits under transparent pixels.
+    target = "L" if channels == 1 else "RGB"
+    if img.mode == target:
+        return img
+    if img.mode == "P":
+        img = img.convert("RGBA")
+    if img.mode in ("RGBA", "LA", "PA"):
+        img = img.convert("RGBA")
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img)
+    return img.convert(target)
+
+
+# ---------------- IMAGE PREPROCESS ----------------
+def _resize_convert(img, size, channels, resample=None):
+    # resample=None is Pillow's default (bicubic), as on the original pages.
+    if channels not in (1, 3):
+        raise ValueError(f"Unsupported channels: {channels}")
+    if img.mode in ("RGB", "L"):
+        # Same order as the original pages: resize, then convert.
+        return _to_model_mode(img.resize(size, resample), channels)
+    return _to_model_mode(img, channels).resize(size, resample)
+
+
+def preprocess_uint8(img, model_input_shape, resample=None):
+    # (H, W, C) uint8 pixels, exactly what preprocess_image scales by 1/255
+    # when resample is left at the default.
+    size = (model_input_shape[1], model_input_shape[2])
+    channels = model_input_shape[-1]
+    img = _resize_convert(img, size, channels, resample)
+    return np.asarray(img, dtype=np.uint8).reshape(size + (channels,))
+
+
+def preprocess_image(img, model_input_shape, out=None):
+    # Returns a (1, H, W, C) float32 tensor. When `out` is given (for example
+    # a slice batch[i:i + 1] of a preallocated batch) the pixels are written
+    # straight into it from PIL's uint8 buffer with no float64 temporary.
+    size = (model_input_shape[1], model_input_shape[2])
+    channels = model_input_shape[-1]
+    img = _resize_convert(img, size, channels)
+    if out is None:
+        out = np.empty((1,) + size + (channels,), dtype=np.float32)
+    pixels = np.asarray(img, dtype=np.uint8).reshape(out.shape)
+    np.multiply(pixels, _INV_255, out=out, dtype=np.float32)
+    return out
+
+
+# ---------------- BATCH PREPROCESS ----------------
+class BatchBuffer:
+    # Reusable (capacity, H, W, C) float32 buffer. It only reallocates when a
+    # larger batch than any before arrives, so repeated batches reuse memory.
+    def __init__(self, model_input_shape, capacity=32):
+        self.shape = tuple(model_input_shape[1:])
+        self.array = np.empty((capacity,) + self.shape, dtype=np.float32)
+
+    def reserve(self, n):
+        if n > len(self.array):
+            self.array = np.empty((n,) + self.shape, dtype=np.float32)
+        return self.array[:n]
+
+
+def preprocess_batch(images, model_input_shape, buffer=None):
+    # One contiguous (N, H, W, C) float32 array, filled row by row. With a
+    # BatchBuffer the result is a view into it and is only valid until the
+    # buffer is used again.
+    images = list(images)
+    if buffer is None:
+        buffer = BatchBuffer(model_input_shape, len(images))
+    batch = buffer.reserve(len(images))
+    for i, img in enumerate(images):
+        preprocess_image(img, model_input_shape, out=batch[i:i + 1])
+    return batch
+
+
+# ---------------- DECODE MEMORY ----------------
+_DECODE_CHILD = """
+import resource, sys
+sys.path.insert(0, {here!r})
+from PIL import Image, ImageOps
+from preprocessing import decode_image, preprocess_image
+
+def peak():
+    # High-water RSS in bytes (VmHWM on Linux, ru_maxrss elsewhere).
+    try:
+        with open("/proc/self/status") as f:
+            return next(int(l.split()[1]) for l in f if l.startswith("VmHWM")) * 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+before = peak()
+if {reduced!r}:
+    img, _ = decode_image({path!r}, {min_side!r})
+else:
+    img = Image.open({path!r})
+    img.load()
+    img = ImageOps.exif_transpose(img)
+preprocess_image(img, (None, 128, 128, 3))
+ImageOps.contain(img, (768, 768))
+print(peak() - before)
+"""
+
+
+def decode_memory_check(sizes=((4032, 3024), (8000, 6000)), min_side=512):
+    # Peak RSS growth of decoding one phone-sized JPEG into the model tensor
+    # and the page thumbnail, the old way (full decode) and with
+    # decode_image. Each run is a fresh interpreter so the peaks are not
+    # shared.
+    import subprocess
+    import sys
+    import tempfile
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    rng = np.random.default_rng(0)
+    seed = Image.fromarray(rng.integers(0, 256, (300, 400, 3), dtype=np.uint8), "RGB")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for width, height in sizes:
+            path = os.path.join(tmp, f"{width}x{height}.jpg")
+            seed.resize((width, height)).save(path, quality=90)
+            for reduced in (False, True):
+                code = _DECODE_CHILD.format(here=here, path=path, min_side=min_side, reduced=reduced)
+                out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+                results[(width, height, "decode_image" if reduced else "full decode")] = int(out.stdout)
+    return results
+
+
+if __name__ == "__main__":
+    for (width, height, method), peak in decode_memory_check().items():
+        print(f"{width}x{height} {method:<13} peak RSS +{peak / 2 ** 20:.1f} MB")
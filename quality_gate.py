@@ -0,0 +1,238 @@
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+# ---------------- CONFIG ----------------
+# off | flag (warn, still predict) | reject (no CNN call). Flag until the
+# thresholds below are calibrated on real udder photos (see main()).
+MODE = os.environ.get("MASTITIS_QUALITY_MODE", "flag")
+# Shortest side of the original photo, in pixels.
+MIN_SIDE = int(os.environ.get("MASTITIS_QUALITY_MIN_SIDE", "128"))
+# Variance of the 4-neighbour Laplacian of the preprocessed grayscale image
+# (values in [0, 1]). A sharp photo downscaled to 128 px scores around 0.005;
+# a 640 px photo blurred with a 8 px Gaussian drops below 0.0001.
+MIN_SHARPNESS = float(os.environ.get("MASTITIS_QUALITY_MIN_SHARPNESS", "0.0005"))
+# Mean luminance bounds and the share of near-black / near-white pixels.
+MIN_BRIGHTNESS = float(os.environ.get("MASTITIS_QUALITY_MIN_BRIGHTNESS", "0.12"))
+MAX_BRIGHTNESS = float(os.environ.get("MASTITIS_QUALITY_MAX_BRIGHTNESS", "0.90"))
+MAX_CLIPPED = float(os.environ.get("MASTITIS_QUALITY_MAX_CLIPPED", "0.35"))
+# Luminance standard deviation; a blank wall or a lens cap is nearly flat.
+MIN_CONTRAST = float(os.environ.get("MASTITIS_QUALITY_MIN_CONTRAST", "0.02"))
+
+MODES = ("off", "flag", "reject")
+ISSUES = {
+    "too_small": "resolution is too low",
+    "blurry": "the photo is blurry",
+    "too_dark": "the photo is too dark",
+    "too_bright": "the photo is overexposed",
+    "clipped": "large areas are pure black or white",
+    "low_contrast": "there is almost no detail in the photo",
+    # Files that never reach the checks because they cannot be decoded.
+    "too_large": "the photo is too large to decode",
+    "unreadable": "the file is not a readable image",
+}
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+_DARK, _BRIGHT = 0.02, 0.98
+
+
+# ---------------- CHECKS ----------------
+def measure(batch):
+    # batch: (N, H, W, C) float32 in [0, 1] as produced by preprocessing.py.
+    # Returns per-image metrics as arrays; the whole batch is a handful of
+    # vectorized passes over N x H x W values.
+    batch = np.asarray(batch, dtype=np.float32)
+    gray = batch @ _LUMA if batch.shape[-1] == 3 else batch[..., 0]
+    lap = gray[:, :-2, 1:-1] + gray[:, 2:, 1:-1] + gray[:, 1:-1, :-2] + gray[:, 1:-1, 2:] - 4.0 * gray[:, 1:-1, 1:-1]
+    pixels = gray.shape[1] * gray.shape[2]
+    flat = gray.reshape(len(gray), -1)
+    return {
+        "sharpness": lap.reshape(len(lap), -1).var(axis=1),
+        "brightness": flat.mean(axis=1),
+        "contrast": flat.std(axis=1),
+        "clipped": (np.count_nonzero(flat < _DARK, axis=1) + np.count_nonzero(flat > _BRIGHT, axis=1)) / pixels,
+    }
+
+
+def find_issues(metrics, sizes=None):
+    # Boolean (N,) array per issue code.
+    n = len(metrics["sharpness"])
+    min_side = np.array([min(s) for s in sizes]) if sizes is not None else np.full(n, np.inf)
+    return {
+        "too_small": min_side < MIN_SIDE,
+        "blurry": metrics["sharpness"] < MIN_SHARPNESS,
+        "too_dark": metrics["brightness"] < MIN_BRIGHTNESS,
+        "too_bright": metrics["brightness"] > MAX_BRIGHTNESS,
+        "clipped": metrics["clipped"] > MAX_CLIPPED,
+        "low_contrast": metrics["contrast"] < MIN_CONTRAST,
+    }
+
+
+class QualityReport:
+    __slots__ = ("issues", "metrics", "mode", "seconds")
+
+    def __init__(self, issues, metrics, mode=MODE, seconds=0.0):
+        self.issues = issues
+        self.metrics = metrics
+        self.mode = mode
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return not self.issues
+
+    @property
+    def rejected(self):
+        return bool(self.issues) and self.mode == "reject"
+
+    def message(self):
+        return "; ".join(ISSUES[i] for i in self.issues)
+
+
+def check_batch(batch, sizes=None, mode=None, count=True):
+    # One QualityReport per image; sizes are the original (width, height).
+    # With count=False the counters are left alone, for checks made ahead
+    # of a prediction that may never be asked for; the caller passes the
+    # report to gate_stats.add() when it is.
+    mode = mode or MODE
+    if mode == "off":
+        return [QualityReport([], {}, mode) for _ in range(len(batch))]
+    start = time.perf_counter()
+    metrics = measure(batch)
+    issues = find_issues(metrics, sizes)
+    seconds = (time.perf_counter() - start) / len(batch)
+    reports = []
+    for i in range(len(batch)):
+        found = [code for code, mask in issues.items() if mask[i]]
+        reports.append(QualityReport(found, {k: float(v[i]) for k, v in metrics.items()}, mode, seconds))
+    if count:
+        gate_stats.add(reports)
+    return reports
+
+
+def check_image(tensor, size=None, mode=None, count=True):
+    return check_batch(tensor, None if size is None else [size], mode, count)[0]
+
+
+def decode_failure(code, count=True):
+    # Report for a file that could not be decoded ("too_large" or
+    # "unreadable"). It is never scored, so it counts as rejected in any mode.
+    report = QualityReport([code], {}, "reject")
+    if count:
+        gate_stats.add([report])
+    return report
+
+
+# ---------------- COUNTERS ----------------
+class GateStats:
+    # Process-wide totals shared by every page and session: how many
+    # predictions were checked, flagged and rejected (each rejection is a
+    # CNN call not made), per issue, and the time spent checking.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checked = self.flagged = self.rejected = self.timed = 0
+            self.seconds = 0.0
+            self.issues = dict.fromkeys(ISSUES, 0)
+
+    def add(self, reports):
+        with self._lock:
+            for r in reports:
+                if r.mode == "off":
+                    continue
+                self.checked += 1
+                if r.metrics:
+                    # Decode failures are never measured; keep them out of
+                    # the mean check time.
+                    self.timed += 1
+                    self.seconds += r.seconds
+                if r.issues:
+                    if r.rejected:
+                        self.rejected += 1
+                    else:
+                        self.flagged += 1
+                    for code in r.issues:
+                        self.issues[code] += 1
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "flagged": self.flagged,
+                "rejected": self.rejected,
+                "cnn_calls_saved": self.rejected,
+                "reject_rate": round(self.rejected / self.checked, 4) if self.checked else None,
+                "mean_check_ms": round(self.seconds * 1000.0 / self.timed, 4) if self.timed else None,
+                "issues": dict(self.issues),
+            }
+
+
+gate_stats = GateStats()
+
+
+def render_gate_caption():
+    import streamlit as st
+
+    s = gate_stats.as_dict()
+    if s["checked"]:
+        st.caption(f"Quality gate: {s['rejected']} of {s['checked']} image(s) rejected "
+                   f"({s['cnn_calls_saved']} CNN calls saved), {s['flagged']} flagged; "
+                   f"{s['mean_check_ms']:.3f} ms per check.")
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run the image-quality gate over a folder to see what the current thresholds would reject.")
+    parser.add_argument("image_dir")
+    parser.add_argument("--size", type=int, default=128, help="Preprocessed side length")
+    parser.add_argument("--show", type=int, default=10, help="List this many rejected files")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    from preprocessing import decode_image, preprocess_image, ImageTooLarge
+
+    args = parse_args(argv)
+    shape = (None, args.size, args.size, 3)
+    rejected = []
+    for root, _, names in os.walk(args.image_dir):
+        for name in sorted(names):
+            if not name.lower().endswith((".jpg", ".jpeg", ".png")):
+                continue
+            path = os.path.join(root, name)
+            # One oversized or corrupt file is reported, not fatal.
+            try:
+                img, size = decode_image(path, args.size)
+            except ImageTooLarge:
+                report = decode_failure("too_large")
+            except OSError:
+                report = decode_failure("unreadable")
+            else:
+                report = check_image(preprocess_image(img, shape), size, mode="reject")
+            if report.issues:
+                rejected.append((path, report))
+
+    s = gate_stats.as_dict()
+    print(f"{s['checked']} images, {s['rejected']} rejected ({100 * (s['reject_rate'] or 0):.1f}%), "
+          f"{s['mean_check_ms']} ms per check")
+    for code, count in s["issues"].items():
+        print(f"  {code:<13} {count}")
+    for path, report in rejected[:args.show]:
+        m = report.metrics
+        if not m:
+            print(f"{path}: {', '.join(report.issues)}")
+            continue
+        print(f"{path}: {', '.join(report.issues)} (sharpness {m['sharpness']:.5f}, "
+              f"brightness {m['brightness']:.2f}, contrast {m['contrast']:.3f}, clipped {m['clipped']:.2f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+from io import BytesIO
+from datetime import datetime
+
+# reportlab is imported on the first report, so pages only pay for it when
+# a PDF is actually produced.
+
+# ---------------- SHARED STYLES ----------------
+# getSampleStyleSheet() builds a fresh stylesheet on every call; build it
+# once per process and share it across all reports.
+_styles = None
+
+
+def _get_styles():
+    global _styles
+    if _styles is None:
+        from reportlab.lib.styles import getSampleStyleSheet
+        _styles = getSampleStyleSheet()
+    return _styles
+
+RECOMMENDATION = "Please consult a veterinary professional for confirmation and treatment."
+
+
+def _now():
+    return datetime.now().strftime('%d-%m-%Y %H:%M:%S')
+
+
+# ---------------- SINGLE REPORT TEMPLATE ----------------
+def render_report(title, fields, symptoms=None, date_time=None, out=None):
+    # One-page report: a title, "<b>label:</b> value" lines (a (None, None)
+    # field is a gap), an optional observed-symptoms list and a timestamp.
+    # `symptoms=None` leaves the symptoms section out; an empty list prints
+    # "None". Writes to `out` (path or file object) or to a new BytesIO,
+    # which is returned rewound.
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.pagesizes import A4
+
+    styles = _get_styles()
+    title_style, normal = styles["Title"], styles["Normal"]
+    buffer = BytesIO() if out is None else out
+    doc = SimpleDocTemplate(buffer, pagesize=A4)
+    content = [Paragraph(f"<b>{title}</b>", title_style), Spacer(1, 20)]
+
+    for label, value in fields:
+        if label is None:
+            content.append(Spacer(1, 10))
+        else:
+            content.append(Paragraph(f"<b>{label}:</b> {value}", normal))
+
+    if symptoms is not None:
+        content.append(Spacer(1, 10))
+        if symptoms:
+            content.append(Paragraph("<b>Observed Symptoms:</b>", normal))
+            for sym in symptoms:
+                content.append(Paragraph(f"- {sym}", normal))
+        else:
+            content.append(Paragraph("<b>Observed Symptoms:</b> None", normal))
+
+    content.append(Spacer(1, 10))
+    content.append(Paragraph(f"<b>Date & Time:</b> {date_time or _now()}", normal))
+    doc.build(content)
+    if out is None:
+        buffer.seek(0)
+    return buffer
+
+
+SPACER = (None, None)
+
+
+def generate_image_report(result, confidence, out=None):
+    return render_report("Mastitis Detection Report", [
+        ("Detection Type", "Image-Based Detection"), SPACER,
+        ("Prediction Result", result), SPACER,
+        ("Confidence", f"{confidence:.2f}%"), SPACER,
+        ("Recommendation", RECOMMENDATION),
+    ], out=out)
+
+
+def generate_hybrid_report(final_result, img_pred, sym_pred, final_pred, selected_symptoms,
+                           decision_path=None, out=None):
+    # img_pred is None when the cascade skipped the image model.
+    fields = [
+        ("Image-Based Prediction", "Skipped (symptoms conclusive)" if img_pred is None else f"{img_pred*100:.2f}%"),
+        ("Symptoms-Based Prediction", f"{sym_pred*100:.2f}%"),
+        ("Hybrid Prediction", f"{final_pred*100:.2f}%"), SPACER,
+        ("Final Result", final_result),
+    ]
+    if decision_path is not None:
+        fields.append(("Decision Path", decision_path))
+    return render_report("Hybrid Mastitis Detection Report", fields, symptoms=selected_symptoms, out=out)
+
+
+def generate_symptom_report(result, message, observed, date_time, out=None):
+    return render_report("Mastitis Detection Report", [
+        ("Result", result),
+        ("Message", message),
+    ], symptoms=observed, date_time=date_time, out=out)
+
+
+# ---------------- HERD REPORT ----------------
+# Multi-page table for many animals, drawn straight onto a canvas: records
+# are consumed one at a time from any iterable and each page is flushed
+# (compressed) as soon as it is full, so no list of records or flowables is
+# ever built. ReportLab keeps the finished, compressed page streams until
+# save(), a few KB per page.
+HERD_COLUMNS = [
+    ("Cow ID", 50, "cow_id"),
+    ("Image %", 140, "image_probability"),
+    ("Symptoms %", 205, "symptom_probability"),
+    ("Hybrid %", 280, "hybrid_probability"),
+    ("Result", 340, "result"),
+    ("Observed symptoms", 440, "symptoms"),
+]
+HERD_ROWS_PER_PAGE = 45
+_ROW_HEIGHT = 15
+_RIGHT_MARGIN = 40
+
+
+def _fit(text, max_width, font="Helvetica", size=9):
+    # Cuts text to the column width with an ellipsis so long symptom lists
+    # and IDs never run into the next column or off the page.
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    if stringWidth(text, font, size) <= max_width:
+        return text
+    while text and stringWidth(text + "...", font, size) > max_width:
+        text = text[:-1]
+    return text.rstrip(", ") + "..."
+
+
+def _cell(record, key):
+    value = record.get(key)
+    if value is None or value == "":
+        return "-"
+    if key.endswith("_probability"):
+        return f"{float(value) * 100:.1f}"
+    if key == "symptoms":
+        return ", ".join(value) if value else "None"
+    return str(value)
+
+
+def _herd_page_header(c, title, page, width, height):
+    top = height - 60
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, height - 35, title)
+    c.setFont("Helvetica", 8)
+    c.drawRightString(width - _RIGHT_MARGIN, height - 35, f"Page {page}")
+    c.setFont("Helvetica-Bold", 9)
+    for label, x, _ in HERD_COLUMNS:
+        c.drawString(x, top, label)
+    c.line(45, top - 4, width - _RIGHT_MARGIN, top - 4)
+    c.setFont("Helvetica", 9)
+
+
+def herd_report_pages(n_records, rows_per_page=HERD_ROWS_PER_PAGE):
+    # Table pages plus the summary page.
+    return max(1, -(-n_records // rows_per_page)) + 1
+
+
+def generate_herd_report(records, out=None, title="Herd Mastitis Report",
+                         rows_per_page=HERD_ROWS_PER_PAGE, threshold=0.5):
+    # records: iterable of dicts with cow_id, image_probability,
+    # symptom_probability, hybrid_probability, result and symptoms (list).
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    width, height = A4
+    top = height - 60
+    buffer = BytesIO() if out is None else out
+    c = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    c.setTitle(title)
+
+    # Each column may use the space up to the next one (the last up to the
+    # right margin).
+    edges = [x for _, x, _ in HERD_COLUMNS[1:]] + [width - _RIGHT_MARGIN]
+    columns = [(x, key, edge - x - 6) for (_, x, key), edge in zip(HERD_COLUMNS, edges)]
+
+    page = 1
+    row = 0
+    total = positives = 0
+    _herd_page_header(c, title, page, width, height)
+    for record in records:
+        if row == rows_per_page:
+            c.showPage()
+            page += 1
+            row = 0
+            _herd_page_header(c, title, page, width, height)
+        y = top - 20 - row * _ROW_HEIGHT
+        for x, key, max_width in columns:
+            c.drawString(x, y, _fit(_cell(record, key), max_width))
+        row += 1
+        total += 1
+        hybrid = record.get("hybrid_probability")
+        if hybrid is not None and hybrid != "" and float(hybrid) > threshold:
+            positives += 1
+
+    c.showPage()
+    c.setFont("Helvetica-Bold", 14)
+    c.drawString(50, height - 60, f"{title} - Summary")
+    c.setFont("Helvetica", 11)
+    lines = [
+        f"Animals assessed: {total}",
+        f"Above threshold ({threshold * 100:.0f}% hybrid): {positives}",
+        f"Below threshold: {total - positives}",
+        f"Generated: {_now()}",
+        f"Recommendation: {RECOMMENDATION}",
+    ]
+    for i, line in enumerate(lines):
+        c.drawString(50, height - 95 - i * 18, line)
+    c.showPage()
+    c.save()
+
+    if out is None:
+        buffer.seek(0)
+    return buffer
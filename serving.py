@@ -0,0 +1,64 @@
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+
+# ---------------- THREADING ----------------
+INTRA_OP_THREADS = int(os.environ.get("MASTITIS_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.environ.get("MASTITIS_INTER_OP_THREADS", "0"))
+USE_XLA = os.environ.get("MASTITIS_XLA", "0") == "1"
+
+_threads_configured = False
+
+
+def configure_threads(intra=None, inter=None):
+    # 0 leaves the choice to TensorFlow. Thread pools can only be sized
+    # before the TF runtime starts, so this runs before the first model load.
+    global _threads_configured
+    if _threads_configured:
+        return
+    intra = INTRA_OP_THREADS if intra is None else intra
+    inter = INTER_OP_THREADS if inter is None else inter
+    try:
+        if intra:
+            tf.config.threading.set_intra_op_parallelism_threads(intra)
+        if inter:
+            tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError:
+        # TF was already initialized by someone else; keep its settings.
+        pass
+    _threads_configured = True
+
+
+# ---------------- COMPILED MODEL ----------------
+class CompiledModel:
+    # Calls the Keras model through one tf.function with a fixed
+    # (None, ...) float32 signature. Unlike model.predict this skips the data
+    # adapter and callback setup on every call, and since the trace is done
+    # at warm-up the first real request does not pay for it. The graph is
+    # the same model(x, training=False) call that predict runs, so outputs
+    # are unchanged (XLA, when enabled, may differ in the last bits).
+    def __init__(self, model, jit_compile=None, warmup_batch_sizes=(1,)):
+        self.model = model
+        self.input_shape = tuple(model.input_shape)
+        self.jit_compile = USE_XLA if jit_compile is None else jit_compile
+        spec = tf.TensorSpec((None,) + self.input_shape[1:], tf.float32)
+        self._fn = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[spec],
+            jit_compile=self.jit_compile,
+        )
+        self.warmup_seconds = self.warmup(warmup_batch_sizes)
+
+    def warmup(self, batch_sizes):
+        start = time.perf_counter()
+        for n in batch_sizes:
+            self._fn(tf.zeros((n,) + self.input_shape[1:], tf.float32))
+        return time.perf_counter() - start
+
+    def predict(self, x, verbose=0):
+        return self._fn(tf.convert_to_tensor(np.asarray(x), tf.float32)).numpy()
+
+    def __call__(self, x, training=False):
+        return self.predict(x)
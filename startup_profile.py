@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# ---------------- ENTRY POINTS ----------------
+ENTRY_POINTS = ["app.py", "home.py", "about.py", "contact.py", "image.py", "symptoms.py", "hybrid.py", "history.py",
+                "herd_dashboard.py"]
+# Pages that must open without TensorFlow, ever.
+LIGHT_PAGES = ["app.py", "home.py", "about.py", "contact.py", "history.py", "herd_dashboard.py"]
+HEAVY_MODULES = ["tensorflow", "keras", "reportlab", "PIL", "pandas"]
+
+# Runs one page script the way `streamlit run` would on first open (no
+# uploads, no button presses) and reports what ended up in sys.modules.
+_RUNNER = """
+import json, runpy, sys, time, warnings, logging
+warnings.filterwarnings("ignore")
+logging.disable(logging.WARNING)
+start = time.perf_counter()
+runpy.run_path(sys.argv[1], run_name="__main__")
+wall = time.perf_counter() - start
+heavy = json.loads(sys.argv[2])
+print("@@" + json.dumps({
+    "wall_ms": wall * 1000.0,
+    "modules": len(sys.modules),
+    "loaded": [m for m in heavy if m in sys.modules],
+}))
+"""
+
+
+# ---------------- PROFILE ----------------
+def parse_importtime(stderr):
+    # `python -X importtime` lines: "import time: self | cumulative | name",
+    # nesting shown by indentation of the name. Top-level imports are summed
+    # per root package.
+    per_package = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|", 2)
+        if name.startswith("  "):
+            continue
+        per_package[name.strip().split(".")[0]] += int(cumulative)
+    return per_package
+
+
+def profile_entry_point(script):
+    env = dict(os.environ, PYTHONPATH=HERE + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _RUNNER, os.path.join(HERE, script), json.dumps(HEAVY_MODULES)],
+        cwd=HERE, env=env, capture_output=True, text=True,
+    )
+    marker = [line for line in proc.stdout.splitlines() if line.startswith("@@")]
+    if proc.returncode != 0 or not marker:
+        raise RuntimeError(f"{script} failed to run:\n{proc.stderr[-2000:]}")
+    result = json.loads(marker[-1][2:])
+    per_package = parse_importtime(proc.stderr)
+    result["import_ms"] = sum(per_package.values()) / 1000.0
+    result["top_imports_ms"] = {
+        name: us / 1000.0 for name, us in sorted(per_package.items(), key=lambda kv: -kv[1])[:6]
+    }
+    return result
+
+
+def print_profile(profiles):
+    print(f"{'entry point':<18} {'wall ms':>9} {'import ms':>10} {'modules':>8}  heavy modules / top imports")
+    for script, p in profiles.items():
+        heavy = ",".join(p["loaded"]) or "-"
+        top = ", ".join(f"{name} {ms:.0f}" for name, ms in p["top_imports_ms"].items())
+        print(f"{script:<18} {p['wall_ms']:9.0f} {p['import_ms']:10.0f} {p['modules']:8d}  [{heavy}] {top}")
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start import profile of each Streamlit entry point.")
+    parser.add_argument("scripts", nargs="*", default=ENTRY_POINTS, help="Entry points to profile")
+    parser.add_argument("--json", default=None, help="Also write the profile to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    profiles = {script: profile_entry_point(script) for script in args.scripts}
+    print_profile(profiles)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(profiles, f, indent=2)
+
+    # Exit non-zero if a light page pulled in TensorFlow.
+    offenders = [s for s in args.scripts if s in LIGHT_PAGES and "tensorflow" in profiles[s]["loaded"]]
+    for script in offenders:
+        print(f"FAIL: {script} imports tensorflow", file=sys.stderr)
+    return 1 if offenders else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
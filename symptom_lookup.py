@@ -0,0 +1,62 @@
+import numpy as np
+
+# ---------------- SYMPTOM ENCODING ----------------
+# The symptom ANN takes six binary checkbox inputs, so there are only 2^6
+# distinct inputs. Symptom i is stored in bit i of the packed index.
+N_SYMPTOMS = 6
+N_COMBINATIONS = 1 << N_SYMPTOMS
+_BITS = np.arange(N_SYMPTOMS)
+
+
+def symptom_bitmask(symptoms):
+    mask = 0
+    for i, val in enumerate(symptoms):
+        if val:
+            mask |= 1 << i
+    return mask
+
+
+def all_symptom_vectors():
+    # Row k is the 0/1 symptom vector whose bitmask is k.
+    return ((np.arange(N_COMBINATIONS)[:, None] >> _BITS) & 1).astype(int)
+
+
+# ---------------- LOOKUP ENGINE ----------------
+class SymptomLookup:
+    def __init__(self, table):
+        table = np.ascontiguousarray(table, dtype=np.float32).reshape(-1)
+        if table.shape != (N_COMBINATIONS,):
+            raise ValueError(f"Expected {N_COMBINATIONS} entries, got {table.shape[0]}")
+        self.table = table
+
+    @classmethod
+    def from_model(cls, model, atol=1e-5):
+        vectors = all_symptom_vectors()
+        lookup = cls(model.predict(vectors, verbose=0)[:, 0])
+        lookup.verify(model, atol)
+        return lookup
+
+    def verify(self, model, atol=1e-5):
+        # Compare every entry against a single-sample forward pass, the same
+        # shape the pages used to send, so batching cannot hide a mismatch.
+        vectors = all_symptom_vectors()
+        live = np.array(
+            [float(np.asarray(model(vectors[i:i + 1], training=False))[0][0])
+             for i in range(N_COMBINATIONS)],
+            dtype=np.float32,
+        )
+        worst = float(np.max(np.abs(live - self.table)))
+        if worst > atol:
+            raise ValueError(
+                f"Symptom lookup table differs from live model by {worst:.2e} (atol={atol:.0e})"
+            )
+        return worst
+
+    def predict(self, symptoms):
+        return float(self.table[symptom_bitmask(symptoms)])
+
+    def predict_bitmask(self, mask):
+        return float(self.table[mask])
+
+    def predict_batch(self, masks):
+        return self.table[np.asarray(masks, dtype=np.intp)]
@@ -1,11 +1,10 @@
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
 import streamlit as st
-import tensorflow as tf
-import numpy as np
-import time
 from datetime import datetime
-import io
+
+from model_registry import get_symptom_lookup
+from reports import generate_symptom_report
+from history_store import record_prediction
+from tracing import Trace, render_trace, demo_delay
 
 # ---------------- PAGE CONFIG ----------------
 st.set_page_config(
@@ -151,10 +150,8 @@ st.markdown("""
 st.markdown('<div class="title-text">📋 Symptoms-Based Mastitis Detection</div>', unsafe_allow_html=True)
 st.markdown('<div class="subtitle">Detect mastitis based on observed clinical symptoms</div>', unsafe_allow_html=True)
 
-# ---------------- LOAD MODEL ----------------
-model = tf.keras.models.load_model("symptom1_model.h5")
-
 # ---------------- SYMPTOMS CHECKBOXES ----------------
+cow_id = st.text_input("🐄 Cow ID (optional)", key="cow_id")
 st.subheader("✔ Select Observed Symptoms")
 
 symptoms_labels = [
@@ -177,9 +174,12 @@ for i, label in enumerate(symptoms_labels):
 if st.button("🔍 Predict"):
     if any(symptoms):  # <-- Check if at least one symptom is selected
         with st.spinner("Analyzing symptoms..."):
-            time.sleep(1.2)
-            data = np.array(symptoms, dtype=int).reshape(1, 6)
-            pred = model.predict(data)[0][0]
+            demo_delay(1.2)
+            # Loaded on the first prediction rather than when the page opens.
+            symptom_lookup = get_symptom_lookup()
+            trace = Trace("symptoms")
+            with trace.stage("symptom_inference"):
+                pred = symptom_lookup.predict(symptoms)
 
             date_time = datetime.now().strftime("%d-%m-%Y %H:%M")
 
@@ -200,28 +200,9 @@ if st.button("🔍 Predict"):
             """, unsafe_allow_html=True)
 
             # ---------------- CREATE PDF ----------------
-            buffer = io.BytesIO()
-            c = canvas.Canvas(buffer, pagesize=A4)
-            c.setFont("Helvetica-Bold", 22)
-            c.drawCentredString(A4[0]/2, 800, "Mastitis Detection Report")
-            c.setFont("Helvetica", 14)
-            c.drawString(50, 760, f"Date & Time: {date_time}")
-            c.drawString(50, 740, f"Result: {result}")
-            c.drawString(50, 720, f"Message: {message}")
-
             observed = [symptoms_labels[i] for i, val in enumerate(symptoms) if val]
-            if observed:
-                c.drawString(50, 700, "Symptoms Observed:")
-                y = 680
-                for sym in observed:
-                    c.drawString(70, y, f"- {sym}")
-                    y -= 20
-            else:
-                c.drawString(50, 700, "Symptoms Observed: None")
-
-            c.showPage()
-            c.save()
-            buffer.seek(0)
+            with trace.stage("pdf"):
+                buffer = generate_symptom_report(result, message, observed, date_time)
 
             # ---------------- DOWNLOAD BUTTON ----------------
             st.download_button(
@@ -230,6 +211,10 @@ if st.button("🔍 Predict"):
                 file_name="mastitis_detection_report.pdf",
                 mime="application/pdf"
             )
+
+            record_prediction("symptoms", result, cow_id=cow_id, symptom_probability=pred, symptoms=symptoms)
+            trace.log(mastitis_probability=pred)
+            render_trace(trace)
     else:
         st.warning("⚠ Please select at least one symptom to check for Mastitis.")
 
@@ -0,0 +1,119 @@
+import random
+import sqlite3
+from datetime import date, datetime, time
+
+import pytest
+
+import herd_stats
+from herd_stats import WINDOWS
+
+THRESHOLD = 0.5
+START = date(2026, 1, 1).toordinal()
+
+
+def ts_on(day, seconds=0):
+    return datetime.combine(date.fromordinal(day), time(8)).timestamp() + seconds
+
+
+def row(cow_id, day, score, source="hybrid", seconds=0):
+    return (cow_id, ts_on(day, seconds), source, None, None, score, "", None, None, None)
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    herd_stats.create(conn, THRESHOLD)
+    yield conn
+    conn.close()
+
+
+def brute_force(rows, as_of, cows=()):
+    # Window sums recomputed from scratch: hybrid rows with a cow ID whose
+    # day falls in (as_of - w, as_of]. Cows given a pen have a row too.
+    expected = {cow_id: {c: 0 for c in herd_stats._WINDOW_COLUMNS} for cow_id in cows}
+    for cow_id, ts, source, _, _, score, *_ in rows:
+        if source != "hybrid" or not cow_id:
+            continue
+        stats = expected.setdefault(cow_id, {c: 0 for c in herd_stats._WINDOW_COLUMNS})
+        day = herd_stats.day_ordinal(ts)
+        for w in WINDOWS:
+            if as_of - w < day <= as_of:
+                stats[f"n{w}"] += 1
+                stats[f"sum{w}"] += score
+                stats[f"pos{w}"] += score > THRESHOLD
+    return expected
+
+
+def cow_windows(conn):
+    cols = herd_stats._WINDOW_COLUMNS
+    return {r[0]: dict(zip(cols, r[1:])) for r in conn.execute(f"SELECT cow_id, {', '.join(cols)} FROM cow_stats")}
+
+
+def assert_windows(conn, rows):
+    pens = [r[0] for r in conn.execute("SELECT cow_id FROM cow_pens")]
+    got, expected = cow_windows(conn), brute_force(rows, herd_stats.as_of(conn), pens)
+    assert got.keys() == expected.keys()
+    for cow_id, stats in expected.items():
+        assert got[cow_id] == pytest.approx(stats, abs=1e-9), cow_id
+
+
+# ---------------- WINDOWS ----------------
+def test_day_roll_over(conn):
+    herd_stats.update(conn, [row("C1", START, 0.9)], THRESHOLD)
+    for offset, inside in [(6, (1, 1)), (7, (0, 1)), (29, (0, 1)), (30, (0, 0))]:
+        herd_stats.advance_to(conn, START + offset)
+        stats = cow_windows(conn)["C1"]
+        assert (stats["n7"], stats["n30"]) == inside, offset
+        assert (stats["pos7"], stats["pos30"]) == inside, offset
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_windows_match_brute_force(conn, seed):
+    # Mostly in-order days with late arrivals, ignored rows, days without
+    # predictions and jumps shorter and longer than each window.
+    rng = random.Random(seed)
+    herd_stats.assign_pens(conn, {"C0": "A", "C1": "A", "C2": "B"})
+    day, seen = START, []
+    for _ in range(60):
+        day += rng.choice([0, 0, 1, 1, 2, 3, 8, 31])
+        batch = []
+        for _ in range(rng.randint(1, 6)):
+            late = day - rng.randint(0, 40) if rng.random() < 0.2 else day
+            source = "hybrid" if rng.random() < 0.85 else "image"
+            cow_id = rng.choice(["C0", "C1", "C2", "C3", "C4", ""])
+            batch.append(row(cow_id, late, rng.random(), source, rng.randint(0, 3600)))
+        herd_stats.update(conn, batch, THRESHOLD)
+        seen += batch
+        if rng.random() < 0.2:
+            day += rng.randint(1, 35)
+            herd_stats.advance_to(conn, day)
+        assert_windows(conn, seen)
+
+    # Pen rows are the sums of their cows' rows, kept by the triggers.
+    cows = cow_windows(conn)
+    pens = dict(conn.execute("SELECT cow_id, pen FROM cow_stats"))
+    for pen in herd_stats.pen_table(conn):
+        members = [c for c, p in pens.items() if p == pen["pen"]]
+        for w in WINDOWS:
+            assert pen[f"positives{w}"] == sum(cows[c][f"pos{w}"] for c in members)
+
+
+def test_rebuild_matches_incremental(conn):
+    # rebuild() ends at today, so the history leads up to today.
+    rng = random.Random(7)
+    today = date.today().toordinal()
+    rows = sorted((row(f"C{rng.randint(0, 4)}", today - rng.randint(0, 40), rng.random(), seconds=i)
+                   for i in range(300)), key=lambda r: r[1])
+    herd_stats.update(conn, rows, THRESHOLD)
+    herd_stats.advance_to(conn, today)
+    incremental = cow_windows(conn)
+
+    conn.execute("CREATE TABLE predictions (cow_id TEXT, ts REAL, source TEXT, image_probability REAL, "
+                 "symptom_probability REAL, hybrid_probability REAL)")
+    conn.executemany("INSERT INTO predictions VALUES (?, ?, ?, ?, ?, ?)", [r[:6] for r in rows])
+    herd_stats.rebuild(conn, THRESHOLD)
+    assert herd_stats.as_of(conn) == today
+    assert_windows(conn, rows)
+    assert cow_windows(conn).keys() == incremental.keys()
+    for cow_id, stats in incremental.items():
+        assert cow_windows(conn)[cow_id] == pytest.approx(stats, abs=1e-9)
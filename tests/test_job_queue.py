@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from job_queue import CANCELLED, DONE, FAILED, JobQueue, QueueFull
+
+
+def wait_done(jobs, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not jobs.get(job_id).done:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.005)
+    return jobs.get(job_id)
+
+
+@pytest.fixture
+def blocked():
+    # A one-worker queue whose worker is held by a running job until the
+    # test releases it, so everything submitted afterwards stays queued.
+    jobs = JobQueue(workers=1, max_depth=8, max_session_depth=3)
+    release, started = threading.Event(), threading.Event()
+
+    def hold(job):
+        started.set()
+        release.wait(5.0)
+
+    blocker = jobs.submit("blocker", "hold", hold)
+    assert started.wait(5.0)
+    yield jobs, release
+    release.set()
+    wait_done(jobs, blocker)
+
+
+# ---------------- SCHEDULING ----------------
+def test_round_robin_order_matches_position(blocked):
+    jobs, release = blocked
+    order = []
+    submitted = [(s, jobs.submit(s, name, lambda job, name=name: order.append(name)))
+                 for s, name in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1"), ("b", "b2"), ("c", "c1")]]
+    positions = {jobs.get(job_id).name: jobs.position(job_id) for _, job_id in submitted}
+    release.set()
+    for _, job_id in submitted:
+        wait_done(jobs, job_id)
+    assert order == ["a1", "b1", "c1", "a2", "b2", "a3"]
+    assert positions == {name: i for i, name in enumerate(order)}
+
+
+def test_depth_limits(blocked):
+    jobs, _ = blocked
+    for _ in range(3):
+        jobs.submit("a", "job", lambda job: None)
+    with pytest.raises(QueueFull):
+        jobs.submit("a", "one too many", lambda job: None)
+    for i in range(5):
+        jobs.submit(f"s{i}", "job", lambda job: None)
+    with pytest.raises(QueueFull):
+        jobs.submit("other", "past the global depth", lambda job: None)
+    assert jobs.stats()["queued"] == 8
+    assert jobs.counts["rejected"] == 2
+
+
+# ---------------- CANCEL AND CLEANUP ----------------
+def test_cancel_before_start_runs_cleanup_once(blocked):
+    jobs, _ = blocked
+    ran, cleaned = [], []
+    job_id = jobs.submit("a", "video", ran.append, cleanup=lambda: cleaned.append(1))
+    assert jobs.cancel(job_id)
+    assert jobs.get(job_id).state == CANCELLED
+    assert not jobs.cancel(job_id)
+    assert cleaned == [1] and ran == []
+    assert jobs.stats()["queued"] == 0
+
+
+def test_cancel_while_running_stops_at_next_progress():
+    jobs = JobQueue(workers=1)
+    started = threading.Event()
+
+    def loop(job):
+        started.set()
+        while True:
+            job.progress(0.5)
+            time.sleep(0.001)
+
+    job_id = jobs.submit("a", "loop", loop)
+    assert started.wait(5.0)
+    assert jobs.cancel(job_id)
+    assert wait_done(jobs, job_id).state == CANCELLED
+
+
+@pytest.mark.parametrize("fn, state", [(lambda job: 42, DONE), (lambda job: 1 / 0, FAILED)])
+def test_cleanup_runs_once_the_job_finishes(fn, state):
+    jobs = JobQueue(workers=1)
+    unblocked = []
+
+    def cleanup():
+        # Runs with the queue lock released: another thread can still
+        # read the queue's stats meanwhile.
+        reader = threading.Thread(target=jobs.stats)
+        reader.start()
+        reader.join(1.0)
+        unblocked.append(not reader.is_alive())
+
+    job = wait_done(jobs, jobs.submit("a", "job", fn, cleanup=cleanup))
+    assert job.state == state
+    assert unblocked == [True]
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from preprocessing import preprocess_batch, preprocess_image
+
+SHAPE = (None, 128, 128, 3)
+
+
+def reference_preprocess_image(img, model_input_shape):
+    # The float64 implementation previously copy-pasted into image.py and
+    # hybrid.py.
+    img = img.resize((model_input_shape[1], model_input_shape[2]))
+    channels = model_input_shape[-1]
+    if channels == 1:
+        img = img.convert("L")
+        arr = np.array(img) / 255.0
+        arr = arr.reshape(1, model_input_shape[1], model_input_shape[2], 1)
+    else:
+        img = img.convert("RGB")
+        arr = np.array(img) / 255.0
+        arr = arr.reshape(1, model_input_shape[1], model_input_shape[2], 3)
+    return arr
+
+
+@pytest.fixture(scope="module")
+def rgb():
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), "RGB")
+
+
+# ---------------- PARITY ----------------
+# RGB and grayscale inputs must match the reference up to float32 rounding.
+# Alpha and palette inputs are flattened onto white, so they are checked
+# with fully opaque images; the reference resized palette images with
+# nearest neighbour, so it is given the equivalent RGB image instead.
+# Grayscale models only take RGB and L inputs: alpha and palette images are
+# converted before the resize there, which the reference did not do.
+@pytest.mark.parametrize("mode, shape", [
+    ("RGB", SHAPE), ("L", SHAPE), ("RGBA", SHAPE), ("P", SHAPE),
+    ("RGB", (None, 128, 128, 1)), ("L", (None, 128, 128, 1)),
+])
+def test_matches_reference(rgb, mode, shape):
+    img = rgb.convert(mode)
+    expected = reference_preprocess_image(img.convert("RGB") if mode == "P" else img, shape)
+    got = preprocess_image(img, shape)
+    assert got.dtype == np.float32
+    assert got.shape == expected.shape
+    np.testing.assert_allclose(got, expected, rtol=0, atol=1e-6)
+
+
+def test_transparent_pixels_are_white():
+    clear = Image.new("RGBA", (64, 64), (0, 0, 0, 0))
+    assert np.all(preprocess_image(clear, SHAPE) == 1.0)
+
+
+def test_writes_into_out(rgb):
+    out = np.zeros((1,) + SHAPE[1:], dtype=np.float32)
+    assert preprocess_image(rgb, SHAPE, out=out) is out
+    np.testing.assert_array_equal(out, preprocess_image(rgb, SHAPE))
+
+
+# ---------------- BATCH ----------------
+def test_batch_is_contiguous_float32(rgb):
+    images = [rgb, rgb.convert("L"), rgb.convert("RGBA")]
+    batch = preprocess_batch(images, SHAPE)
+    assert batch.shape == (3,) + SHAPE[1:]
+    assert batch.dtype == np.float32
+    assert batch.flags["C_CONTIGUOUS"]
+    for row, img in zip(batch, images):
+        np.testing.assert_array_equal(row, preprocess_image(img, SHAPE)[0])
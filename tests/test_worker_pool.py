@@ -0,0 +1,116 @@
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+import pytest
+
+keras = pytest.importorskip("keras")
+worker_pool = pytest.importorskip("worker_pool")
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "SIGSTOP"), reason="needs POSIX signals")
+
+SHAPE = (8, 8, 3)
+
+
+@pytest.fixture(scope="module")
+def models(tmp_path_factory):
+    # Tiny stand-ins for the CNN and the symptom ANN; each worker loads them
+    # from the paths in the environment it inherits.
+    root = tmp_path_factory.mktemp("models")
+    keras.utils.set_random_seed(0)
+    cnn = keras.Sequential([keras.Input(SHAPE), keras.layers.Flatten(), keras.layers.Dense(1, activation="sigmoid")])
+    symptoms = keras.Sequential([keras.Input((6,)), keras.layers.Dense(1, activation="sigmoid")])
+    paths = {"MASTITIS_CNN_MODEL": str(root / "cnn.h5"), "MASTITIS_SYMPTOM_MODEL": str(root / "symptoms.h5")}
+    cnn.save(paths["MASTITIS_CNN_MODEL"])
+    symptoms.save(paths["MASTITIS_SYMPTOM_MODEL"])
+    with pytest.MonkeyPatch.context() as mp:
+        for key, value in paths.items():
+            mp.setenv(key, value)
+        yield cnn
+
+
+def make_pool(workers, **kwargs):
+    pool = worker_pool.WorkerPool(workers, threads_per_worker=1, start_timeout=120, **kwargs)
+    # The ready message can arrive before the worker's queue feeder releases
+    # the results lock it shares with the other workers; a worker stopped
+    # and killed in that window would leave the lock held for good.
+    time.sleep(0.5)
+    return pool
+
+
+def images(n, seed=0):
+    return np.random.default_rng(seed).random((n,) + SHAPE, dtype=np.float32)
+
+
+def pause(pool, worker_id):
+    os.kill(pool._workers[worker_id].process.pid, signal.SIGSTOP)
+
+
+def resume(pool, worker_id):
+    os.kill(pool._workers[worker_id].process.pid, signal.SIGCONT)
+
+
+# ---------------- ROUTING ----------------
+def test_batches_split_across_workers(models):
+    pool = make_pool(2, chunk_size=4)
+    try:
+        x = images(10)
+        expected = models.predict(x, verbose=0).ravel()
+        # Paused workers hold every request, so the routing is fixed:
+        # least-loaded first, ties to the worker that has served least.
+        pause(pool, 0)
+        pause(pool, 1)
+        futures = [pool.submit(x[i:i + 4]) for i in range(0, 10, 4)]
+        assert [w["in_flight_images"] for w in pool.stats()["workers"]] == [6, 4]
+        resume(pool, 0)
+        resume(pool, 1)
+        got = np.concatenate([f.result(timeout=30) for f in futures])
+        np.testing.assert_allclose(got, expected, atol=1e-5)
+        np.testing.assert_allclose(pool.predict_images(x), expected, atol=1e-5)
+        assert all(w["requests"] > 0 for w in pool.stats()["workers"])
+    finally:
+        pool.close()
+
+
+# ---------------- DEAD WORKERS ----------------
+def test_dead_worker_is_reaped_while_others_keep_answering(models):
+    pool = make_pool(2)
+    stop = threading.Event()
+    try:
+        pause(pool, 0)
+        stuck = pool.submit(images(2))
+        assert pool.stats()["workers"][0]["in_flight_images"] == 2
+
+        def keep_busy():
+            # Worker 1 returns results continuously, so the collector's
+            # queue never sits idle.
+            while not stop.is_set():
+                pool.submit(images(1)).result(timeout=30)
+
+        busy = threading.Thread(target=keep_busy)
+        busy.start()
+        os.kill(pool._workers[0].process.pid, signal.SIGKILL)
+        with pytest.raises(RuntimeError, match="exited"):
+            stuck.result(timeout=10)
+        assert [w["alive"] for w in pool.stats()["workers"]] == [False, True]
+        stop.set()
+        busy.join(30)
+    finally:
+        stop.set()
+        pool.close()
+
+
+def test_pool_without_live_workers_refuses_requests(models):
+    pool = make_pool(1)
+    try:
+        pause(pool, 0)
+        pending = pool.submit(images(3))
+        os.kill(pool._workers[0].process.pid, signal.SIGKILL)
+        with pytest.raises(RuntimeError, match="exited"):
+            pending.result(timeout=10)
+        with pytest.raises(RuntimeError, match="No inference workers"):
+            pool.submit(images(1))
+    finally:
+        pool.close()
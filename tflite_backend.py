@@ -0,0 +1,65 @@
+import os
+import threading
+
+import numpy as np
+
+# ---------------- BACKENDS ----------------
+# "keras" runs the .h5 files directly; the tflite variants run the files
+# written by export_lite.py next to them (e.g. final_cnn_model1_int8.tflite).
+BACKENDS = ("keras", "tflite-fp16", "tflite-int8")
+
+
+def lite_model_path(h5_path, backend):
+    variant = backend.split("-", 1)[1]
+    return f"{os.path.splitext(h5_path)[0]}_{variant}.tflite"
+
+
+def _interpreter_class():
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+# ---------------- TFLITE MODEL ----------------
+class TFLiteModel:
+    # Keras-like wrapper (input_shape, predict, __call__) so the pages,
+    # inference helpers and SymptomLookup can use it unchanged.
+    def __init__(self, path, num_threads=None):
+        self.path = path
+        self._interpreter = _interpreter_class()(model_path=path, num_threads=num_threads)
+        self._interpreter.allocate_tensors()
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        self._lock = threading.Lock()
+        self.input_shape = (None,) + tuple(int(d) for d in self._input["shape"][1:])
+
+    def _quantize(self, x):
+        scale, zero_point = self._input["quantization"]
+        if self._input["dtype"] == np.float32 or not scale:
+            return x.astype(self._input["dtype"], copy=False)
+        info = np.iinfo(self._input["dtype"])
+        return np.clip(np.round(x / scale + zero_point), info.min, info.max).astype(self._input["dtype"])
+
+    def _dequantize(self, y):
+        scale, zero_point = self._output["quantization"]
+        if self._output["dtype"] == np.float32 or not scale:
+            return y.astype(np.float32)
+        return (y.astype(np.float32) - zero_point) * scale
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x)
+        with self._lock:
+            if len(x) != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input["index"], [len(x)] + list(x.shape[1:]))
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(x)
+            self._interpreter.set_tensor(self._input["index"], self._quantize(x))
+            self._interpreter.invoke()
+            return self._dequantize(self._interpreter.get_tensor(self._output["index"]))
+
+    def __call__(self, x, training=False):
+        return self.predict(x)
@@ -0,0 +1,74 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# ---------------- LOGGING ----------------
+# One JSON object per prediction on stderr, e.g.
+# {"trace": "hybrid", "total_ms": 41.2, "stages": {"decode": 3.1, ...}}
+logger = logging.getLogger("mastitis.trace")
+if not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# The pages used to sleep inside their spinners; keep that only on request.
+DEMO_DELAY = os.environ.get("MASTITIS_DEMO_DELAY", "0") == "1"
+
+
+def demo_delay(seconds):
+    if DEMO_DELAY:
+        time.sleep(seconds)
+
+
+# ---------------- TRACE ----------------
+class Trace:
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def total(self):
+        return sum(self.stages.values())
+
+    def as_dict(self):
+        return {
+            "trace": self.name,
+            "total_ms": round(self.total() * 1000.0, 3),
+            "stages": {k: round(v * 1000.0, 3) for k, v in self.stages.items()},
+        }
+
+    def log(self, **fields):
+        record = self.as_dict()
+        record.update(fields)
+        logger.info(json.dumps(record))
+
+
+def render_trace(trace):
+    import streamlit as st
+
+    total = trace.total()
+    with st.expander(f"⏱ Timing breakdown ({total * 1000:.1f} ms)"):
+        st.table([
+            {
+                "Stage": stage,
+                "Time (ms)": round(seconds * 1000.0, 2),
+                "Share (%)": round(100.0 * seconds / total, 1) if total else 0.0,
+            }
+            for stage, seconds in trace.stages.items()
+        ])
@@ -0,0 +1,276 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from model_defs import IMG_SIZE
+
+# ---------------- CONFIG ----------------
+# Same settings as the CNN cells in MainProject.ipynb.
+BATCH_SIZE = 8
+EPOCHS = 20
+LEARNING_RATE = 1e-4
+VALIDATION_SPLIT = 0.2
+CLASS_WEIGHTS = {
+    0: 4.0,  # Healthy (give more importance)
+    1: 1.0   # Mastitis
+}
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".ppm", ".tif", ".tiff")
+
+# ImageDataGenerator(rotation_range=25, zoom_range=0.2, width_shift_range=0.1,
+# height_shift_range=0.1, horizontal_flip=True), fill_mode defaults to nearest.
+ROTATION_DEGREES = 25
+ZOOM = 0.2
+SHIFT = 0.1
+
+
+# ---------------- SPLIT ----------------
+def list_split(data_dir, validation_split=VALIDATION_SPLIT):
+    # Same files in the same subsets as flow_from_directory(subset=...):
+    # classes are the sorted sub-directories, files are walked in sorted
+    # order, and the first `validation_split` of each class is validation.
+    classes = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    train, val = ([], []), ([], [])
+    for label, name in enumerate(classes):
+        files = []
+        for root, _, names in sorted(os.walk(os.path.join(data_dir, name)), key=lambda w: w[0]):
+            files.extend(os.path.join(root, f) for f in sorted(names) if f.lower().endswith(IMAGE_EXTENSIONS))
+        split = int(validation_split * len(files))
+        val[0].extend(files[:split])
+        val[1].extend([label] * split)
+        train[0].extend(files[split:])
+        train[1].extend([label] * (len(files) - split))
+    return classes, train, val
+
+
+def split_indices(labels, validation_split=VALIDATION_SPLIT):
+    # The same rule over a ShardedDataset (rows in sorted path order).
+    labels = np.asarray(labels)
+    train, val = [], []
+    for label in np.unique(labels):
+        rows = np.nonzero(labels == label)[0]
+        split = int(validation_split * len(rows))
+        val.extend(rows[:split])
+        train.extend(rows[split:])
+    return np.array(train, dtype=np.int64), np.array(val, dtype=np.int64)
+
+
+# ---------------- tf.data PIPELINE ----------------
+def _augmenter(seed):
+    import tensorflow as tf
+
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomRotation(ROTATION_DEGREES / 360.0, fill_mode="nearest", seed=seed),
+        tf.keras.layers.RandomZoom((-ZOOM, ZOOM), (-ZOOM, ZOOM), fill_mode="nearest", seed=seed),
+        tf.keras.layers.RandomTranslation(SHIFT, SHIFT, fill_mode="nearest", seed=seed),
+        tf.keras.layers.RandomFlip("horizontal", seed=seed),
+    ])
+
+
+def make_dataset(paths, labels, img_size=IMG_SIZE, batch_size=BATCH_SIZE, training=False,
+                 cache="memory", seed=0):
+    # Decode + resize runs in parallel once; the uint8 result is cached (in
+    # memory, or in a file when `cache` is a path) so later epochs skip the
+    # JPEG work. Augmentation runs per batch on the graph, then 1/255.
+    import tensorflow as tf
+
+    def decode(path, label):
+        img = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        # load_img in flow_from_directory resizes with nearest neighbour;
+        # dataset_shards.RESAMPLE matches it.
+        img = tf.image.resize(img, (img_size, img_size), method="nearest")
+        return tf.cast(img, tf.uint8), label
+
+    ds = tf.data.Dataset.from_tensor_slices((paths, np.asarray(labels, dtype=np.float32)))
+    ds = ds.map(decode, num_parallel_calls=tf.data.AUTOTUNE)
+    if cache:
+        ds = ds.cache("" if cache == "memory" else cache)
+    if training:
+        ds = ds.shuffle(len(paths), seed=seed, reshuffle_each_iteration=True)
+    return _augment_and_prefetch(ds.batch(batch_size), training, seed)
+
+
+def make_shard_dataset(data, indices, batch_size=BATCH_SIZE, training=False, seed=0):
+    # Same batches from a dataset_shards.ShardedDataset: only row indices go
+    # through tf.data, and each batch is gathered from the mmap in one copy,
+    # with no JPEG decode and no in-process cache.
+    import tensorflow as tf
+
+    size = data.img_size
+    labels = tf.constant(data.labels.astype(np.float32))
+    ds = tf.data.Dataset.from_tensor_slices(np.asarray(indices, dtype=np.int64))
+    if training:
+        ds = ds.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+
+    def gather(idx):
+        images = tf.numpy_function(data.take, [idx], tf.uint8)
+        images.set_shape((None, size, size, 3))
+        return images, tf.gather(labels, idx)
+
+    ds = ds.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+    return _augment_and_prefetch(ds, training, seed)
+
+
+def _augment_and_prefetch(ds, training, seed):
+    import tensorflow as tf
+
+    scale = tf.constant(1.0 / 255.0, tf.float32)
+    if training:
+        augment = _augmenter(seed)
+        ds = ds.map(lambda x, y: (augment(tf.cast(x, tf.float32) * scale, training=True), y),
+                    num_parallel_calls=tf.data.AUTOTUNE)
+    else:
+        ds = ds.map(lambda x, y: (tf.cast(x, tf.float32) * scale, y), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def make_legacy_generators(data_dir, img_size=IMG_SIZE, batch_size=BATCH_SIZE):
+    # The notebook's ImageDataGenerator pipeline, kept for comparison runs.
+    from tensorflow.keras.preprocessing.image import ImageDataGenerator
+
+    datagen = ImageDataGenerator(
+        rescale=1./255,
+        rotation_range=ROTATION_DEGREES,
+        zoom_range=ZOOM,
+        width_shift_range=SHIFT,
+        height_shift_range=SHIFT,
+        horizontal_flip=True,
+        validation_split=VALIDATION_SPLIT
+    )
+    common = dict(target_size=(img_size, img_size), batch_size=batch_size, class_mode='binary')
+    train = datagen.flow_from_directory(data_dir, subset='training', **common)
+    val = datagen.flow_from_directory(data_dir, subset='validation', shuffle=False, **common)
+    return train, val
+
+
+# ---------------- TIMING ----------------
+def epoch_timer(n_images):
+    import tensorflow as tf
+
+    class EpochTimer(tf.keras.callbacks.Callback):
+        def __init__(self):
+            super().__init__()
+            self.seconds = []
+
+        def on_epoch_begin(self, epoch, logs=None):
+            self._start = time.perf_counter()
+
+        def on_epoch_end(self, epoch, logs=None):
+            elapsed = time.perf_counter() - self._start
+            self.seconds.append(elapsed)
+            print(f"epoch {epoch + 1}: {elapsed:.2f} s, {n_images / elapsed:.1f} img/s", file=sys.stderr)
+
+    return EpochTimer()
+
+
+def summarize(name, seconds, n_images):
+    # The first epoch includes decoding (and graph tracing); later epochs
+    # show the steady state with the cache warm.
+    steady = seconds[1:] or seconds
+    return {
+        "pipeline": name,
+        "epochs": len(seconds),
+        "first_epoch_s": seconds[0],
+        "steady_epoch_s": float(np.median(steady)),
+        "images_per_sec": n_images / float(np.median(steady)),
+    }
+
+
+# ---------------- EVALUATION ----------------
+def classification_report(y_true, y_pred, class_names):
+    y_true = np.asarray(y_true, dtype=int)
+    y_pred = np.asarray(y_pred, dtype=int)
+    lines = [f"{'':>10} {'precision':>9} {'recall':>7} {'f1':>6} {'support':>8}"]
+    for label, name in enumerate(class_names):
+        tp = int(np.sum((y_pred == label) & (y_true == label)))
+        predicted = int(np.sum(y_pred == label))
+        support = int(np.sum(y_true == label))
+        precision = tp / predicted if predicted else 0.0
+        recall = tp / support if support else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        lines.append(f"{name:>10} {precision:9.2f} {recall:7.2f} {f1:6.2f} {support:8d}")
+    lines.append(f"{'accuracy':>10} {np.mean(y_true == y_pred):24.2f} {len(y_true):8d}")
+    return "\n".join(lines)
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the udder-image CNN with a tf.data pipeline.")
+    parser.add_argument("data_dir", help="Dataset root with one sub-directory per class (Healthy, Mastitis), "
+                                         "or a dataset_shards.py directory")
+    parser.add_argument("-o", "--output", default="final_cnn_model1.h5", help="Where to save the trained model")
+    parser.add_argument("--epochs", type=int, default=EPOCHS)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--cache", default="memory",
+                        help="'memory', a file path for an on-disk cache, or '' to disable caching")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare-legacy", type=int, default=0, metavar="EPOCHS",
+                        help="Also time this many epochs of the notebook's ImageDataGenerator pipeline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    import tensorflow as tf
+    from model_defs import build_cnn_model
+
+    tf.keras.utils.set_random_seed(args.seed)
+    if os.path.exists(os.path.join(args.data_dir, "manifest.json")):
+        from dataset_shards import ShardedDataset
+
+        if args.compare_legacy:
+            raise SystemExit("--compare-legacy needs the image directory, not shards")
+        data = ShardedDataset(args.data_dir)
+        classes = data.classes
+        train_rows, val_rows = split_indices(data.labels)
+        n_train, val_labels = len(train_rows), data.labels[val_rows]
+        train_ds = make_shard_dataset(data, train_rows, args.batch_size, training=True, seed=args.seed)
+        val_ds = make_shard_dataset(data, val_rows, args.batch_size)
+    else:
+        classes, (train_paths, train_labels), (val_paths, val_labels) = list_split(args.data_dir)
+        n_train = len(train_paths)
+        train_ds = make_dataset(train_paths, train_labels, batch_size=args.batch_size, training=True,
+                                cache=args.cache, seed=args.seed)
+        val_cache = args.cache + ".val" if args.cache not in ("", "memory") else args.cache
+        val_ds = make_dataset(val_paths, val_labels, batch_size=args.batch_size, cache=val_cache)
+    print(f"Classes: {dict(enumerate(classes))}; {n_train} training, {len(val_labels)} validation images",
+          file=sys.stderr)
+
+    def compiled_model():
+        model = build_cnn_model()
+        model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=LEARNING_RATE),
+                      loss='binary_crossentropy', metrics=['accuracy'])
+        return model
+
+    reports = []
+    if args.compare_legacy:
+        legacy_train, legacy_val = make_legacy_generators(args.data_dir, batch_size=args.batch_size)
+        timer = epoch_timer(legacy_train.samples)
+        compiled_model().fit(legacy_train, validation_data=legacy_val, epochs=args.compare_legacy,
+                             class_weight=CLASS_WEIGHTS, callbacks=[timer], verbose=0)
+        reports.append(summarize("ImageDataGenerator", timer.seconds, legacy_train.samples))
+
+    model = compiled_model()
+    timer = epoch_timer(n_train)
+    model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, class_weight=CLASS_WEIGHTS,
+              callbacks=[timer], verbose=2)
+    reports.append(summarize("tf.data", timer.seconds, n_train))
+
+    print(f"\n{'pipeline':<20} {'epochs':>6} {'first s':>8} {'epoch s':>8} {'img/s':>8}")
+    for r in reports:
+        print(f"{r['pipeline']:<20} {r['epochs']:6d} {r['first_epoch_s']:8.2f} "
+              f"{r['steady_epoch_s']:8.2f} {r['images_per_sec']:8.1f}")
+
+    y_prob = model.predict(val_ds, verbose=0).reshape(-1)
+    print("\nClassification Report:")
+    print(classification_report(val_labels, (y_prob > 0.5).astype(int), classes))
+
+    model.save(args.output)
+    print(f"Model saved to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import os
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from prediction_cache import image_digest
+
+# ---------------- CONFIG ----------------
+SESSION_KEY = "_decoded_uploads"
+MAX_SESSION_BYTES = int(float(os.environ.get("MASTITIS_SESSION_UPLOAD_MB", "64")) * 1024 * 1024)
+MAX_SESSION_UPLOADS = int(os.environ.get("MASTITIS_SESSION_UPLOADS", "16"))
+THUMBNAIL_SIZE = (768, 768)
+# Uploads are decoded at the smallest power-of-two scale that keeps this
+# shorter side: enough for the 768 px thumbnail of a 4:3 photo and far above
+# the model input, so a 12 MP photo is decoded at 1/4 scale.
+DECODE_MIN_SIDE = 512
+
+
+# ---------------- DECODED UPLOAD ----------------
+class DecodedUpload:
+    # Everything a page needs from an upload after the first rerun: the
+    # model-ready tensor, a display-sized thumbnail and the content digest
+    # used for prediction cache keys, plus the quality-gate verdict. The
+    # full-size image is not kept.
+    __slots__ = ("name", "digest", "tensor", "thumbnail", "quality", "nbytes")
+
+    def __init__(self, name, digest, tensor, thumbnail, quality=None):
+        self.name = name
+        self.digest = digest
+        self.tensor = tensor
+        self.thumbnail = thumbnail
+        self.quality = quality
+        self.nbytes = tensor.nbytes + len(thumbnail.getbands()) * thumbnail.width * thumbnail.height
+
+
+def decode_upload(uploaded, model_input_shape, trace=None):
+    # Pillow is only imported once something has been uploaded.
+    from PIL import ImageOps
+    from preprocessing import decode_image, preprocess_image
+    from quality_gate import check_image
+
+    def stage(name):
+        return trace.stage(name) if trace is not None else nullcontext()
+
+    with stage("hash"):
+        data = uploaded.getvalue()
+        digest = image_digest(data)
+    with stage("decode"):
+        # Scaled decode plus EXIF orientation; raises ImageTooLarge past the
+        # pixel or memory cap.
+        img, original_size = decode_image(uploaded, max(DECODE_MIN_SIDE, *model_input_shape[1:3]))
+    with stage("resize_normalize"):
+        tensor = preprocess_image(img, model_input_shape)
+    with stage("quality_gate"):
+        # Runs on the small model-ready tensor, so it costs well under a
+        # millisecond and rejected photos never reach the CNN. Counted by
+        # the page when a prediction is asked for, not here.
+        quality = check_image(tensor, original_size, count=False)
+    with stage("thumbnail"):
+        if img.width <= THUMBNAIL_SIZE[0] and img.height <= THUMBNAIL_SIZE[1]:
+            thumbnail = img
+        else:
+            thumbnail = ImageOps.contain(img, THUMBNAIL_SIZE)
+    return DecodedUpload(uploaded.name, digest, tensor, thumbnail, quality)
+
+
+# ---------------- SESSION STORE ----------------
+def get_decoded_upload(session_state, uploaded, model_input_shape, trace=None):
+    # Decode, orient and preprocess each distinct upload once per session;
+    # later reruns (every checkbox toggle) reuse the stored result. The store
+    # is an LRU bounded by MAX_SESSION_BYTES and MAX_SESSION_UPLOADS.
+    if SESSION_KEY not in session_state:
+        session_state[SESSION_KEY] = OrderedDict()
+    store = session_state[SESSION_KEY]
+
+    key = (getattr(uploaded, "file_id", None) or uploaded.name, uploaded.size, tuple(model_input_shape))
+    entry = store.get(key)
+    if entry is not None:
+        store.move_to_end(key)
+        return entry
+
+    entry = decode_upload(uploaded, model_input_shape, trace)
+    store[key] = entry
+    total = sum(e.nbytes for e in store.values())
+    while len(store) > 1 and (total > MAX_SESSION_BYTES or len(store) > MAX_SESSION_UPLOADS):
+        _, evicted = store.popitem(last=False)
+        total -= evicted.nbytes
+    return entry
+
@@ -0,0 +1,193 @@
+import argparse
+import csv
+import os
+import sys
+import time
+
+import numpy as np
+
+from inference import predict_batch, BATCH_CHUNK_SIZE
+
+# ---------------- CONFIG ----------------
+SAMPLE_FPS = float(os.environ.get("MASTITIS_VIDEO_FPS", "1.0"))
+# Frames whose 64-bit difference hash is within this many bits of the last
+# kept frame count as near-duplicates (a cow standing still).
+HASH_DISTANCE = int(os.environ.get("MASTITIS_VIDEO_HASH_DISTANCE", "6"))
+TOP_K = 5
+AGGREGATES = ("max", "mean", "top_k")
+VIDEO_TYPES = ["mp4", "avi", "mov", "mkv"]
+
+
+def _cv2():
+    # OpenCV is only needed for video; everything else runs without it.
+    try:
+        import cv2
+    except ImportError:
+        raise RuntimeError("Video ingestion needs OpenCV: pip install opencv-python-headless") from None
+    return cv2
+
+
+# ---------------- FRAMES ----------------
+def video_duration(path):
+    # Seconds according to the container header; None when it does not say.
+    cv2 = _cv2()
+    cap = cv2.VideoCapture(path)
+    try:
+        fps, frames = cap.get(cv2.CAP_PROP_FPS), cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    finally:
+        cap.release()
+    return frames / fps if fps > 0 and frames > 0 else None
+
+
+def iter_video_frames(path, sample_fps=SAMPLE_FPS):
+    # Streams (frame index, seconds, RGB array) for one frame every
+    # 1 / sample_fps seconds. Frames in between are grab()bed, which skips
+    # the colour conversion and copy, so only one frame is held at a time.
+    cv2 = _cv2()
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video {path}")
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        stride = max(1, int(round(fps / sample_fps))) if sample_fps > 0 else 1
+        index = 0
+        while True:
+            if index % stride == 0:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                yield index, index / fps, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            elif not cap.grab():
+                break
+            index += 1
+    finally:
+        cap.release()
+
+
+def dhash(frame):
+    # 64-bit difference hash: 9x8 grayscale thumbnail, one bit per
+    # left-right brightness step. Robust to compression noise, cheap to
+    # compute next to decoding.
+    cv2 = _cv2()
+    small = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def iter_distinct_frames(frames, hash_distance=HASH_DISTANCE, stats=None):
+    last = None
+    for index, seconds, frame in frames:
+        h = dhash(frame)
+        if stats is not None:
+            stats["sampled"] += 1
+        if last is not None and (h ^ last).bit_count() <= hash_distance:
+            if stats is not None:
+                stats["duplicates"] += 1
+            continue
+        last = h
+        yield index, seconds, frame
+
+
+# ---------------- SCORING ----------------
+def aggregate_scores(probs, top_k=TOP_K):
+    probs = np.asarray(probs, dtype=np.float32)
+    if len(probs) == 0:
+        return {"max": None, "mean": None, "top_k": None}
+    k = min(top_k, len(probs))
+    return {
+        "max": float(probs.max()),
+        "mean": float(probs.mean()),
+        "top_k": float(np.sort(probs)[-k:].mean()),
+    }
+
+
+def score_video(path, model, model_input_shape, sample_fps=SAMPLE_FPS, hash_distance=HASH_DISTANCE,
+                batch_size=BATCH_CHUNK_SIZE, top_k=TOP_K, progress=None):
+    # Frames are preprocessed straight into one reusable batch and scored
+    # whenever it fills, so memory is one batch of tensors plus a float per
+    # kept frame, whatever the clip length. `progress(seconds)` is called
+    # after each batch.
+    from PIL import Image
+    from preprocessing import BatchBuffer, preprocess_image
+
+    stats = {"sampled": 0, "duplicates": 0}
+    buffer = BatchBuffer(model_input_shape, batch_size)
+    batch = buffer.reserve(batch_size)
+    frames, probs = [], []
+    pending = 0
+    start = time.perf_counter()
+
+    def flush():
+        probs.extend(predict_batch(model, batch[:pending], batch_size).tolist())
+        if progress is not None:
+            progress(frames[-1][1])
+
+    for index, seconds, frame in iter_distinct_frames(iter_video_frames(path, sample_fps), hash_distance, stats):
+        preprocess_image(Image.fromarray(frame), model_input_shape, out=batch[pending:pending + 1])
+        frames.append((index, seconds))
+        pending += 1
+        if pending == batch_size:
+            flush()
+            pending = 0
+    if pending:
+        flush()
+
+    return {
+        "path": path,
+        "frames_sampled": stats["sampled"],
+        "duplicates_skipped": stats["duplicates"],
+        "frames_scored": len(probs),
+        "seconds": time.perf_counter() - start,
+        "scores": aggregate_scores(probs, top_k),
+        "frames": [(i, t, p) for (i, t), p in zip(frames, probs)],
+    }
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score milking-parlour video clips with the udder-image CNN.")
+    parser.add_argument("videos", nargs="+", help="Video files")
+    parser.add_argument("--fps", type=float, default=SAMPLE_FPS, help="Frames sampled per second of video")
+    parser.add_argument("--hash-distance", type=int, default=HASH_DISTANCE,
+                        help="Max dHash bit difference treated as a duplicate (-1 keeps every frame)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_CHUNK_SIZE)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--aggregate", choices=AGGREGATES, default="top_k", help="Clip score used for the result")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--frames-csv", default=None, help="Also write per-frame probabilities here")
+    parser.add_argument("--backend", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from model_registry import get_cnn_model, cnn_input_shape
+
+    model, shape = get_cnn_model(args.backend), cnn_input_shape(args.backend)
+    writer = None
+    if args.frames_csv:
+        frames_file = open(args.frames_csv, "w", newline="")
+        writer = csv.writer(frames_file)
+        writer.writerow(["video", "frame", "seconds", "mastitis_probability"])
+
+    print(f"{'video':<32} {'sampled':>7} {'dupes':>6} {'scored':>6} {'max':>6} {'mean':>6} {'top_k':>6}  result")
+    for path in args.videos:
+        clip = score_video(path, model, shape, args.fps, args.hash_distance, args.batch_size, args.top_k)
+        s = clip["scores"]
+        if s[args.aggregate] is None:
+            result = "No frames"
+        else:
+            result = "Mastitis Detected" if s[args.aggregate] > args.threshold else "Healthy Udder"
+        fmt = lambda v: "-" if v is None else f"{v:.3f}"
+        print(f"{os.path.basename(path)[:32]:<32} {clip['frames_sampled']:7d} {clip['duplicates_skipped']:6d} "
+              f"{clip['frames_scored']:6d} {fmt(s['max']):>6} {fmt(s['mean']):>6} {fmt(s['top_k']):>6}  {result}")
+        print(f"  {clip['seconds']:.1f} s", file=sys.stderr)
+        if writer is not None:
+            writer.writerows([path, i, f"{t:.3f}", f"{p:.6f}"] for i, t, p in clip["frames"])
+    if writer is not None:
+        frames_file.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,414 @@
+import argparse
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from inference import predict_batch, BATCH_CHUNK_SIZE
+
+# ---------------- CONFIG ----------------
+# Seconds a worker may take to import TensorFlow and load both models.
+START_TIMEOUT = float(os.environ.get("MASTITIS_WORKER_START_TIMEOUT", "300"))
+# TF intra-op threads per worker; 0 splits the CPUs evenly.
+WORKER_THREADS = int(os.environ.get("MASTITIS_WORKER_THREADS", "0"))
+# Seconds between a worker's checks that its parent is still running, and
+# between the pool's checks for workers that died.
+POLL_SECONDS = 1.0
+_READY = -1
+_FLOAT = np.dtype(np.float32).itemsize
+
+
+def default_threads(workers):
+    # Split the cores between workers so N processes do not each start a
+    # full-size TF thread pool and oversubscribe the machine.
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+
+# ---------------- WORKER PROCESS ----------------
+def _worker_main(worker_id, threads, backend, chunk_size, requests, results):
+    # Runs in a spawned process. The thread budget is set in the environment
+    # before serving.py is imported, and MASTITIS_WORKERS is cleared so the
+    # worker's own registry loads the models in-process.
+    os.environ["MASTITIS_INTRA_OP_THREADS"] = str(threads)
+    os.environ["MASTITIS_INTER_OP_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MASTITIS_WORKERS"] = "0"
+    try:
+        import model_registry as registry
+
+        start = time.perf_counter()
+        model = registry.get_cnn_model(backend)
+        lookup = registry.get_symptom_lookup(backend)
+        paths = (registry.CNN_MODEL_PATH, registry.SYMPTOM_MODEL_PATH)
+        ready = {
+            "pid": os.getpid(),
+            "load_seconds": time.perf_counter() - start,
+            "input_shape": tuple(model.input_shape),
+            "symptom_table": lookup.table,
+            "versions": {p: registry.model_version(p, backend) for p in paths},
+            "model_info": {p: registry.model_info(p, backend) for p in paths},
+        }
+    except Exception as e:
+        results.put((worker_id, _READY, None, f"{type(e).__name__}: {e}"))
+        return
+    results.put((worker_id, _READY, ready, None))
+
+    item_shape = ready["input_shape"][1:]
+    parent = mp.parent_process()
+    while True:
+        try:
+            message = requests.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            # A parent killed without closing the pool leaves no sentinel;
+            # exit instead of lingering as an orphan holding the models.
+            if parent is not None and not parent.is_alive():
+                return
+            continue
+        if message is None:
+            return
+        request_id, shm_name, n = message
+        try:
+            shm = SharedMemory(name=shm_name)
+            try:
+                # Inputs and outputs live in the caller's segment; nothing
+                # but the segment name crosses the pipe.
+                x = np.ndarray((n,) + item_shape, dtype=np.float32, buffer=shm.buf)
+                out = np.ndarray((n,), dtype=np.float32, buffer=shm.buf, offset=x.nbytes)
+                out[:] = predict_batch(model, x, chunk_size)
+                del x, out
+            finally:
+                shm.close()
+            results.put((worker_id, request_id, None, None))
+        except Exception as e:
+            results.put((worker_id, request_id, None, f"{type(e).__name__}: {e}"))
+
+
+# ---------------- POOL ----------------
+class _Worker:
+    __slots__ = ("id", "process", "requests", "pending", "load", "alive", "requests_done", "images_done")
+
+    def __init__(self, worker_id, process, requests):
+        self.id = worker_id
+        self.process = process
+        self.requests = requests
+        self.pending = {}
+        self.load = 0
+        self.alive = True
+        self.requests_done = 0
+        self.images_done = 0
+
+
+class WorkerPool:
+    # N spawned processes, each holding its own copy of the CNN and symptom
+    # model and its own TF thread pool. Each request goes to the live worker
+    # with the fewest images in flight; the batch is written once into a
+    # SharedMemory segment that the worker reads and writes its
+    # probabilities back into. Quacks like a registry model (input_shape,
+    # predict), so pages and the server use it unchanged.
+    splits_batches = True
+
+    def __init__(self, workers, threads_per_worker=None, backend=None, chunk_size=BATCH_CHUNK_SIZE,
+                 start_timeout=START_TIMEOUT):
+        if workers < 1:
+            raise ValueError("A worker pool needs at least one worker")
+        ctx = mp.get_context("spawn")
+        self.threads_per_worker = threads_per_worker or WORKER_THREADS or default_threads(workers)
+        self.chunk_size = chunk_size
+        self._results = ctx.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._latencies = deque(maxlen=2048)
+        self._closed = False
+        self._workers = []
+        for i in range(workers):
+            requests = ctx.Queue()
+            process = ctx.Process(target=_worker_main, name=f"inference-worker-{i}", daemon=True,
+                                  args=(i, self.threads_per_worker, backend, chunk_size, requests, self._results))
+            process.start()
+            self._workers.append(_Worker(i, process, requests))
+
+        start = time.perf_counter()
+        self.worker_info = self._wait_ready(start_timeout)
+        self.start_seconds = time.perf_counter() - start
+        first = self.worker_info[0]
+        self.input_shape = first["input_shape"]
+        self.versions = first["versions"]
+        self.model_info = first["model_info"]
+
+        from symptom_lookup import SymptomLookup
+        self.symptom_lookup = SymptomLookup(first["symptom_table"])
+
+        self._collector = threading.Thread(target=self._collect, name="worker-pool-results", daemon=True)
+        self._collector.start()
+
+    @property
+    def workers(self):
+        return len(self._workers)
+
+    def _wait_ready(self, timeout):
+        info = {}
+        deadline = time.monotonic() + timeout
+        while len(info) < len(self._workers):
+            try:
+                worker_id, _, payload, error = self._results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                dead = [w.id for w in self._workers if w.id not in info and not w.process.is_alive()]
+                if dead or time.monotonic() > deadline:
+                    self.close()
+                    reason = f"worker(s) {dead} exited" if dead else f"not ready after {timeout:.0f} s"
+                    raise RuntimeError(f"Inference worker pool failed to start: {reason}")
+                continue
+            if error is not None:
+                self.close()
+                raise RuntimeError(f"Inference worker {worker_id} failed to load models: {error}")
+            info[worker_id] = payload
+        return [info[i] for i in range(len(self._workers))]
+
+    # ---- requests ----
+    def _least_loaded(self):
+        live = [w for w in self._workers if w.alive]
+        if not live:
+            raise RuntimeError("No inference workers are running")
+        # Ties go to the worker that has served least, which spreads a cold
+        # start evenly instead of piling onto worker 0.
+        return min(live, key=lambda w: (w.load, w.requests_done))
+
+    def submit(self, batch):
+        # Returns a Future of the (N,) probabilities.
+        batch = np.ascontiguousarray(batch, dtype=np.float32)
+        n = len(batch)
+        future = Future()
+        if n == 0:
+            future.set_result(np.empty(0, dtype=np.float32))
+            return future
+        if self._closed:
+            raise RuntimeError("Worker pool is closed")
+
+        shm = SharedMemory(create=True, size=batch.nbytes + n * _FLOAT)
+        view = np.ndarray(batch.shape, dtype=np.float32, buffer=shm.buf)
+        view[:] = batch
+        del view
+        with self._lock:
+            try:
+                worker = self._least_loaded()
+            except RuntimeError:
+                shm.close()
+                shm.unlink()
+                raise
+            request_id = next(self._ids)
+            worker.pending[request_id] = (future, shm, n, batch.nbytes, time.perf_counter())
+            worker.load += n
+            worker.requests.put((request_id, shm.name, n))
+        return future
+
+    def predict_images(self, batch):
+        # Batches larger than chunk_size are split so the pieces run on
+        # different workers at the same time.
+        batch = np.asarray(batch, dtype=np.float32)
+        if len(batch) <= self.chunk_size or len(self._workers) == 1:
+            return self.submit(batch).result()
+        futures = [self.submit(batch[i:i + self.chunk_size]) for i in range(0, len(batch), self.chunk_size)]
+        return np.concatenate([f.result() for f in futures])
+
+    def predict(self, x, verbose=0):
+        return self.predict_images(x).reshape(-1, 1)
+
+    # ---- results ----
+    def _release(self, worker, request_id):
+        entry = worker.pending.pop(request_id)
+        worker.load -= entry[2]
+        return entry
+
+    def _collect(self):
+        last_reap = time.monotonic()
+        while True:
+            # Reap on a clock, not only when the queue is idle: results from
+            # busy workers would otherwise hide a dead one indefinitely.
+            if time.monotonic() - last_reap > POLL_SECONDS:
+                self._reap()
+                last_reap = time.monotonic()
+            try:
+                worker_id, request_id, _, error = self._results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+            if worker_id is None:
+                return
+            with self._lock:
+                worker = self._workers[worker_id]
+                if request_id not in worker.pending:
+                    continue
+                future, shm, n, offset, started = self._release(worker, request_id)
+                worker.requests_done += 1
+                worker.images_done += n
+                self._latencies.append(time.perf_counter() - started)
+            if error is None:
+                view = np.ndarray((n,), dtype=np.float32, buffer=shm.buf, offset=offset)
+                result = view.copy()
+                del view
+                future.set_result(result)
+            else:
+                future.set_exception(RuntimeError(f"Inference worker {worker_id}: {error}"))
+            shm.close()
+            shm.unlink()
+
+    def _reap(self):
+        # A worker that died (OOM killer, segfault) takes its queued requests
+        # with it; fail them instead of leaving callers waiting forever.
+        failed = []
+        with self._lock:
+            for worker in self._workers:
+                if worker.alive and not worker.process.is_alive():
+                    worker.alive = False
+                    failed += [(worker.id, self._release(worker, r)) for r in list(worker.pending)]
+        for worker_id, (future, shm, *_) in failed:
+            future.set_exception(RuntimeError(f"Inference worker {worker_id} exited"))
+            shm.close()
+            shm.unlink()
+
+    def stats(self):
+        with self._lock:
+            latencies = np.array(self._latencies) * 1000.0
+            workers = [{"pid": info["pid"], "alive": w.alive, "in_flight_images": w.load,
+                        "requests": w.requests_done, "images": w.images_done,
+                        "load_seconds": round(info["load_seconds"], 3)}
+                       for w, info in zip(self._workers, self.worker_info)]
+        pct = lambda a, q: round(float(np.percentile(a, q)), 3) if len(a) else None
+        return {
+            "workers": workers,
+            "threads_per_worker": self.threads_per_worker,
+            "latency_ms_p50": pct(latencies, 50),
+            "latency_ms_p95": pct(latencies, 95),
+        }
+
+    def close(self, timeout=10.0):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        if getattr(self, "_collector", None) is not None:
+            self._results.put((None, None, None, None))
+            self._collector.join(timeout)
+        self._reap()
+
+
+# ---------------- SCALING BENCHMARK ----------------
+def _drive(predict, batch, requests, clients):
+    # `clients` threads each send batches back to back until `requests`
+    # batches are done; returns (seconds, per-request latencies).
+    counter = itertools.count()
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        while next(counter) < requests:
+            start = time.perf_counter()
+            predict(batch)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, np.array(latencies) * 1000.0
+
+
+def _bench_row(label, threads, start_seconds, seconds, latencies, images, base=None):
+    rate = images / seconds
+    speedup = "-" if base is None else f"{rate / base:.2f}x"
+    print(f"{label:<12} {threads:>8} {start_seconds:8.1f} {rate:9.1f} {speedup:>8} "
+          f"{np.percentile(latencies, 50):8.1f} {np.percentile(latencies, 95):8.1f}")
+    return rate
+
+
+def worker_counts(max_workers):
+    counts = [1]
+    while counts[-1] * 2 < max_workers:
+        counts.append(counts[-1] * 2)
+    if max_workers > 1:
+        counts.append(max_workers)
+    return counts
+
+
+def run_benchmark(counts, batch_size=8, requests=64, clients=None, threads_per_worker=None, backend=None,
+                  in_process=True):
+    # Throughput and latency of the same closed-loop load (clients sending
+    # batch_size images back to back) on the in-process model and on pools
+    # of each size.
+    from model_registry import cnn_input_shape
+
+    shape = cnn_input_shape(backend) if in_process else None
+    print(f"{requests} requests of {batch_size} image(s), {os.cpu_count()} CPU(s)\n")
+    print(f"{'workers':<12} {'threads':>8} {'start s':>8} {'img/s':>9} {'speedup':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    base = None
+    if in_process:
+        from model_registry import get_cnn_model
+
+        model = get_cnn_model(backend)
+        batch = np.random.default_rng(0).random((batch_size,) + tuple(shape[1:]), dtype=np.float32)
+        n_clients = clients or 2
+        model.predict(batch)
+        seconds, lat = _drive(lambda b: model.predict(b), batch, requests, n_clients)
+        _bench_row("in-process", os.environ.get("MASTITIS_INTRA_OP_THREADS", "auto"), 0.0, seconds, lat,
+                   requests * batch_size)
+
+    for n in counts:
+        pool = WorkerPool(n, threads_per_worker, backend)
+        try:
+            batch = np.random.default_rng(0).random((batch_size,) + tuple(pool.input_shape[1:]), dtype=np.float32)
+            # One warm-up request per worker.
+            for f in [pool.submit(batch) for _ in range(n)]:
+                f.result()
+            seconds, lat = _drive(pool.predict_images, batch, requests, clients or 2 * n)
+            rate = _bench_row(str(n), pool.threads_per_worker, pool.start_seconds, seconds, lat,
+                              requests * batch_size, base)
+            base = base or rate
+        finally:
+            pool.close()
+
+
+# ---------------- MAIN ----------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Scaling benchmark for the multi-process inference worker pool (1 to N workers).")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1,
+                        help="Largest pool; sizes tried are 1, 2, 4, ... and this")
+    parser.add_argument("--workers", default=None, help="Explicit comma-separated pool sizes instead")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="TF intra-op threads per worker (default: CPUs / workers)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Images per request")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=None,
+                        help="Concurrent client threads (default: 2 per worker)")
+    parser.add_argument("--no-in-process", action="store_true", help="Skip the single-process baseline row")
+    parser.add_argument("--backend", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts = [int(n) for n in args.workers.split(",")] if args.workers else worker_counts(args.max_workers)
+    run_benchmark(counts, args.batch_size, args.requests, args.clients, args.threads_per_worker, args.backend,
+                  not args.no_in_process)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())